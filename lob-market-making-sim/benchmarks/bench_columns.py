@@ -0,0 +1,104 @@
+'''
+bench_columns.py
+Compares load + replay wall time and peak memory of the list-of-OrderEvent
+input path, the columnar EventColumns path, and streaming the file in
+chunks of EventColumns.
+
+Each mode runs in its own subprocess so that peak resident memory is
+measured independently. --tile N writes a temporary copy of the day
+repeated N times to approximate a multi-million-message day.
+
+To run: poetry run python benchmarks/bench_columns.py [--tile N] [message_csv]
+'''
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.csv
+
+from lob_market_making_sim.core.engine import ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.io.loader import (lobster_to_arrow, arrow_to_events,
+                                             arrow_to_columns, iter_lobster_columns)
+from lob_market_making_sim.models.avellaneda import ASParams, AvellanedaStoikov
+
+BASE_DIR = Path(__file__).parent.parent
+DEFAULT_PATH = BASE_DIR / "data" / "AMZN_2012-06-21_34200000_57600000_message_1.csv"
+
+PARAMS = ASParams(gamma=0.1, kappa=1.5, sigma=0.002, qmax=100)
+
+def run_mode(mode: str, path: str) -> dict:
+    '''
+    Loads and replays one day with the given input path.
+    Parameters
+    mode ('events', 'columns', 'stream'): which input path to use
+    path (str): LOBSTER message file
+    Returns
+    dict: number of events, load and replay seconds, peak RSS in MB
+        (streaming interleaves the two, so its load time is zero)
+    '''
+    engine = ReplayEngine(OrderBookL1(), AvellanedaStoikov(PARAMS))
+    warnings.simplefilter("ignore") # unknown oids from pre-open orders
+
+    start = time.perf_counter()
+    if mode == "stream":
+        num_events = 0
+        for cols in iter_lobster_columns(path):
+            engine.run(cols)
+            num_events += len(cols)
+        loaded = start
+    else:
+        table = lobster_to_arrow(path)
+        events = arrow_to_events(table) if mode == "events" else arrow_to_columns(table)
+        del table
+        loaded = time.perf_counter()
+        engine.run(events)
+        num_events = len(events)
+    done = time.perf_counter()
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 / 1024**2 if sys.platform == "darwin" else 1 / 1024
+    return dict(events=num_events, load_s=loaded - start, replay_s=done - loaded,
+                peak_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale)
+
+def tile_file(path: str, tile: int, out_dir: str) -> str:
+    '''
+    Writes the message file repeated tile times, without a header.
+    Returns
+    str: path of the tiled copy
+    '''
+    table = pa.concat_tables([lobster_to_arrow(path)] * tile)
+    out_path = str(Path(out_dir) / f"tiled_{tile}_{Path(path).name}")
+    pa.csv.write_csv(table, out_path, write_options=pa.csv.WriteOptions(include_header=False))
+    return out_path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default=str(DEFAULT_PATH))
+    parser.add_argument("--tile", type=int, default=1)
+    parser.add_argument("--mode", choices=["events", "columns", "stream"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode: # child process
+        print(json.dumps(run_mode(args.mode, args.path)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = tile_file(args.path, args.tile, tmp) if args.tile > 1 else args.path
+        for mode in ("events", "columns", "stream"):
+            out = subprocess.run([sys.executable, __file__, path, "--mode", mode],
+                                 capture_output=True, text=True, check=True)
+            r = json.loads(out.stdout)
+            print(f"{mode:>8}: {r['events']:>10,} events  load {r['load_s']:6.2f}s  "
+                  f"replay {r['replay_s']:6.2f}s  peak RSS {r['peak_mb']:8.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+'''
+bench_env.py
+Measures environment steps per second for K market-making environments:
+stable-baselines3's DummyVecEnv and SubprocVecEnv over single
+LOBMarketMakerEnvs, and the batched LOBMarketMakerVecEnv with and
+without precomputed market features.
+
+The subprocess variant memory-maps binary event files, so it scales with
+cores rather than copying a day of events into every worker.
+
+To run: poetry run python benchmarks/bench_env.py [--n-envs K] [--steps N] [--subproc] [message_csv ...]
+'''
+
+import argparse
+import tempfile
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from lob_market_making_sim.io.binary import EventDataset, load_event_file
+from lob_market_making_sim.models.rl.env import LOBMarketMakerEnv
+from lob_market_making_sim.models.rl.vec_env import LOBMarketMakerVecEnv
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+
+def _make_env(event_path):
+    def _init():
+        warnings.simplefilter("ignore") # also in subprocess workers
+        return LOBMarketMakerEnv(load_event_file(event_path))
+    return _init
+
+def bench_vec(env, steps: int) -> float:
+    '''
+    Steps a vectorized environment with random actions.
+    Parameters
+    env: an SB3 VecEnv or a gymnasium VectorEnv
+    steps (int): number of batched steps
+    Returns
+    float: sub-environment steps per second
+    '''
+    rng = np.random.default_rng(0)
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(steps):
+        actions = rng.integers(0, 49, size=env.num_envs)
+        env.step(actions)
+    return steps * env.num_envs / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--n-envs", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--subproc", action="store_true", help="also time SubprocVecEnv")
+    args = parser.parse_args()
+
+    from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+    paths = [Path(p) for p in args.paths] or sorted(DATA_DIR.glob("*_message_*.csv"))
+    warnings.simplefilter("ignore")
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = EventDataset(tmp)
+        event_paths = [dataset.add_lobster(p) for p in paths]
+        factories = [_make_env(event_paths[i % len(event_paths)]) for i in range(args.n_envs)]
+
+        results = {
+            "DummyVecEnv": bench_vec(DummyVecEnv(factories), args.steps),
+            "LOBMarketMakerVecEnv": bench_vec(LOBMarketMakerVecEnv(event_paths, args.n_envs), args.steps),
+            "+ precomputed features": bench_vec(
+                LOBMarketMakerVecEnv(event_paths, args.n_envs, precompute_features=True), args.steps),
+        }
+        if args.subproc:
+            env = SubprocVecEnv(factories)
+            results["SubprocVecEnv"] = bench_vec(env, args.steps)
+            env.close()
+
+    for name, rate in results.items():
+        print(f"{name:>22}: {rate:>10,.0f} steps/s ({args.n_envs} envs)")
+
+if __name__ == "__main__":
+    main()
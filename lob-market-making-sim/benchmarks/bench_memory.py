@@ -0,0 +1,65 @@
+'''
+bench_memory.py
+Measures the memory the order books hold per live order, with
+tracemalloc, after adding N resting orders spread over a few hundred
+price levels on each side. Also times the adds.
+
+To run: poetry run python benchmarks/bench_memory.py [--orders N]
+'''
+
+import argparse
+import time
+import tracemalloc
+
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.order_book_l3 import OrderBookL3
+from lob_market_making_sim.io.schema import Direction, EventType
+
+TICK = 0.01
+
+def make_adds(n: int, levels: int = 500) -> list[tuple]:
+    '''
+    Builds n ADD events (as apply_values arguments), alternating sides.
+    '''
+    adds = []
+    for oid in range(n):
+        level = (oid // 2) % levels
+        if oid % 2:
+            adds.append((EventType.ADD, oid, 100, round(100 + TICK * (level + 1), 2), Direction.SELL))
+        else:
+            adds.append((EventType.ADD, oid, 100, round(100 - TICK * level, 2), Direction.BUY))
+    return adds
+
+def bench_book(book_cls, adds) -> tuple[float, float]:
+    '''
+    Parameters
+    book_cls (type): the order book class
+    adds (list[tuple]): events from make_adds
+    Returns
+    (float, float): bytes held per live order and adds per second
+    '''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    ob = book_cls()
+    start = time.perf_counter()
+    for args in adds:
+        ob.apply_values(*args)
+    elapsed = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    assert len(ob._orders) == len(adds)
+    return held / len(adds), len(adds) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=200_000)
+    args = parser.parse_args()
+
+    adds = make_adds(args.orders)
+    for book_cls in (OrderBookL1, OrderBookL3):
+        per_order, rate = bench_book(book_cls, adds)
+        print(f"{book_cls.__name__}: {args.orders:,} live orders  {per_order:>7.1f} bytes/order"
+              f"  ({rate:,.0f} adds/sec under tracemalloc)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+'''
+bench_order_book.py
+Measures how many LOBSTER events per second OrderBookL1.apply and
+OrderBookL3.apply can process when replaying full trading days of
+message data.
+
+Only message files are replayed, so the bundled AAPL day (which ships
+with its orderbook file alone) is skipped automatically.
+
+To run: poetry run python benchmarks/bench_order_book.py [message_csv ...]
+'''
+
+import sys
+import time
+import warnings
+from pathlib import Path
+
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.order_book_l3 import OrderBookL3
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_events
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+
+def bench_apply(events, repeats: int = 3, book_cls=OrderBookL1) -> float:
+    '''
+    Replays events through a fresh book several times and keeps the best run.
+    Parameters
+    events (list[OrderEvent]): one day of events
+    repeats (int): number of timed replays
+    book_cls (type): the order book class to replay through
+    Returns
+    float: events per second of the fastest replay
+    '''
+    best = float('inf')
+    for _ in range(repeats):
+        ob = book_cls()
+        start = time.perf_counter()
+        for ev in events:
+            ob.apply(ev)
+        best = min(best, time.perf_counter() - start)
+    return len(events) / best
+
+def main(paths):
+    if not paths:
+        paths = sorted(DATA_DIR.rglob("*_message_*.csv"))
+    for path in paths:
+        events = arrow_to_events(lobster_to_arrow(path))
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # unknown oids from pre-open orders
+            for book_cls in (OrderBookL1, OrderBookL3):
+                rate = bench_apply(events, book_cls=book_cls)
+                print(f"{Path(path).name} {book_cls.__name__}: {len(events):>9,} events"
+                      f"  {rate:>12,.0f} events/sec")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
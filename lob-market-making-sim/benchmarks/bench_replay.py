@@ -0,0 +1,71 @@
+'''
+bench_replay.py
+Measures end-to-end ReplayEngine.run throughput (book update, external
+midprice, Avellaneda-Stoikov quoting and cancel/replace of agent quotes)
+on the bundled LOBSTER message files.
+
+To run: poetry run python benchmarks/bench_replay.py [--limit N] [--skip-unchanged] [--ticks] [--profile] [message_csv ...]
+'''
+
+import argparse
+import time
+import warnings
+from pathlib import Path
+
+from lob_market_making_sim.core.engine import ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.profiler import Profiler
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_events
+from lob_market_making_sim.models.avellaneda import ASParams, AvellanedaStoikov
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+
+PARAMS = ASParams(gamma=0.1, kappa=1.5, sigma=0.002, qmax=100)
+
+def bench_run(events, skip_unchanged: bool = False,
+              profiler: Profiler = None, ticks: bool = False) -> tuple[float, ReplayEngine]:
+    '''
+    Replays events through a fresh engine.
+    Parameters
+    events (list[OrderEvent]): events to replay
+    skip_unchanged (bool): passed on to ReplayEngine
+    profiler (Profiler): passed on to ReplayEngine
+    ticks (bool): replay in integer ticks (events must carry tick prices)
+    Returns
+    (float, ReplayEngine): events per second and the engine after the replay
+    '''
+    engine = ReplayEngine(OrderBookL1(ticks), AvellanedaStoikov(PARAMS), skip_unchanged=skip_unchanged,
+                          profiler=profiler)
+    start = time.perf_counter()
+    engine.run(events)
+    return len(events) / (time.perf_counter() - start), engine
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--limit", type=int, default=None,
+                        help="only replay the first N events of each day")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="only re-quote when the external top or the agent changed")
+    parser.add_argument("--ticks", action="store_true",
+                        help="replay with prices in integer ticks instead of dollars")
+    parser.add_argument("--profile", action="store_true",
+                        help="print the time spent in each stage (slows the replay down)")
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(DATA_DIR.rglob("*_message_*.csv"))
+    for path in paths:
+        events = arrow_to_events(lobster_to_arrow(path), args.ticks)[:args.limit]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore") # unknown oids from pre-open orders
+            profiler = Profiler() if args.profile else None
+            rate, engine = bench_run(events, args.skip_unchanged, profiler, args.ticks)
+        print(f"{Path(path).name}: {len(events):>9,} events  {rate:>12,.0f} events/sec"
+              f"  (quoted {engine.num_quotes_processed:,}, skipped {engine.num_quotes_skipped:,})")
+        if profiler is not None:
+            print(profiler.summary().to_string(index=False))
+            print(f"counters: {profiler.counters}")
+
+if __name__ == "__main__":
+    main()
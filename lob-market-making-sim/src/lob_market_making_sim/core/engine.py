@@ -3,16 +3,51 @@ engine.py
 Allows for execution of orders in the orderbook.
 '''
 
+import numpy as np
+from typing import Sequence
+
 from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.profiler import Profiler
+from lob_market_making_sim.core.recorder import Recorder
 from lob_market_making_sim.models.base import MarketMaker # generic strategy abstract class
-from lob_market_making_sim.io.schema import EventType, Direction, OrderEvent
+from lob_market_making_sim.io.schema import EventType, Direction, OrderEvent, TICK_SIZE
+from lob_market_making_sim.io.loader import EventColumns
+from lob_market_making_sim.io.checkpoint import checkpoint_path, load_checkpoint, save_checkpoint
+from lob_market_making_sim.evaluation.vol import EWMAVolEstimator
+from lob_market_making_sim.models.avellaneda import ASParams, ASParamsArray, quote_batch
+
+# Columns of ReplayEngine.quotes, one row per quote
+QUOTE_COLUMNS = dict(ts=np.float64, bid=np.float64, ask=np.float64, mid=np.float64,
+                     inventory=np.int64, cash=np.float64,
+                     filled_buy=np.int64, filled_sell=np.int64)
+
+# Columns of ReplayEngine.mids, one row per event
+MID_COLUMNS = dict(ts=np.float64, mid=np.float64)
 
 class ReplayEngine:
-    def __init__(self, ob: OrderBookL1, strategy: MarketMaker = None):
+    def __init__(self, ob: OrderBookL1, strategy: MarketMaker = None,
+                 vol_estimator: EWMAVolEstimator = None, skip_unchanged: bool = False,
+                 record_every: int = 1, profiler: Profiler = None):
         self.ob = ob
         self.strategy = strategy # Default strategy is None
-        self.quote_log = [] # Track every quote: (timestamp, bid, ask, midprice, inventory)
-        self.midprices = [] # Track every midprice after each event
+
+        # With a book in integer ticks, events are decoded, matched and
+        # quoted in ticks (strategy.quote_ticks) and cash is kept in ticks,
+        # so fill checks compare ints instead of rounding floats. Prices and
+        # cash are converted to dollars only when recorded or reported.
+        self.tick_mode = ob.ticks
+
+        # Optional online volatility estimate, updated with every external
+        # midprice so that adaptive strategies can read the current sigma
+        self.vol_estimator = vol_estimator
+
+        # Every quote (with the agent's position after it) and the midprice
+        # after each event, kept in typed arrays. With record_every > 1 only
+        # every n-th row of each is kept.
+        self.record_every = record_every
+        self.quotes = Recorder(QUOTE_COLUMNS, every=record_every)
+        self.mids = Recorder(MID_COLUMNS, every=record_every)
+        self._mid_buffer = [] # midprices of the events replayed since the last flush to mids
 
         self.inv = 0 # inventory, net position in shares
         self.cash = 0 # track P&L
@@ -29,17 +64,87 @@ class ReplayEngine:
         # Default quote size for agent order- can later update
         self.QUOTE_SIZE = 10
 
+        # When set, run() only asks the strategy for new quotes if the best
+        # external bid/ask, the inventory or the resting agent orders changed
+        # since the last quote. Most events are deep-level adds and cancels,
+        # but since quotes also depend on the time left, this is opt-in.
+        self.skip_unchanged = skip_unchanged
+        self._quote_state = None # (external top, inv, bid_oid, ask_oid) after the last quote
+        self.num_quotes_processed = 0 # events on which the strategy was asked to quote
+        self.num_quotes_skipped = 0 # events on which that was skipped
+
+        # Optional instrumentation (core/profiler.py). Without a profiler
+        # nothing is wrapped, so replays pay nothing for it.
+        self.profiler = profiler
+        if profiler is not None:
+            self.instrument(profiler)
+
     def ticks(self, p): return round(p * 100)      # $ -> rounded cents
 
+    def dollars(self, value):
+        '''
+        Converts a price or cash amount of the engine (ticks in tick mode)
+        to dollars.
+        '''
+        return value * TICK_SIZE if self.tick_mode else value
+
     def reset(self, ob = None) -> None:
         '''
         Clears all replay knowledge by calling the initializer.
+        The strategy and volatility estimator are kept, but the
+        estimator forgets the prices it has seen.
         '''
 
         # Allow option to reset with an order book, otherwise uses what already have
         if ob == None:
             ob = self.ob
-        self.__init__(ob)
+        if self.vol_estimator is not None:
+            self.vol_estimator.reset()
+        self.__init__(ob, self.strategy, self.vol_estimator, self.skip_unchanged,
+                      self.record_every, self.profiler)
+
+    def instrument(self, profiler: Profiler) -> None:
+        '''
+        Times the stages of each replayed event with profiler: the book
+        update, matching against the agent's quotes, the external
+        midprice, the volatility estimate, the strategy and the quote
+        updates. Whatever is left of an event is reported as engine.step.
+        '''
+        profiler.instrument(self, '_step', 'engine.step', per_event=True)
+        profiler.instrument(self.ob, 'apply_values', 'book.apply')
+        profiler.instrument(self, 'match_values', 'engine.match')
+        profiler.instrument(self.ob, 'mid_external', 'book.mid_external')
+        profiler.instrument(self.vol_estimator, 'update', 'vol.update')
+        profiler.instrument(self.strategy, 'quote_ticks' if self.tick_mode else 'quote',
+                            'strategy.quote')
+        profiler.instrument(self, '_update_quotes', 'engine.update_quotes')
+
+    @property
+    def quote_log(self) -> list:
+        '''
+        Every quote as a (timestamp, bid, ask, midprice, inventory) tuple.
+        Built from the quotes recorder on each access.
+        '''
+        return [row[:5] for row in self.quotes.rows()]
+
+    @property
+    def midprices(self) -> list:
+        '''
+        The midprice after each event, built from the mids recorder.
+        '''
+        return self.mids['mid'].tolist()
+
+    def _flush_mids(self, ts) -> None:
+        '''
+        Moves the buffered midprices, one per event, into mids.
+        Parameters
+        ts (Sequence[float]): timestamps of those events
+        '''
+        mids = self._mid_buffer
+        if self.tick_mode:
+            mids = np.array(mids, dtype=np.float64) * TICK_SIZE
+        self.mids.extend(ts, mids)
+        self._mid_buffer.clear()
 
     def _update_quotes(self, bid: float, ask: float, ts: float) -> None:
         '''
@@ -91,121 +196,517 @@ class ReplayEngine:
         Returns:
         num_events_processed, buy_fill, sell_fill
         '''
-        
-        num_events = self.ob.apply(market_event) # external event
+        return self.apply_values(market_event.ts, market_event.etype, market_event.oid,
+                                 market_event.size, market_event.price, market_event.direction)
+
+    def apply_values(self, ts, etype: EventType, oid: int, size: int, price: float,
+                     direction: Direction):
+        '''
+        Same as apply_event, but takes the fields of the event directly
+        so that columnar replays do not build an OrderEvent per row.
+        Parameters:
+        ts: timestamp of the event
+        etype (EventType): type of the event
+        oid (int): order id the event refers to
+        size (int): number of shares
+        price (float): price of the order in dollars (int ticks in tick mode)
+        direction (Direction): side of the order
+        Returns:
+        num_events_processed, buy_fill, sell_fill
+        '''
+
+        num_events = self.ob.apply_values(etype, oid, size, price, direction) # external event
+        synthetic_events, buy_fill, sell_fill = self.match_values(etype, size, price, direction)
+        return num_events + synthetic_events, buy_fill, sell_fill
+
+    def match_values(self, etype: EventType, size: int, price: float, direction: Direction):
+        '''
+        Fills the agent's resting quotes against a historical trade,
+        without applying the trade itself to the book. Whether the agent
+        is hit depends only on the trade and the agent's own quotes.
+        Parameters:
+        etype (EventType): type of the event
+        size (int): number of shares
+        price (float): price of the order in dollars (int ticks in tick mode)
+        direction (Direction): side of the order
+        Returns:
+        num_synthetic_events, buy_fill, sell_fill
+        '''
         synthetic_events = 0
         buy_fill = sell_fill = 0
 
-        # helper that executes (part of) an agent order
-        def _hit_agent(oid, rec, hit_size):
-            nonlocal synthetic_events, buy_fill, sell_fill
-
-            # 1. inject synthetic execution so OrderBookL1 updates depth
-            exec_ev = OrderEvent(
-                ts = market_event.ts,
-                etype = EventType.EXECUTE_VISIBLE,
-                oid = oid,
-                direction = rec.direction,
-                price = rec.price,
-                size = hit_size
-            )
-            synthetic_events += self.ob.apply(exec_ev)
-
-            # 2. cash & inventory from our point of view
-            if rec.direction is Direction.BUY: # we bought first
-                self.cash -= hit_size * rec.price
-                self.inv += hit_size
-                self.filled_buy += hit_size
-                buy_fill += hit_size
-            else: # we sold first
-                self.cash += hit_size * rec.price
-                self.inv -= hit_size
-                self.filled_sell += hit_size
-                sell_fill += hit_size
-
-            # 3. if the order is now gone, clear
-            if oid not in self.ob._orders:
-                if rec.direction is Direction.BUY:
-                    self.bid_oid = None
-                else:
-                    self.ask_oid = None
-
         # only trade-type events can hit us
-        if market_event.etype in {EventType.EXECUTE_VISIBLE, EventType.CROSS}:
+        if etype is EventType.EXECUTE_VISIBLE or etype is EventType.CROSS:
             # market BUY might hit our ASK
-            if self.ask_oid is not None and market_event.direction is Direction.SELL:
+            if self.ask_oid is not None and direction is Direction.SELL:
                 ask_rec = self.ob._orders.get(self.ask_oid) # our placed ask, if any
 
-                # round to ticks in cents for consistency
-                if ask_rec and self.ticks(market_event.price) >= self.ticks(ask_rec.price):
-                    hit_qty = min(ask_rec.quantity, market_event.size)
-                    _hit_agent(self.ask_oid, ask_rec, hit_qty)
-            
+                # round to ticks in cents for consistency (exact already in tick mode)
+                if ask_rec and (price >= ask_rec.price if self.tick_mode
+                                else self.ticks(price) >= self.ticks(ask_rec.price)):
+                    # the book decides how much of the trade reaches us in the queue
+                    hit_qty = min(ask_rec.quantity, self.ob.agent_fill_size(self.ask_oid, size))
+                    if hit_qty > 0:
+                        synthetic_events += self._hit_agent(self.ask_oid, ask_rec, hit_qty)
+                        sell_fill += hit_qty
+
             # market SELL might hit our BID
-            if self.bid_oid is not None and market_event.direction is Direction.BUY:
+            if self.bid_oid is not None and direction is Direction.BUY:
                 bid_rec = self.ob._orders.get(self.bid_oid)
-                if bid_rec and self.ticks(market_event.price) <= self.ticks(bid_rec.price):
-                    hit_qty = min(bid_rec.quantity, market_event.size)
-                    _hit_agent(self.bid_oid, bid_rec, hit_qty)
+                if bid_rec and (price <= bid_rec.price if self.tick_mode
+                                else self.ticks(price) <= self.ticks(bid_rec.price)):
+                    hit_qty = min(bid_rec.quantity, self.ob.agent_fill_size(self.bid_oid, size))
+                    if hit_qty > 0:
+                        synthetic_events += self._hit_agent(self.bid_oid, bid_rec, hit_qty)
+                        buy_fill += hit_qty
 
-        return num_events + synthetic_events, buy_fill, sell_fill
+        return synthetic_events, buy_fill, sell_fill
+
+    def _hit_agent(self, oid, rec, hit_size):
+        '''
+        Executes (part of) an agent order.
+        Parameters:
+        oid (int): the agent's order id
+        rec (OrderRec): the agent's order record
+        hit_size (int): number of shares executed
+        Returns:
+        number of synthetic events processed by the book
+        '''
 
+        # 1. inject synthetic execution so OrderBookL1 updates depth
+        synthetic_events = self.ob.apply_values(EventType.EXECUTE_VISIBLE, oid, hit_size,
+                                                rec.price, rec.direction)
+
+        # 2. cash & inventory from our point of view
+        if rec.direction is Direction.BUY: # we bought first
+            self.cash -= hit_size * rec.price
+            self.inv += hit_size
+            self.filled_buy += hit_size
+        else: # we sold first
+            self.cash += hit_size * rec.price
+            self.inv -= hit_size
+            self.filled_sell += hit_size
+
+        # 3. if the order is now gone, clear
+        if oid not in self.ob._orders:
+            if rec.direction is Direction.BUY:
+                self.bid_oid = None
+            else:
+                self.ask_oid = None
 
-    def run(self, events):
+        return synthetic_events
+
+    def run(self, events, checkpoint_every: int = None, checkpoint_dir=None,
+            first_index: int = 0):
         '''
         Runs the simulation with the events in events
         Parameters
-        events (Iterable[OrderEvent]): list of events to handle
+        events (Iterable[OrderEvent] or EventColumns): events to handle; columns
+            are decoded row by row without building OrderEvents. In tick mode,
+            OrderEvents must carry prices in ticks (arrow_to_events(ticks=True))
+        checkpoint_every (int): also write a checkpoint (see checkpoint)
+            every this many events; events must then support slicing
+        checkpoint_dir (str or pathlib.Path): folder for those checkpoints
+        first_index (int): index in the day of events[0], used to number
+            the checkpoints when resuming mid-day
         '''
 
         if self.strategy is None:
             raise ValueError("replayEngine.run() requires self.strategy to be set")
 
-        # closing time, which is 6.5 hours after midnight (in seconds)
-        T = 6.5*60*60
-        for event in events:
-            # convert event.ts in nanoseconds to seconds
-            tau = max(T - event.ts * 1e-9, 0) # ending timestep - closing time = time till closing (s)
+        if checkpoint_every:
+            if checkpoint_dir is None:
+                raise ValueError("checkpoint_every requires a checkpoint_dir")
+            for start in range(0, len(events), checkpoint_every):
+                batch = events[start:start + checkpoint_every]
+                self.run(batch)
+                if len(batch) == checkpoint_every:
+                    end = first_index + start + checkpoint_every
+                    self.checkpoint(checkpoint_path(checkpoint_dir, end), end)
+            return
+
+        if self.profiler is not None:
+            skipped = self.ob.warning_counts()
+        if hasattr(events, '__len__'):
+            self.mids.reserve(len(events))
+        # Midprices are buffered in a list while replaying and written to
+        # the mids recorder once per chunk of events
+        if isinstance(events, EventColumns):
+            for chunk in events.iter_chunks(ticks=self.tick_mode):
+                for ts, etype, oid, size, price, direction in zip(*chunk):
+                    self._step(ts, etype, oid, size, price, direction)
+                self._flush_mids(chunk[0])
+        else:
+            timestamps = []
+            for event in events:
+                self._step(event.ts, event.etype, event.oid, event.size, event.price,
+                           event.direction)
+                timestamps.append(event.ts)
+                if len(timestamps) == 65536:
+                    self._flush_mids(timestamps)
+                    timestamps.clear()
+            self._flush_mids(timestamps)
+
+        if self.profiler is not None:
+            for name, n in self.ob.warning_counts().items():
+                self.profiler.count(f'book.{name}', n - skipped[name])
+
+    def get_state(self) -> dict:
+        '''
+        Returns the replay state as NumPy arrays: the book (keys prefixed
+        with book_), the agent's cash (int64 ticks in tick mode, float64
+        dollars otherwise), inventory, fills and order ids, and the
+        volatility estimate. The quotes and mids records are not included.
+        Returns
+        dict[str, np.ndarray]
+        '''
+        state = {f'book_{name}': value for name, value in self.ob.get_state().items()}
+        state['cash'] = np.array(self.cash, dtype=np.int64 if self.tick_mode else np.float64)
+        state['agent'] = np.array([self.inv, self.filled_buy, self.filled_sell,
+                                   self.num_events_executed, self.num_quotes_processed,
+                                   self.num_quotes_skipped], dtype=np.int64)
+        # 0 marks a missing agent order, whose oids are negative
+        state['agent_oids'] = np.array([self.bid_oid or 0, self.ask_oid or 0], dtype=np.int64)
+        if self._quote_state is not None:
+            (ext_bid, ext_ask), inv, bid_oid, ask_oid = self._quote_state
+            state['quote_state'] = np.array([np.nan if ext_bid is None else ext_bid,
+                                             np.nan if ext_ask is None else ext_ask,
+                                             inv, bid_oid or 0, ask_oid or 0], dtype=np.float64)
+        if self.vol_estimator is not None:
+            state.update({f'vol_{name}': np.array(value)
+                          for name, value in self.vol_estimator.get_state().items()})
+        return state
+
+    def set_state(self, state: dict) -> None:
+        '''
+        Restores a state returned by get_state. The book is overwritten
+        in place and the strategy is kept.
+        Parameters
+        state (dict[str, np.ndarray]): the saved state
+        '''
+        self.reset()
+        self.ob.set_state({name[len('book_'):]: value for name, value in state.items()
+                           if name.startswith('book_')})
+        cash = state['cash'].item()
+        self.cash = int(cash) if self.tick_mode else float(cash)
+        inv, filled_buy, filled_sell, executed, processed, skipped = state['agent'].tolist()
+        self.inv, self.filled_buy, self.filled_sell = inv, filled_buy, filled_sell
+        self.num_events_executed = executed
+        self.num_quotes_processed, self.num_quotes_skipped = processed, skipped
+        bid_oid, ask_oid = state['agent_oids'].tolist()
+        self.bid_oid, self.ask_oid = bid_oid or None, ask_oid or None
+        if 'quote_state' in state:
+            ext_bid, ext_ask, inv, bid_oid, ask_oid = state['quote_state'].tolist()
+            self._quote_state = ((None if ext_bid != ext_bid else ext_bid,
+                                  None if ext_ask != ext_ask else ext_ask),
+                                 int(inv), int(bid_oid) or None, int(ask_oid) or None)
+        if self.vol_estimator is not None:
+            self.vol_estimator.set_state({name[len('vol_'):]: value for name, value in state.items()
+                                          if name.startswith('vol_')})
+
+    def checkpoint(self, path, event_index: int):
+        '''
+        Writes the replay state to a .npz checkpoint file.
+        Parameters
+        path (str or pathlib.Path): destination file
+        event_index (int): number of events of the day replayed so far
+        Returns
+        pathlib.Path: the file written
+        '''
+        return save_checkpoint(path, self.get_state(), event_index)
 
-            # let market event hit the tape & maybe us
-            num_ev, _, _ = self.apply_event(event)
+    def restore(self, path) -> int:
+        '''
+        Restores the replay state from a checkpoint file, so the replay
+        continues with events[event_index:].
+        Parameters
+        path (str or pathlib.Path): file written by checkpoint
+        Returns
+        int: the number of events of the day replayed before the checkpoint
+        '''
+        event_index, state = load_checkpoint(path)
+        self.set_state(state)
+        return event_index
 
-            # update metrics
-            self.num_events_executed += num_ev
+    def _step(self, ts, etype, oid, size, price, direction):
+        '''
+        Replays a single event: applies it, then re-quotes around the
+        external midprice.
+        '''
 
-            # only calculate midprice with non-agent quotes
-            clean_mid = self.ob.mid_external()
-            if clean_mid is None:
-                # keep existing quotes, but don't adjust reservation price
-                self.midprices.append(self.ob.midprice())
-                continue
+        # closing time, which is 6.5 hours after midnight (in seconds)
+        T = 6.5*60*60
 
-            # get our bid and ask
+        # Known issue: ts is in seconds after midnight, but is scaled here
+        # as if it were nanoseconds, so tau stays close to T all day. Left
+        # unchanged so results stay comparable with earlier runs.
+        tau = max(T - ts * 1e-9, 0) # ending timestep - closing time = time till closing (s)
+
+        # let market event hit the tape & maybe us
+        num_ev, _, _ = self.apply_values(ts, etype, oid, size, price, direction)
+
+        # update metrics
+        self.num_events_executed += num_ev
+
+        # only calculate midprice with non-agent quotes
+        clean_mid = self.ob.mid_external()
+        if clean_mid is None:
+            # keep existing quotes, but don't adjust reservation price
+            self._mid_buffer.append(self.ob.midprice())
+            return
+
+        if self.vol_estimator is not None:
+            self.vol_estimator.update(clean_mid)
+
+        if self.skip_unchanged and self._quote_state == (self.ob.external_top(), self.inv,
+                                                         self.bid_oid, self.ask_oid):
+            # nothing the quotes react to has changed, keep them resting
+            self.num_quotes_skipped += 1
+            self._mid_buffer.append(self.ob.midprice())
+            return
+        self.num_quotes_processed += 1
+
+        # get our bid and ask
+        if self.tick_mode:
+            bid, ask = self.strategy.quote_ticks(clean_mid, self.inv, tau)
+        else:
             bid, ask = self.strategy.quote(clean_mid, self.inv, tau)
 
-            # cancel-and-replace our quotes
-            self._update_quotes(bid, ask, ts=event.ts)
-
-            # For debugging: only compare if there's a previous midprice
-            '''
-            if self.midprices and abs(clean_mid - self.midprices[-1]) > 0.05:
-                bb, ba = self.ob.best_bid.price, self.ob.best_ask.price
-                bbe, bae = (self.ob.mid_external() * 2 - ba, ba)  # crude invert
-                print(f"JUMP @ ts={event.ts}  best_bid={bb} best_ask={ba}  "
-                      f"agent_bid={self.ob._orders.get(self.bid_oid)} "
-                      f"agent_ask={self.ob._orders.get(self.ask_oid)}")
-            '''
+        # cancel-and-replace our quotes
+        self._update_quotes(bid, ask, ts=ts)
+        if self.skip_unchanged:
+            self._quote_state = (self.ob.external_top(), self.inv, self.bid_oid, self.ask_oid)
 
-            # store the post-event midprice
-            self.midprices.append(self.ob.midprice())
+        # store the post-event midprice
+        self._mid_buffer.append(self.ob.midprice())
 
 
     def log_quote(self, timestamp, bid_price, ask_price):
         '''
         Adds a quote to the log of all quotes.
         Parameters:
-        timestamp (float): nanoseconds since midnight trade executed
+        timestamp (float): seconds after midnight the trade executed
         bid_price (float): offered price to buy
         ask_price (float): desired price to sell
         '''
-        self.quote_log.append((timestamp, bid_price, ask_price, self.ob.midprice(), self.inv))
+        mid, cash = self.ob.midprice(), self.cash
+        if self.tick_mode:
+            bid_price, ask_price = bid_price * TICK_SIZE, ask_price * TICK_SIZE
+            mid, cash = mid * TICK_SIZE, cash * TICK_SIZE
+        self.quotes.append(timestamp, bid_price, ask_price, mid, self.inv,
+                           cash, self.filled_buy, self.filled_sell)
+
+
+class LockstepReplayEngine:
+    '''
+    Replays one shared book for N independent Avellaneda-Stoikov agents
+    at once, e.g. every configuration of a parameter sweep.
+
+    The external book evolves independently of the agents, so each
+    agent's quotes are tracked in arrays rather than inserted into the
+    shared book. Fill rules, quote refresh and inventory guards follow
+    ReplayEngine, so each agent ends with the same cash, inventory and
+    fills as a separate ReplayEngine run with AvellanedaStoikov.
+    No per-quote log or midprice history is kept.
+    '''
+    def __init__(self, ob: OrderBookL1, params: Sequence[ASParams],
+                 horizon_sec: int = 6*60*60, quote_size: int = 10):
+        '''
+        Parameters
+        ob (OrderBookL1): the shared external book
+        params (Sequence[ASParams]): one entry per agent
+        horizon_sec (int): trading horizon of every agent's strategy
+        quote_size (int): shares per agent quote
+        Raises
+        ValueError
+            If the book is in integer ticks; agents here quote in dollars
+        '''
+        if ob.ticks:
+            raise ValueError("LockstepReplayEngine replays in dollars, use a book with ticks=False")
+        self.ob = ob
+        self.params = ASParamsArray.from_params(params)
+        self.horizon_sec = horizon_sec
+        self.QUOTE_SIZE = quote_size
+
+        n = len(self.params)
+        self.inv = np.zeros(n, dtype=np.int64)
+        self.cash = np.zeros(n)
+        self.filled_buy = np.zeros(n, dtype=np.int64)
+        self.filled_sell = np.zeros(n, dtype=np.int64)
+
+        # Resting agent quotes: price (NaN if none) and remaining size
+        self.bid_px = np.full(n, np.nan)
+        self.ask_px = np.full(n, np.nan)
+        self.bid_qty = np.zeros(n, dtype=np.int64)
+        self.ask_qty = np.zeros(n, dtype=np.int64)
+
+        # number of events were able to execute
+        self.num_events_executed = 0
+
+    # Per-agent arrays saved in checkpoints
+    _AGENT_ARRAYS = ('inv', 'cash', 'filled_buy', 'filled_sell',
+                     'bid_px', 'ask_px', 'bid_qty', 'ask_qty')
+
+    def __len__(self):
+        return len(self.params)
+
+    def run(self, events, checkpoint_every: int = None, checkpoint_dir=None,
+            first_index: int = 0):
+        '''
+        Runs the simulation for every agent with the events in events.
+        Parameters
+        events (Iterable[OrderEvent] or EventColumns): events to handle
+        checkpoint_every (int): also write a checkpoint (see checkpoint)
+            every this many events; events must then support slicing
+        checkpoint_dir (str or pathlib.Path): folder for those checkpoints
+        first_index (int): index in the day of events[0], used to number
+            the checkpoints when resuming mid-day
+        '''
+        if checkpoint_every:
+            if checkpoint_dir is None:
+                raise ValueError("checkpoint_every requires a checkpoint_dir")
+            for start in range(0, len(events), checkpoint_every):
+                batch = events[start:start + checkpoint_every]
+                self.run(batch)
+                if len(batch) == checkpoint_every:
+                    end = first_index + start + checkpoint_every
+                    self.checkpoint(checkpoint_path(checkpoint_dir, end), end)
+            return
+
+        if isinstance(events, EventColumns):
+            for chunk in events.iter_chunks():
+                for ts, etype, oid, size, price, direction in zip(*chunk):
+                    self._step(ts, etype, oid, size, price, direction)
+        else:
+            for event in events:
+                self._step(event.ts, event.etype, event.oid, event.size, event.price,
+                           event.direction)
+
+    def get_state(self) -> dict:
+        '''
+        Returns the replay state as NumPy arrays: the book (keys prefixed
+        with book_) and the cash, inventory, fills and resting quotes of
+        every agent. The parameters of the agents are not included.
+        Returns
+        dict[str, np.ndarray]
+        '''
+        state = {f'book_{name}': value for name, value in self.ob.get_state().items()}
+        for name in self._AGENT_ARRAYS:
+            state[f'agent_{name}'] = getattr(self, name).copy()
+        state['num_events_executed'] = np.array(self.num_events_executed, dtype=np.int64)
+        return state
+
+    def set_state(self, state: dict) -> None:
+        '''
+        Restores a state returned by get_state. The book is overwritten
+        in place and the agents' parameters are kept.
+        Parameters
+        state (dict[str, np.ndarray]): the saved state
+        Raises
+        ValueError
+            If the state was saved with a different number of agents
+        '''
+        if len(state['agent_cash']) != len(self):
+            raise ValueError(f"state has {len(state['agent_cash'])} agents, engine has {len(self)}")
+        self.ob.set_state({name[len('book_'):]: value for name, value in state.items()
+                           if name.startswith('book_')})
+        for name in self._AGENT_ARRAYS:
+            getattr(self, name)[:] = state[f'agent_{name}']
+        self.num_events_executed = int(state['num_events_executed'])
+
+    def checkpoint(self, path, event_index: int):
+        '''
+        Writes the replay state to a .npz checkpoint file.
+        Parameters
+        path (str or pathlib.Path): destination file
+        event_index (int): number of events of the day replayed so far
+        Returns
+        pathlib.Path: the file written
+        '''
+        return save_checkpoint(path, self.get_state(), event_index)
+
+    def restore(self, path) -> int:
+        '''
+        Restores the replay state from a checkpoint file, so the replay
+        continues with events[event_index:].
+        Parameters
+        path (str or pathlib.Path): file written by checkpoint
+        Returns
+        int: the number of events of the day replayed before the checkpoint
+        '''
+        event_index, state = load_checkpoint(path)
+        self.set_state(state)
+        return event_index
+
+    def _step(self, ts, etype, oid, size, price, direction):
+        '''
+        Replays a single event for all agents.
+        '''
+        # closing time, which is 6.5 hours after midnight (in seconds)
+        T = 6.5*60*60
+        tau = max(T - ts * 1e-9, 0) # same known ts scaling issue as ReplayEngine._step
+
+        self.num_events_executed += self.ob.apply_values(etype, oid, size, price, direction)
+
+        # only trade-type events can hit resting agent quotes
+        if etype is EventType.EXECUTE_VISIBLE or etype is EventType.CROSS:
+            self._fill(size, price, direction)
+
+        clean_mid = self.ob.mid_external()
+        if clean_mid is None:
+            return # keep existing quotes
+
+        bid, ask = quote_batch(clean_mid, self.inv, tau, self.params, self.horizon_sec)
+        self._update_quotes(bid, ask)
+
+    def _fill(self, size, price, direction):
+        '''
+        Executes agent quotes crossed by a trade, with the same
+        cent-rounded price comparison as ReplayEngine.
+        '''
+        trade_ticks = round(price * 100)
+        if direction is Direction.SELL: # market BUY might hit our ASKs
+            hit = np.where((self.ask_qty > 0) & (trade_ticks >= np.rint(self.ask_px * 100)),
+                           np.minimum(self.ask_qty, size), 0)
+            self.ask_qty -= hit
+            self.cash += np.where(hit > 0, hit * self.ask_px, 0.0)
+            self.inv -= hit
+            self.filled_sell += hit
+        elif direction is Direction.BUY: # market SELL might hit our BIDs
+            hit = np.where((self.bid_qty > 0) & (trade_ticks <= np.rint(self.bid_px * 100)),
+                           np.minimum(self.bid_qty, size), 0)
+            self.bid_qty -= hit
+            self.cash -= np.where(hit > 0, hit * self.bid_px, 0.0)
+            self.inv += hit
+            self.filled_buy += hit
+
+    def _update_quotes(self, bid: np.ndarray, ask: np.ndarray) -> None:
+        '''
+        Cancel-and-replace for every agent: a quote at a new price (or
+        replacing a fully filled one) is posted with QUOTE_SIZE shares,
+        an unchanged quote keeps its remaining size, and NaN cancels.
+        '''
+        for px, qty, new in ((self.bid_px, self.bid_qty, bid), (self.ask_px, self.ask_qty, ask)):
+            quoting = ~np.isnan(new)
+            repost = quoting & ((qty == 0) | (px != new))
+            qty[repost] = self.QUOTE_SIZE
+            qty[~quoting] = 0
+            px[:] = new
+
+    def results(self) -> list[dict]:
+        '''
+        Final state of every agent.
+        Returns
+        list[dict]: cash, inventory, fills, final midprice and
+            marked-to-market P&L, one entry per agent
+        '''
+        mid = self.ob.mid_external()
+        if mid is None: # fall back to the visible book
+            mid = self.ob.midprice()
+        return [dict(cash=float(self.cash[i]),
+                     inventory=int(self.inv[i]),
+                     filled_buy=int(self.filled_buy[i]),
+                     filled_sell=int(self.filled_sell[i]),
+                     final_mid=mid,
+                     pnl=float(self.cash[i] + self.inv[i] * mid))
+                for i in range(len(self))]
@@ -5,21 +5,24 @@ of event orders and tracks relevent trade information.
 '''
 
 from lob_market_making_sim.io.schema import OrderEvent, Direction, EventType
-from typing import Optional, Dict # Allows for gradual typing of basic objects
+from typing import Optional, Dict, List # Allows for gradual typing of basic objects
 from dataclasses import dataclass
 import warnings # For warning messages
+import heapq # Priority queues for the best price on each side
 from collections import defaultdict # Container for regular dictionary
+import numpy as np
 
-@dataclass
+@dataclass(slots=True)
 class TopLevel:
     '''
     Record of top level of book which only requires price
-    and quantity information.
+    and quantity information. The book updates its two TopLevels in
+    place, so copy one (dataclasses.replace) to keep it across events.
     '''
     price: int = 0
     quantity: int = 0
 
-@dataclass
+@dataclass(slots=True)
 class OrderRec:
     '''
     Record of an order, only tracking relevant information
@@ -35,7 +38,20 @@ class OrderBookL1:
     with their aggregate sizes.
     '''
 
-    def __init__(self):
+    # Record type created for each new order, extended by subclasses that
+    # keep more per-order state
+    _record_cls = OrderRec
+
+    def __init__(self, ticks: bool = False):
+        '''
+        Parameters
+        ticks (bool): prices are integer ticks (schema.TICK_SIZE dollars)
+            rather than float dollars. The book itself works with either;
+            this sets the dtype prices are saved with in get_state, and
+            tells the engine to replay in ticks.
+        '''
+        self.ticks = ticks
+
         # Note that OrderRec also stores the direction of trade, which is unecessary for
         # the best bid and ask
         self.best_bid = TopLevel()
@@ -46,6 +62,14 @@ class OrderBookL1:
         self._bid_depth: Dict[int, int] = defaultdict(int)
         self._ask_depth: Dict[int, int] = defaultdict(int)
 
+        # Lazy-deletion heaps over the prices in the depth maps, so the best
+        # level is found in O(log n) instead of scanning every price.
+        # Bids are stored negated so that both sides are min-heaps. A price
+        # is pushed when its level is created, and entries whose level has
+        # since emptied are discarded only once they reach the top.
+        self._bid_heap: List[float] = []
+        self._ask_heap: List[float] = []
+
         # Key is the ID of the each event, necessary for tracking orders
         # Note that when an event that refers to an already made order occurs,
         # the oid will be that of the original order
@@ -54,6 +78,26 @@ class OrderBookL1:
         # Negative oid is reserved for our own quotes
         self._next_agent_oid = -1
 
+        # Quantity resting at each price that belongs to the agent (negative oids),
+        # so the external depth at a price is depth - agent quantity
+        self._agent_bid_qty: Dict[float, int] = {}
+        self._agent_ask_qty: Dict[float, int] = {}
+
+        # Cached best external (non-agent) bid and ask prices. None means there
+        # is no external order on that side. The cache is invalidated only by
+        # changes at or better than the cached price, since deeper levels
+        # cannot become the external best without the best level changing.
+        self._ext_bid: Optional[float] = None
+        self._ext_ask: Optional[float] = None
+        self._ext_bid_valid = True
+        self._ext_ask_valid = True
+
+        # Events skipped because they refer to an order the book does not
+        # know (e.g. one resting since before the open), and executions
+        # larger than the order, since the last reset
+        self.num_unknown_oid = 0
+        self.num_negative_quantity = 0
+
     def place_agent_quote(self, direction: Direction, price: float, size: int = 1) -> int:
         '''
         Insert (or replace) the agent quote at price. Returns the oid.
@@ -66,15 +110,7 @@ class OrderBookL1:
         '''
         oid = self._next_agent_oid
         self._next_agent_oid -= 1
-        ev = OrderEvent(
-            ts = 0.0, # not relevant for matching
-            etype = EventType.ADD,
-            oid = oid,
-            direction = direction,
-            price = price,
-            size = size
-        )
-        self.apply(ev)
+        self.apply_values(EventType.ADD, oid, size, price, direction)
         return oid
     
     def cancel_agent_quote(self, oid: int) -> None:
@@ -84,22 +120,14 @@ class OrderBookL1:
 
         if oid in self._orders:
             rec = self._orders[oid] # record desired to delete
-            ev = OrderEvent(
-                ts = 0.0,
-                etype = EventType.DELETE,
-                oid = oid,
-                direction = rec.direction,
-                price = rec.price,
-                size = rec.quantity
-            )
-            self.apply(ev)
+            self.apply_values(EventType.DELETE, oid, rec.quantity, rec.price, rec.direction)
 
     def reset(self):
         '''
         Resets the book by calling initialization again, erasing
         all stored information.
         '''
-        self.__init__()
+        self.__init__(self.ticks)
 
     def apply(self, ev : OrderEvent):
         '''
@@ -110,82 +138,103 @@ class OrderBookL1:
         Returns:
         the number of events processed
         '''
+        return self.apply_values(ev.etype, ev.oid, ev.size, ev.price, ev.direction)
 
-        # print(f'TYPE {ev.direction} - OID {ev.oid} - PRICE {ev.price}')
+    def apply_values(self, etype: EventType, oid: int, size: int, price: float,
+                     direction: Direction):
+        '''
+        Same as apply, but takes the fields of the event directly so that
+        columnar replays do not need to build an OrderEvent per row.
+        Parameters:
+        etype (EventType): type of the event
+        oid (int): order id the event refers to
+        size (int): number of shares
+        price (float): price of the order
+        direction (Direction): side of the order
+        Returns:
+        the number of events processed
+        '''
 
         # If the event is a new offer, update only if this offer best better
         # than the best current buy or sell offer
-        if ev.etype is EventType.ADD:
+        if etype is EventType.ADD:
 
-            if ev.oid in self._orders: # If this is adding to an existing order
-                self._orders[ev.oid].quantity += ev.size
+            if oid in self._orders: # If this is adding to an existing order
+                self._orders[oid].quantity += size
             else: # Otherwise, create a new entry
-                self._orders[ev.oid] = OrderRec(direction = ev.direction, price = ev.price, quantity = ev.size)
+                self._orders[oid] = self._record_cls(direction = direction, price = price, quantity = size)
 
-            if ev.direction is Direction.BUY:
+            if oid < 0: # Keep the agent quantity index in step with the depth
+                self._update_agent_qty(direction, price, size)
+            self._update_depth(direction, price, size) # Add price and size to the depth
 
-                self._bid_depth[ev.price] += ev.size # Add price and size to list of bids
+            if direction is Direction.BUY:
 
-                if ev.price == self.best_bid.price:
+                if price == self.best_bid.price:
                     # If this is an addition to what is already at the top of the book
                     # Top of the book is updated to be consistent with the new number of shares
-                    self.best_bid = TopLevel(price = ev.price, quantity = self._bid_depth[ev.price])
-                elif ev.price > self.best_bid.price: # New top of the book
-                    self._refresh_top(ev.direction)
+                    self.best_bid.quantity = self._bid_depth[price]
+                elif price > self.best_bid.price: # New top of the book
+                    self._refresh_top(direction)
                     
-            elif ev.direction is Direction.SELL:
+            elif direction is Direction.SELL:
 
-                self._ask_depth[ev.price] += ev.size
-
-                if ev.price == self.best_ask.price:
-                    self.best_ask = TopLevel(price = ev.price, quantity = self._ask_depth[ev.price])
+                if price == self.best_ask.price:
+                    self.best_ask.quantity = self._ask_depth[price]
                 # Need to update the top of the book if it is the first entry as well
-                elif ev.price < self.best_ask.price or self.best_ask.price == 0:
-                    self._refresh_top(ev.direction)
+                elif price < self.best_ask.price or self.best_ask.price == 0:
+                    self._refresh_top(direction)
 
         # Change the number of shares in one of the orders (partial deletion)
         # is the same as executing either a visible trade
-        elif ev.etype is EventType.CANCEL or ev.etype is EventType.EXECUTE_VISIBLE:
-            if ev.oid not in self._orders:
-                warnings.warn(f'Unknown order ID {ev.oid} - cannot execute EXECUTE_VISIBLE or CANCEL, skipping execution')
+        elif etype is EventType.CANCEL or etype is EventType.EXECUTE_VISIBLE:
+            if oid not in self._orders:
+                self.num_unknown_oid += 1
+                warnings.warn(f'Unknown order ID {oid} - cannot execute EXECUTE_VISIBLE or CANCEL, skipping execution')
                 return 0
-            self._orders[ev.oid].quantity -= ev.size
+            self._orders[oid].quantity -= size
 
             # If selling this amount would consume all of the current shares
-            if self._orders[ev.oid].quantity <= 0:
-                if self._orders[ev.oid].quantity < 0:
+            if self._orders[oid].quantity <= 0:
+                if self._orders[oid].quantity < 0:
+                    self.num_negative_quantity += 1
                     warnings.warn("Attempt to execute order resulting in negative quantity.")
-                del self._orders[ev.oid]
+                del self._orders[oid]
 
             # Update the appropriate depth
-            self._update_depth(ev.direction, ev.price, -ev.size)
+            self._update_depth(direction, price, -size)
+            if oid < 0:
+                self._update_agent_qty(direction, price, -size)
 
             # Handle the top of the book, if needed
-            if ev.direction is Direction.BUY:    
+            if direction is Direction.BUY:    
                            
-                if ev.price == self.best_bid.price: # Update top of book if relevent
-                    self.best_bid = TopLevel(price = ev.price, quantity = self.best_bid.quantity - ev.size)
+                if price == self.best_bid.price: # Update top of book if relevent
+                    self.best_bid.quantity -= size
                     if self.best_bid.quantity <= 0:
                         self._refresh_top(Direction.BUY)
 
-            elif ev.direction is Direction.SELL:
+            elif direction is Direction.SELL:
                 # The price should never be less than best ask, because best ask is always the minimum ask
-                if ev.price == self.best_ask.price:
-                    self.best_ask = TopLevel(price = ev.price, quantity = self.best_ask.quantity - ev.size)
+                if price == self.best_ask.price:
+                    self.best_ask.quantity -= size
                     if self.best_ask.quantity <= 0:
                         self._refresh_top(Direction.SELL)
 
         # An order is pulled
-        elif ev.etype is EventType.DELETE:
+        elif etype is EventType.DELETE:
 
-            if ev.oid not in self._orders:
-                warnings.warn(f'Unknown order ID {ev.oid} - cannot execute DELETE, skipping execution')
+            if oid not in self._orders:
+                self.num_unknown_oid += 1
+                warnings.warn(f'Unknown order ID {oid} - cannot execute DELETE, skipping execution')
                 return 0
 
-            record = self._orders.pop(ev.oid)
+            record = self._orders.pop(oid)
             # Updating by the -quantity will cause the item to be removed since 0 shares remaining
-            self._update_depth(ev.direction, record.price, -record.quantity)
-            self._refresh_top(ev.direction) # May cause a new top of book
+            self._update_depth(direction, record.price, -record.quantity)
+            if oid < 0:
+                self._update_agent_qty(direction, record.price, -record.quantity)
+            self._refresh_top(direction) # May cause a new top of book
 
 
         # Other event type is a cross trade/auction trade (when a buy and
@@ -208,20 +257,38 @@ class OrderBookL1:
         direction (Direction): the side of the book to update
         '''
         if direction is Direction.BUY:
-            if self._bid_depth: # Need to ensure there is a next price.
-                next_price = max(self._bid_depth)
-                next_quantity = self._bid_depth[next_price]
-                self.best_bid = TopLevel(price = next_price, quantity = next_quantity)
-            else: # If there are no possible next prices, then the top is zero
-                self.best_bid = TopLevel()
+            top, depth = self.best_bid, self._bid_depth
+        else:
+            top, depth = self.best_ask, self._ask_depth
+
+        next_price = self._best_price(direction)
+        if next_price is not None: # Need to ensure there is a next price.
+            top.price = next_price
+            top.quantity = depth[next_price]
+        else: # If there are no possible next prices, then the top is zero
+            top.price = 0
+            top.quantity = 0
+
+    def _best_price(self, direction):
+        '''
+        Returns the best price with resting depth on one side of the book,
+        dropping stale heap entries for levels that have emptied.
+        Parameters
+        direction (Direction): the side of the book to inspect
+        Returns
+        the highest bid / lowest ask price, or None if that side is empty
+        '''
+        if direction is Direction.BUY:
+            heap, depth, sign = self._bid_heap, self._bid_depth, -1
+        else:
+            heap, depth, sign = self._ask_heap, self._ask_depth, 1
 
-        elif direction is Direction.SELL:
-            if self._ask_depth:
-                next_price = min(self._ask_depth)
-                next_quantity = self._ask_depth[next_price]
-                self.best_ask = TopLevel(price = next_price, quantity = next_quantity)
-            else:
-                self.best_ask = TopLevel()
+        while heap:
+            price = sign * heap[0]
+            if price in depth:
+                return price
+            heapq.heappop(heap) # Level was emptied since it was pushed
+        return None
 
     def _update_depth(self, direction : Direction, price, delta):
         '''
@@ -232,16 +299,183 @@ class OrderBookL1:
         price: price of share to be udpated
         delta: change in quantity
         '''
+        self._invalidate_external(direction, price)
+
         if direction is Direction.BUY:
+            if price not in self._bid_depth and delta > 0: # A new level is created
+                self._push_level(self._bid_heap, self._bid_depth, -1, price)
             self._bid_depth[price] += delta
             if self._bid_depth[price] <= 0:
                 del self._bid_depth[price]
 
         elif direction is Direction.SELL:
+            if price not in self._ask_depth and delta > 0:
+                self._push_level(self._ask_heap, self._ask_depth, 1, price)
             self._ask_depth[price] += delta
             if self._ask_depth[price] <= 0:
                 del self._ask_depth[price]
 
+    def _update_agent_qty(self, direction : Direction, price, delta):
+        '''
+        Increments the agent's own quantity resting at price by delta.
+        Parameters
+        direction (Direction): side of the agent's order
+        price: price of the agent's order
+        delta: change in quantity
+        '''
+        agent_qty = self._agent_bid_qty if direction is Direction.BUY else self._agent_ask_qty
+        qty = agent_qty.get(price, 0) + delta
+        if qty > 0:
+            agent_qty[price] = qty
+        else:
+            agent_qty.pop(price, None)
+        self._invalidate_external(direction, price)
+
+    def _invalidate_external(self, direction : Direction, price):
+        '''
+        Marks the cached external best of a side as stale if a change at
+        price could affect it.
+        Parameters
+        direction (Direction): side of the book that changed
+        price: price level that changed
+        '''
+        if direction is Direction.BUY:
+            if self._ext_bid is None or price >= self._ext_bid:
+                self._ext_bid_valid = False
+        elif direction is Direction.SELL:
+            if self._ext_ask is None or price <= self._ext_ask:
+                self._ext_ask_valid = False
+
+    def _best_external_price(self, direction):
+        '''
+        Walks one side from the top until reaching a level with external
+        (non-agent) quantity. Only levels held purely by the agent are passed
+        over, and they are pushed back onto the heap afterwards.
+        Parameters
+        direction (Direction): the side of the book to inspect
+        Returns
+        the best external price on that side, or None if there is none
+        '''
+        if direction is Direction.BUY:
+            heap, depth, agent_qty, sign = self._bid_heap, self._bid_depth, self._agent_bid_qty, -1
+        else:
+            heap, depth, agent_qty, sign = self._ask_heap, self._ask_depth, self._agent_ask_qty, 1
+
+        best = None
+        passed = [] # heap keys of agent-only levels
+        while heap:
+            price = sign * heap[0]
+            if price not in depth:
+                heapq.heappop(heap) # Stale entry for an emptied level
+            elif depth[price] - agent_qty.get(price, 0) > 0:
+                best = price
+                break
+            else:
+                passed.append(heapq.heappop(heap))
+        for key in passed:
+            heapq.heappush(heap, key)
+        return best
+
+    @staticmethod
+    def _push_level(heap, depth, sign, price):
+        '''
+        Pushes a new price level onto a side's heap. Stale entries below the
+        top are never popped, so the heap is rebuilt from the live levels once
+        it grows well beyond them, keeping memory bounded over a full day.
+        Parameters
+        heap (list): the heap of that side
+        depth (dict): the depth map of that side
+        sign (int): -1 for bids (stored negated), 1 for asks
+        price: price of the new level
+        '''
+        if len(heap) > 2 * len(depth) + 64:
+            heap[:] = [sign * p for p in depth]
+            heapq.heapify(heap)
+        heapq.heappush(heap, sign * price)
+
+    def warning_counts(self) -> Dict[str, int]:
+        '''
+        Returns how many events were skipped or clipped since the last reset.
+        Returns
+        dict[str, int]: unknown_oid and negative_quantity counts
+        '''
+        return dict(unknown_oid=self.num_unknown_oid,
+                    negative_quantity=self.num_negative_quantity)
+
+    def agent_fill_size(self, agent_oid: int, size: int) -> int:
+        '''
+        Returns how many shares of a trade that reached the price of one
+        of the agent's quotes fill it. A level one book has no queue
+        position, so the whole trade does.
+        Parameters
+        agent_oid (int): the agent's order id
+        size (int): number of shares traded
+        Returns
+        int: size
+        '''
+        return size
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        '''
+        Returns the full state of the book as NumPy arrays (live orders,
+        depth, top of book and the agent's quotes), e.g. to save with
+        np.savez and restore later with set_state. Prices are int64 for
+        a book in ticks and float64 otherwise.
+        Returns
+        dict[str, np.ndarray]
+        '''
+        orders = self._orders
+        price_dtype = np.int64 if self.ticks else np.float64
+        state = dict(
+            order_oid = np.fromiter(orders, dtype=np.int64, count=len(orders)),
+            order_direction = np.fromiter((r.direction.value for r in orders.values()),
+                                          dtype=np.int8, count=len(orders)),
+            order_price = np.fromiter((r.price for r in orders.values()),
+                                      dtype=price_dtype, count=len(orders)),
+            order_quantity = np.fromiter((r.quantity for r in orders.values()),
+                                         dtype=np.int64, count=len(orders)),
+            top = np.array([self.best_bid.price, self.best_bid.quantity,
+                            self.best_ask.price, self.best_ask.quantity], dtype=price_dtype),
+            next_agent_oid = np.array(self._next_agent_oid, dtype=np.int64),
+        )
+        for name, levels in (('bid_depth', self._bid_depth), ('ask_depth', self._ask_depth),
+                             ('agent_bid', self._agent_bid_qty), ('agent_ask', self._agent_ask_qty)):
+            state[f'{name}_price'] = np.fromiter(levels.keys(), dtype=price_dtype, count=len(levels))
+            state[f'{name}_quantity'] = np.fromiter(levels.values(), dtype=np.int64, count=len(levels))
+        return state
+
+    def set_state(self, state: Dict[str, np.ndarray]) -> None:
+        '''
+        Replaces the contents of the book with a state from get_state.
+        Parameters
+        state (dict[str, np.ndarray]): the saved state
+        '''
+        self.__init__(self.ticks)
+        record_cls = self._record_cls
+        directions = {d.value: d for d in Direction}
+        for oid, direction, price, quantity in zip(state['order_oid'].tolist(),
+                                                   state['order_direction'].tolist(),
+                                                   state['order_price'].tolist(),
+                                                   state['order_quantity'].tolist()):
+            self._orders[oid] = record_cls(direction = directions[direction], price = price,
+                                           quantity = quantity)
+
+        for name, levels in (('bid_depth', self._bid_depth), ('ask_depth', self._ask_depth),
+                             ('agent_bid', self._agent_bid_qty), ('agent_ask', self._agent_ask_qty)):
+            levels.update(zip(state[f'{name}_price'].tolist(), state[f'{name}_quantity'].tolist()))
+        self._bid_heap = [-p for p in self._bid_depth]
+        self._ask_heap = list(self._ask_depth)
+        heapq.heapify(self._bid_heap)
+        heapq.heapify(self._ask_heap)
+
+        bid_price, bid_quantity, ask_price, ask_quantity = state['top'].tolist()
+        self.best_bid.price, self.best_bid.quantity = bid_price, int(bid_quantity)
+        self.best_ask.price, self.best_ask.quantity = ask_price, int(ask_quantity)
+        self._next_agent_oid = int(state['next_agent_oid'])
+
+        # The external bests are recomputed on the next request
+        self._ext_bid_valid = self._ext_ask_valid = False
+
     def snapshot(self) -> dict:
         '''
         Returns the current relevant information in the book.
@@ -255,30 +489,33 @@ class OrderBookL1:
             mid  = self.midprice()
         )
 
-    def mid_external(self) -> float | None:
-        # ---- find best external bid -----------------------------------
-        bid_price = None
-        for price in sorted(self._bid_depth, reverse=True):
-            ext_qty = self._bid_depth[price] - sum(
-                rec.quantity for oid, rec in self._orders.items()
-                if oid < 0 and rec.direction is Direction.BUY and rec.price == price
-            )
-            if ext_qty > 0:
-                bid_price = price
-                break
-
-        # ---- find best external ask -----------------------------------
-        ask_price = None
-        for price in sorted(self._ask_depth):
-            ext_qty = self._ask_depth[price] - sum(
-                rec.quantity for oid, rec in self._orders.items()
-                if oid < 0 and rec.direction is Direction.SELL and rec.price == price
-            )
-            if ext_qty > 0:
-                ask_price = price
-                break
+    def external_top(self) -> tuple:
+        '''
+        Returns the best bid and ask prices of the book ignoring the
+        agent's own quotes. The best external bid and ask are cached
+        between events, so this is O(1) amortized rather than a scan over
+        every level and order.
+        Returns
+        (float or None, float or None): best external bid and ask in
+            the book's price unit, None on a side with no external orders
+        '''
+        if not self._ext_bid_valid:
+            self._ext_bid = self._best_external_price(Direction.BUY)
+            self._ext_bid_valid = True
+        if not self._ext_ask_valid:
+            self._ext_ask = self._best_external_price(Direction.SELL)
+            self._ext_ask_valid = True
+        return self._ext_bid, self._ext_ask
 
-        # ---- if either side missing, return previous mid, else average
+    def mid_external(self) -> float | None:
+        '''
+        Returns the midprice of the book ignoring the agent's own quotes.
+        Returns
+        float: the external midprice in dollars (ticks for a book in ticks),
+            or None if either side has no external orders or the external
+            book is crossed
+        '''
+        bid_price, ask_price = self.external_top()
         if bid_price is None or ask_price is None or bid_price >= ask_price:
             return None
         return (bid_price + ask_price) / 2
@@ -290,6 +527,6 @@ class OrderBookL1:
         Parameters:
         None
         Returns:
-        float: the current midprice in dollars
+        float: the current midprice in dollars (ticks for a book in ticks)
         '''
         return (self.best_bid.price + self.best_ask.price) / 2
\ No newline at end of file
@@ -0,0 +1,259 @@
+'''
+order_book_l3.py
+Defines a full-depth (level three) order book, which keeps every resting
+order in a first-in-first-out queue per price level so that the agent's
+quotes are filled with price-time priority rather than whenever a trade
+reaches their price.
+'''
+
+from lob_market_making_sim.core.order_book import OrderBookL1, OrderRec
+from lob_market_making_sim.io.schema import Direction, EventType, TICK_SIZE, TICKS_PER_CENT
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+@dataclass(slots=True)
+class QueueRec(OrderRec):
+    '''
+    Record of an order that also links it into the queue of its price
+    level (an intrusive doubly linked list).
+    '''
+    oid: int = 0
+    seq: int = 0 # arrival number, orders with a lower seq are ahead
+    prev: Optional['QueueRec'] = None
+    next: Optional['QueueRec'] = None
+
+class OrderBookL3(OrderBookL1):
+    '''
+    A level three order book. On top of the aggregated depth of
+    OrderBookL1 (whose top of book, midprices and agent quote handling it
+    shares) each price level holds its orders in arrival order, and the
+    volume queued ahead of each of the agent's quotes is tracked.
+
+    A trade at the agent's price only fills the agent if the executed
+    order arrived after the agent's quote, i.e. the queue has been worked
+    through past it. A trade at a worse price than the agent's quote
+    fills the agent, since the quote would have been matched first.
+
+    Agent prices are compared on the cent grid, like the fill check of
+    ReplayEngine, so an off-grid dollar quote (e.g. 183.2437) queues
+    behind the orders at its cent (183.24) and the same strategy passes
+    the same trades on to the book in L1 and L3.
+    '''
+
+    _record_cls = QueueRec
+
+    def __init__(self, ticks: bool = False):
+        super().__init__(ticks)
+
+        # First and last order of each (direction, price) level. Orders are
+        # found by oid in _orders and linked through their records, so an
+        # order is appended or unlinked in O(1).
+        self._head: Dict[Tuple[Direction, float], QueueRec] = {}
+        self._tail: Dict[Tuple[Direction, float], QueueRec] = {}
+
+        # Arrival counter. Orders that were resting before the replay started
+        # are unknown and count as older than all.
+        self._next_seq = 0
+
+        # External shares queued ahead of each agent order (key: agent oid)
+        self._ahead: Dict[int, int] = {}
+
+        # Shares of the last external trade that reached each agent order
+        self._fillable: Dict[int, int] = {}
+
+    def apply_values(self, etype: EventType, oid: int, size: int, price: float,
+                     direction: Direction):
+        '''
+        Same as OrderBookL1.apply_values, also keeping the level queues and
+        the agent's queue positions up to date.
+        Returns
+        the number of events processed
+        '''
+        rec = self._orders.get(oid)
+        is_agent = oid < 0 and etype is not EventType.CROSS
+        if not is_agent:
+            if self._fillable:
+                self._fillable.clear()
+            if self._ahead and etype is not EventType.ADD: # arrivals queue behind us
+                self._track_agent_queues(etype, oid, size, price, direction, rec)
+
+        processed = OrderBookL1.apply_values(self, etype, oid, size, price, direction)
+
+        if rec is None:
+            if etype is EventType.ADD: # a new order joins the back of its level
+                rec = self._orders[oid]
+                rec.oid = oid
+                rec.seq = self._next_seq
+                self._next_seq += 1
+                level = (direction, price)
+                tail = self._tail.get(level)
+                rec.prev = tail
+                if tail is None:
+                    self._head[level] = rec
+                else:
+                    tail.next = rec
+                self._tail[level] = rec
+
+                if is_agent:
+                    depth = self._bid_depth if direction is Direction.BUY else self._ask_depth
+                    agent_qty = self._agent_bid_qty if direction is Direction.BUY else self._agent_ask_qty
+                    level_price = self._grid_price(price)
+                    self._ahead[oid] = depth.get(level_price, 0) - agent_qty.get(level_price, 0)
+        elif oid not in self._orders: # fully executed or deleted
+            self._dequeue(rec)
+        return processed
+
+    def _cents(self, price):
+        '''
+        Returns the key prices are compared on: cents as in
+        ReplayEngine.ticks, or the integer tick itself in tick mode, where
+        the engine compares prices exactly.
+        '''
+        return price if self.ticks else round(price * 100)
+
+    def _grid_price(self, price):
+        '''
+        Returns the price of the external level at the agent's cent, in
+        the form events carry it (dollars decoded from ticks).
+        '''
+        return price if self.ticks else round(price * 100) * TICKS_PER_CENT * TICK_SIZE
+
+    def _track_agent_queues(self, etype, oid, size, price, direction, rec):
+        '''
+        Moves the agent's quotes up their queues when an order ahead of them
+        is executed or cancelled, and records how much of a trade reaches them.
+        '''
+        seq = rec.seq if rec is not None else None
+        cents = self._cents(price)
+        for agent_oid, ahead in self._ahead.items():
+            agent_rec = self._orders[agent_oid]
+            if agent_rec.direction is not direction:
+                continue
+            agent_seq = agent_rec.seq
+            agent_cents = self._cents(agent_rec.price)
+
+            if etype is EventType.EXECUTE_VISIBLE or etype is EventType.CROSS:
+                if cents == agent_cents:
+                    if seq is None or seq < agent_seq:
+                        if rec is not None: # an order ahead of us traded
+                            self._ahead[agent_oid] = max(ahead - size, 0)
+                    else: # the queue was worked through past us
+                        self._fillable[agent_oid] = size
+                elif (cents < agent_cents if direction is Direction.BUY
+                      else cents > agent_cents): # traded through our price
+                    self._fillable[agent_oid] = size
+
+            elif etype is EventType.CANCEL or etype is EventType.DELETE:
+                if rec is not None and cents == agent_cents and seq < agent_seq:
+                    cancelled = size if etype is EventType.CANCEL else rec.quantity
+                    self._ahead[agent_oid] = max(ahead - cancelled, 0)
+
+    def _dequeue(self, rec: QueueRec):
+        '''
+        Unlinks an order from its price level.
+        '''
+        level = (rec.direction, rec.price)
+        prev, nxt = rec.prev, rec.next
+        rec.prev = rec.next = None
+        self._ahead.pop(rec.oid, None)
+
+        if prev is None:
+            if nxt is None:
+                del self._head[level]
+            else:
+                self._head[level] = nxt
+        else:
+            prev.next = nxt
+
+        if nxt is None:
+            if prev is None:
+                del self._tail[level]
+            else:
+                self._tail[level] = prev
+        else:
+            nxt.prev = prev
+
+    def get_state(self) -> Dict[str, np.ndarray]:
+        '''
+        Same as OrderBookL1.get_state, plus the arrival numbers that order
+        the queues and the volume ahead of the agent's quotes.
+        '''
+        state = super().get_state()
+        state['order_seq'] = np.fromiter((r.seq for r in self._orders.values()),
+                                         dtype=np.int64, count=len(self._orders))
+        state['next_seq'] = np.array(self._next_seq, dtype=np.int64)
+        state['ahead_oid'] = np.fromiter(self._ahead.keys(), dtype=np.int64, count=len(self._ahead))
+        state['ahead_quantity'] = np.fromiter(self._ahead.values(), dtype=np.int64,
+                                              count=len(self._ahead))
+        return state
+
+    def set_state(self, state: Dict[str, np.ndarray]) -> None:
+        '''
+        Same as OrderBookL1.set_state, also rebuilding the level queues.
+        '''
+        super().set_state(state)
+        for oid, seq in zip(state['order_oid'].tolist(), state['order_seq'].tolist()):
+            rec = self._orders[oid]
+            rec.oid, rec.seq = oid, seq
+        for rec in sorted(self._orders.values(), key=lambda r: r.seq):
+            level = (rec.direction, rec.price)
+            tail = self._tail.get(level)
+            rec.prev = tail
+            if tail is None:
+                self._head[level] = rec
+            else:
+                tail.next = rec
+            self._tail[level] = rec
+        self._next_seq = int(state['next_seq'])
+        self._ahead = dict(zip(state['ahead_oid'].tolist(), state['ahead_quantity'].tolist()))
+
+    def agent_fill_size(self, agent_oid: int, size: int) -> int:
+        '''
+        Returns how many shares of the last trade reached the agent's order.
+        Parameters
+        agent_oid (int): the agent's order id
+        size (int): number of shares traded
+        Returns
+        int: size if the trade went through the agent's price or hit an
+            order queued behind the agent's, otherwise 0
+        '''
+        return min(self._fillable.get(agent_oid, 0), size)
+
+    def queue(self, direction: Direction, price: float) -> List[Tuple[int, int]]:
+        '''
+        Returns the orders resting at one price level.
+        Parameters
+        direction (Direction): side of the book
+        price (float): price of the level
+        Returns
+        list[(int, int)]: (oid, quantity) pairs in time priority
+        '''
+        orders = []
+        rec = self._head.get((direction, price))
+        while rec is not None:
+            orders.append((rec.oid, rec.quantity))
+            rec = rec.next
+        return orders
+
+    def volume_ahead(self, oid: int) -> int:
+        '''
+        Returns the number of shares queued ahead of a resting order at
+        its price level, which for the agent's own orders is kept up to date
+        as events arrive and for other orders is counted from the queue.
+        Parameters
+        oid (int): id of a resting order
+        Returns
+        int: shares of the orders ahead of oid
+        Raises
+        KeyError
+            If oid is not resting in the book
+        '''
+        if oid in self._ahead:
+            return self._ahead[oid]
+        volume = 0
+        rec = self._orders[oid].prev
+        while rec is not None:
+            volume += rec.quantity
+            rec = rec.prev
+        return volume
@@ -0,0 +1,206 @@
+'''
+profiler.py
+Opt-in instrumentation of a replay: wall time and calls per stage (book
+updates, midprice, strategy, quote updates, ...), event throughput over
+time and counts of skipped events.
+
+Stages are measured by replacing methods of the book, engine, strategy
+or environment with timed wrappers on the instance, so nothing is timed
+(and nothing costs anything) unless a Profiler is passed in. Times are
+exclusive: a stage called from inside another (e.g. the book update made
+when the engine places a quote) is not counted twice.
+
+Usage
+profiler = Profiler()
+engine = ReplayEngine(OrderBookL1(), strategy, profiler=profiler)
+engine.run(events)
+print(profiler.summary())
+'''
+
+import time
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+# Events between two throughput samples
+DEFAULT_SAMPLE_EVERY = 10_000
+
+class Profiler:
+    '''
+    Cumulative time and calls per stage, counters and throughput samples.
+    '''
+
+    def __init__(self, sample_every: int = DEFAULT_SAMPLE_EVERY):
+        '''
+        Parameters
+        sample_every (int): events between two throughput samples
+        '''
+        self.sample_every = sample_every
+        self.stages: Dict[str, List[float]] = {} # name -> [seconds, calls]
+        self.counters: Dict[str, int] = {}
+        self.throughput: List[tuple] = [] # (seconds since start, events, events/s)
+        self._inner = 0.0 # time spent in stages called by the running one
+        self._instrumented = [] # (object, method name) replaced on instances
+        self._start = time.perf_counter()
+        self._events = 0
+        self._last_sample = (self._start, 0)
+
+    def instrument(self, obj, method: str, stage: str, between: Optional[str] = None,
+                   per_event: bool = False) -> None:
+        '''
+        Times every call of obj.method as stage, by shadowing the method
+        with a timed wrapper on the instance. Instrumenting the same
+        method twice has no effect.
+        Parameters
+        obj: the instance (book, engine, strategy, environment, ...)
+        method (str): name of the method
+        stage (str): name the time is reported under
+        between (str): also report the time from the end of one call to
+            the start of the next under this name (e.g. the RL policy
+            between two env.step calls)
+        per_event (bool): each call replays one event (see mark)
+        '''
+        if obj is None or any(o is obj and m == method for o, m in self._instrumented):
+            return
+        fn = getattr(obj, method)
+        record = self.stages.setdefault(stage, [0.0, 0])
+        gap = self.stages.setdefault(between, [0.0, 0]) if between is not None else None
+        perf_counter = time.perf_counter
+        last_end = None
+
+        def timed(*args, **kwargs):
+            nonlocal last_end
+            outer = self._inner
+            self._inner = 0.0
+            start = perf_counter()
+            if gap is not None and last_end is not None:
+                gap[0] += start - last_end
+                gap[1] += 1
+            result = fn(*args, **kwargs)
+            end = perf_counter()
+            elapsed = end - start
+            record[0] += elapsed - self._inner
+            record[1] += 1
+            self._inner = outer + elapsed
+            last_end = end
+            if per_event:
+                self.mark(1)
+            return result
+
+        setattr(obj, method, timed)
+        self._instrumented.append((obj, method))
+
+    def remove(self) -> None:
+        '''
+        Restores every instrumented method. Recorded times are kept.
+        '''
+        for obj, method in self._instrumented:
+            delattr(obj, method)
+        self._instrumented.clear()
+
+    def merge(self, other: 'Profiler') -> None:
+        '''
+        Adds the times, counters and events of another profiler (e.g. of
+        another environment) to this one.
+        '''
+        for stage, (seconds, calls) in other.stages.items():
+            self.add(stage, seconds, calls)
+        for name, n in other.counters.items():
+            self.count(name, n)
+        self._events += other._events
+        self._start = min(self._start, other._start) # perf_counter is system-wide on Linux
+
+    def __getstate__(self):
+        # Instrumented objects stay behind, e.g. when an environment in a
+        # subprocess sends its profiler back
+        state = self.__dict__.copy()
+        state['_instrumented'] = []
+        return state
+
+    def add(self, stage: str, seconds: float, calls: int = 1) -> None:
+        '''
+        Adds time measured outside an instrumented method to a stage.
+        '''
+        record = self.stages.setdefault(stage, [0.0, 0])
+        record[0] += seconds
+        record[1] += calls
+
+    def count(self, name: str, n: int = 1) -> None:
+        '''
+        Increments a counter.
+        '''
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def mark(self, events: int) -> None:
+        '''
+        Records that events more events were replayed, and takes a
+        throughput sample once sample_every events have passed since the
+        last one.
+        '''
+        self._events += events
+        last_time, last_events = self._last_sample
+        if self._events - last_events >= self.sample_every:
+            now = time.perf_counter()
+            rate = (self._events - last_events) / (now - last_time) if now > last_time else 0.0
+            self.throughput.append((now - self._start, self._events, rate))
+            self._last_sample = (now, self._events)
+
+    @property
+    def events(self) -> int:
+        return self._events
+
+    @property
+    def elapsed(self) -> float:
+        '''
+        Seconds since the profiler was created.
+        '''
+        return time.perf_counter() - self._start
+
+    def summary(self) -> pd.DataFrame:
+        '''
+        Returns one row per stage: calls, total seconds, mean microseconds
+        per call and share of the wall time since the profiler was created.
+        '''
+        elapsed = self.elapsed
+        rows = [dict(stage=stage, calls=calls, seconds=seconds,
+                     mean_us=1e6 * seconds / calls if calls else 0.0,
+                     share=seconds / elapsed)
+                for stage, (seconds, calls) in self.stages.items()]
+        return pd.DataFrame(rows, columns=['stage', 'calls', 'seconds', 'mean_us', 'share'])
+
+    def throughput_frame(self) -> pd.DataFrame:
+        '''
+        Returns the throughput samples (seconds, events, events_per_sec).
+        '''
+        return pd.DataFrame(self.throughput, columns=['seconds', 'events', 'events_per_sec'])
+
+    def scalars(self, prefix: str = 'profile/') -> Dict[str, float]:
+        '''
+        Returns the profile as flat scalars, e.g. to log to TensorBoard:
+        seconds and mean microseconds per stage, counters and the overall
+        and latest events per second.
+        '''
+        values = {}
+        for stage, (seconds, calls) in self.stages.items():
+            values[f'{prefix}{stage}_seconds'] = seconds
+            values[f'{prefix}{stage}_mean_us'] = 1e6 * seconds / calls if calls else 0.0
+        for name, n in self.counters.items():
+            values[f'{prefix}{name}'] = n
+        values[f'{prefix}events_per_sec'] = self._events / self.elapsed
+        if self.throughput:
+            values[f'{prefix}events_per_sec_latest'] = self.throughput[-1][2]
+        return values
+
+    def write_tensorboard(self, log_dir, step: Optional[int] = None) -> None:
+        '''
+        Writes scalars() as TensorBoard scalars into log_dir (e.g. the
+        ./logs folder of the DQN runs).
+        Parameters
+        log_dir (str or pathlib.Path): TensorBoard log folder
+        step (int): global step of the values, by default the number of events
+        '''
+        from torch.utils.tensorboard import SummaryWriter # stable-baselines3 dependency
+        step = self._events if step is None else step
+        with SummaryWriter(str(log_dir)) as writer:
+            for name, value in self.scalars().items():
+                writer.add_scalar(name, value, step)
@@ -0,0 +1,170 @@
+'''
+recorder.py
+Column-wise records of a replay (quotes, midprices) kept in typed NumPy
+arrays instead of Python lists of tuples, so a full day costs a few
+bytes per value and converts to Arrow or pandas without copying.
+'''
+
+from typing import Dict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Rows kept as Python tuples before being converted to arrays in one go
+DEFAULT_FLUSH_SIZE = 4096
+
+class Recorder:
+    '''
+    Appends rows of scalars into one growable NumPy array per column.
+
+    Rows are buffered briefly and written column-wise in blocks, and
+    the arrays double in size when full (or are allocated up front with
+    reserve), so appending stays cheap and the record of a run is a
+    contiguous array per column. With every > 1, only every n-th row
+    is kept.
+    '''
+
+    def __init__(self, columns: Dict[str, np.dtype], every: int = 1,
+                 capacity: int = 0, flush_size: int = DEFAULT_FLUSH_SIZE):
+        '''
+        Parameters
+        columns (dict[str, np.dtype]): name and dtype of each column, in
+            the order values are passed to append
+        every (int): keep one row out of every `every` appended
+        capacity (int): number of rows to allocate up front
+        flush_size (int): number of rows buffered before writing them
+        '''
+        if every < 1:
+            raise ValueError(f'every must be at least 1, got {every}')
+        self.names = tuple(columns)
+        self.every = every
+        self._flush_size = flush_size
+        self._arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in columns.items()}
+        self._size = 0 # rows written to the arrays
+        self._pending = [] # values of the rows not yet written, row after row
+        self._room = flush_size # rows that can be buffered before a flush
+        self._skip = 0 # rows to drop before the next kept one
+
+    def append(self, *row) -> None:
+        '''
+        Records one row, one value per column.
+        '''
+        self._pending += row
+        self._room -= 1
+        if not self._room:
+            self._flush()
+
+    def extend(self, *columns) -> None:
+        '''
+        Records many rows at once, given column-wise (one sequence or
+        array per column, all of the same length).
+        '''
+        self._flush()
+        n = len(columns[0])
+        start = self._skip if self.every > 1 else 0
+        kept = len(range(start, n, self.every))
+        self._skip = (self._skip - n) % self.every
+        self._grow_for(self._size + kept)
+        for values, array in zip(columns, self._arrays.values()):
+            array[self._size:self._size + kept] = np.asarray(values)[start::self.every]
+        self._size += kept
+
+    def reserve(self, rows: int) -> None:
+        '''
+        Makes room for `rows` more kept rows without further allocations.
+        '''
+        buffered = len(self._pending) // len(self.names)
+        self._grow(self._size + -(-(buffered + rows) // self.every))
+
+    def clear(self) -> None:
+        '''
+        Drops every row, keeping the allocated arrays.
+        '''
+        self._size = 0
+        self._pending.clear()
+        self._room = self._flush_size
+        self._skip = 0
+
+    def __len__(self):
+        self._flush()
+        return self._size
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        '''
+        Returns the recorded values of one column (a view, valid until
+        the recorder is cleared).
+        '''
+        self._flush()
+        return self._arrays[name][:self._size]
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        '''
+        Returns every column, as views of the recorded values.
+        '''
+        self._flush()
+        return {name: array[:self._size] for name, array in self._arrays.items()}
+
+    def rows(self) -> list:
+        '''
+        Returns the record as a list of tuples of Python scalars.
+        '''
+        return list(zip(*(column.tolist() for column in self.columns().values())))
+
+    def to_arrow(self) -> pa.Table:
+        '''
+        Returns the record as an Arrow table sharing memory with the
+        recorder's arrays. NaN values stay NaN rather than null.
+        '''
+        columns = self.columns()
+        return pa.table([pa.array(column) for column in columns.values()],
+                        names=list(columns))
+
+    def to_pandas(self) -> pd.DataFrame:
+        '''
+        Returns the record as a DataFrame sharing memory with the
+        recorder's arrays.
+        '''
+        return pd.DataFrame(self.columns(), copy=False)
+
+    def _flush(self) -> None:
+        '''
+        Writes the buffered rows (after decimation) to the arrays.
+        '''
+        pending = self._pending
+        if not pending:
+            return
+        # Each column is converted with its own dtype, so integer columns
+        # (e.g. cash in ticks) are never rounded through float64
+        n = len(self.names)
+        rows = len(pending) // n
+        first = self._skip if self.every > 1 else 0
+        kept = len(range(first, rows, self.every))
+        self._skip = (self._skip - rows) % self.every
+
+        start, stop = self._size, self._size + kept
+        self._grow_for(stop)
+        step = n * self.every
+        for i, array in enumerate(self._arrays.values()):
+            array[start:stop] = np.array(pending[first * n + i::step], dtype=array.dtype)
+        pending.clear()
+        self._room = self._flush_size
+        self._size = stop
+
+    def _grow_for(self, rows: int) -> None:
+        '''
+        Makes room for rows rows, at least doubling the arrays if they are full.
+        '''
+        capacity = len(self._arrays[self.names[0]])
+        if rows > capacity:
+            self._grow(max(rows, 2 * capacity))
+
+    def _grow(self, capacity: int) -> None:
+        '''
+        Reallocates the arrays to hold at least capacity rows.
+        '''
+        if capacity <= len(self._arrays[self.names[0]]):
+            return
+        for name, array in self._arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            self._arrays[name] = grown
@@ -0,0 +1,241 @@
+'''
+backtest.py
+Backtests one market maker on every LOBSTER day found under a data
+folder, one (ticker, day) shard per job, in a process pool.
+
+Each job writes its results as Parquet files in a hive-style layout
+(see ArrowStore), and a shard counts as done once its summary file
+exists. Files are written under a temporary name and then renamed, so a
+run that crashed or was interrupted can be started again and only
+replays the shards that are missing.
+
+results/
+    summary/ticker=AMZN/date=2012-06-21/part-0.parquet   one row per shard
+    quotes/ticker=AMZN/date=2012-06-21/part-0.parquet    every agent quote
+
+To run: poetry run python -m lob_market_making_sim.evaluation.backtest data \
+    --gamma 0.1 --kappa 1.5 --sigma 0.002 --qmax 100 --out results --workers 4
+'''
+
+import argparse
+import dataclasses
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from lob_market_making_sim.core.engine import ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.evaluation.sweep import summarize
+from lob_market_making_sim.evaluation.vol import EWMAVolEstimator
+from lob_market_making_sim.io.cache import cached_lobster_to_arrow
+from lob_market_making_sim.io.loader import arrow_to_columns, discover_days, lobster_to_arrow
+from lob_market_making_sim.io.store import ArrowStore, PART_NAME
+from lob_market_making_sim.models.avellaneda import ASParams, AvellanedaStoikov, AdaptiveAvellanedaStoikov
+from lob_market_making_sim.models.base import MarketMaker
+
+SUMMARY_TABLE = "summary"
+QUOTES_TABLE = "quotes"
+
+# Types of the summary columns, so every shard writes the same schema
+# (cash is an int until the first fill)
+SUMMARY_TYPES = {
+    "strategy": pa.string(),
+    "events": pa.int64(),
+    "seconds": pa.float64(),
+    "cash": pa.float64(),
+    "inventory": pa.int64(),
+    "filled_buy": pa.int64(),
+    "filled_sell": pa.int64(),
+    "final_mid": pa.float64(),
+    "pnl": pa.float64(),
+}
+
+# Partition columns of the hive layout, read back as plain strings
+PARTITIONING = ds.partitioning(pa.schema([("ticker", pa.string()), ("date", pa.string())]),
+                               flavor="hive")
+
+def shard_path(out_dir: str | Path, table: str, ticker: str, date: str) -> Path:
+    '''
+    Returns the Parquet file of one table of one shard.
+    '''
+    return Path(out_dir) / table / f"ticker={ticker}" / f"date={date}" / PART_NAME
+
+def completed_shards(out_dir: str | Path) -> set[tuple[str, str]]:
+    '''
+    Returns the (ticker, date) shards whose summary has been written.
+    '''
+    done = set()
+    for path in (Path(out_dir) / SUMMARY_TABLE).glob(f"ticker=*/date=*/{PART_NAME}"):
+        done.add((path.parent.parent.name.split("=", 1)[1], path.parent.name.split("=", 1)[1]))
+    return done
+
+def load_results(out_dir: str | Path, table: str = SUMMARY_TABLE) -> pd.DataFrame:
+    '''
+    Reads one table of every completed shard.
+    Parameters
+    out_dir (str or pathlib.Path): output folder of run_backtest
+    table (str): SUMMARY_TABLE or QUOTES_TABLE
+    Returns
+    pd.DataFrame: the rows of every shard, with ticker and date columns
+    '''
+    folder = Path(out_dir) / table
+    if not folder.is_dir():
+        return pd.DataFrame()
+    # Temporary files of unfinished writes start with a dot and are ignored
+    dataset = ds.dataset(folder, format="parquet", partitioning=PARTITIONING)
+    frame = dataset.to_table().to_pandas()
+    columns = ["ticker", "date"] + [c for c in frame.columns if c not in ("ticker", "date")]
+    return frame[columns].sort_values(["ticker", "date"], kind="stable").reset_index(drop=True)
+
+def _write_part(table: pa.Table, path: Path) -> Path:
+    '''
+    Writes a table through an ArrowStore under a temporary name, then
+    renames it, so the file either exists complete or not at all.
+    '''
+    store = ArrowStore(table.schema)
+    store.add_batch(table)
+    tmp_path = path.with_name(f".{path.stem}.{os.getpid()}.tmp")
+    store.flush(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+def _summary_table(row: dict) -> pa.Table:
+    '''
+    One-row table of a shard summary, with the types of SUMMARY_TYPES.
+    '''
+    return pa.table({name: pa.array([value], type=SUMMARY_TYPES.get(name))
+                     for name, value in row.items()})
+
+def _run_shard(msg_path: str, ticker: str, date: str, strategy: MarketMaker,
+               out_dir: str, quote_size: int, record_quotes: bool,
+               cache_dir: Optional[str]) -> dict:
+    '''
+    Worker: replays one day and writes its quotes and summary.
+    '''
+    start = time.perf_counter()
+    if cache_dir is not None:
+        table = cached_lobster_to_arrow(msg_path, cache_dir)
+    else:
+        table = lobster_to_arrow(msg_path)
+    events = arrow_to_columns(table)
+
+    strategy.reset()
+    # Strategies that read an online volatility estimate need the engine to feed it
+    engine = ReplayEngine(OrderBookL1(), strategy,
+                          vol_estimator=getattr(strategy, "estimator", None))
+    engine.QUOTE_SIZE = quote_size
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # unknown oids from pre-open orders
+        engine.run(events)
+
+    row = dict(strategy=type(strategy).__name__, events=len(events),
+               seconds=time.perf_counter() - start, **summarize(engine))
+    params = getattr(strategy, "params", None)
+    if dataclasses.is_dataclass(params):
+        row.update(dataclasses.asdict(params))
+
+    if record_quotes and len(engine.quotes):
+        path = shard_path(out_dir, QUOTES_TABLE, ticker, date)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_part(engine.quotes.to_arrow(), path)
+    # The summary is written last: its file marks the shard as done
+    path = shard_path(out_dir, SUMMARY_TABLE, ticker, date)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    _write_part(_summary_table(row), path)
+    return row
+
+def run_backtest(data_root: str | Path, strategy: MarketMaker, out_dir: str | Path, *,
+                 tickers: Optional[Iterable[str]] = None,
+                 dates: Optional[Iterable[str]] = None,
+                 max_workers: int | None = None,
+                 quote_size: int = 10,
+                 record_quotes: bool = True,
+                 resume: bool = True,
+                 cache_dir: str | Path | None = None) -> pd.DataFrame:
+    '''
+    Backtests a strategy on every (ticker, day) found under data_root,
+    one job per shard, in a process pool.
+    Parameters
+    data_root (str or pathlib.Path): folder holding the LOBSTER message files
+    strategy (MarketMaker): the strategy; each job replays a fresh copy of it,
+        so it must be picklable
+    out_dir (str or pathlib.Path): output folder of the Parquet results
+    tickers, dates (Iterable[str]): restrict the shards, see discover_days
+    max_workers (int): number of processes, or None for one per core
+    quote_size (int): shares per agent quote
+    record_quotes (bool): also write every agent quote of each shard
+    resume (bool): skip the shards already completed in out_dir, instead
+        of replaying and overwriting them
+    cache_dir (str or pathlib.Path): parse the message files through an
+        EventCache in this folder, or None to parse the CSV every time
+    Returns
+    pd.DataFrame: the summaries of every completed shard, including the
+        ones skipped because they were done before
+    '''
+    days = discover_days(data_root, tickers, dates)
+    done = completed_shards(out_dir) if resume else set()
+    todo = [(ticker, date, path) for ticker, date, path in days if (ticker, date) not in done]
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            # Jobs are submitted ticker by ticker, so a worker tends to
+            # stay on one symbol while the pool drains
+            futures = [pool.submit(_run_shard, str(path), ticker, date, strategy, str(out_dir),
+                                   quote_size, record_quotes,
+                                   str(cache_dir) if cache_dir is not None else None)
+                       for ticker, date, path in todo]
+            for future in futures:
+                future.result()
+
+    results = load_results(out_dir)
+    if results.empty:
+        return results
+    keep = {(ticker, date) for ticker, date, _ in days}
+    mask = [(t, d) in keep for t, d in zip(results["ticker"], results["date"])]
+    return results[mask].reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-ticker, multi-day backtest")
+    parser.add_argument("data_root", help="folder searched for LOBSTER message files")
+    parser.add_argument("--out", required=True, help="output folder of the Parquet results")
+    parser.add_argument("--tickers", nargs="+", default=None)
+    parser.add_argument("--dates", nargs="+", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--strategy", choices=["as", "adaptive"], default="as",
+                        help="Avellaneda-Stoikov with fixed or EWMA-estimated sigma")
+    parser.add_argument("--gamma", type=float, required=True)
+    parser.add_argument("--kappa", type=float, required=True)
+    parser.add_argument("--sigma", type=float, required=True)
+    parser.add_argument("--qmax", type=int, required=True)
+    parser.add_argument("--alpha", type=float, default=.94, help="EWMA decay (adaptive)")
+    parser.add_argument("--sigma-scale", type=float, default=1.0,
+                        help="converts the estimated sigma to the units of --sigma (adaptive)")
+    parser.add_argument("--quote-size", type=int, default=10)
+    parser.add_argument("--cache-dir", default=None, help="EventCache folder for the parsed days")
+    parser.add_argument("--no-quotes", action="store_true", help="only write the summaries")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="replay every shard, even the ones already completed")
+    args = parser.parse_args()
+
+    params = ASParams(gamma=args.gamma, kappa=args.kappa, sigma=args.sigma, qmax=args.qmax)
+    if args.strategy == "adaptive":
+        strategy = AdaptiveAvellanedaStoikov(params, EWMAVolEstimator(alpha=args.alpha),
+                                             sigma_scale=args.sigma_scale)
+    else:
+        strategy = AvellanedaStoikov(params)
+
+    results = run_backtest(args.data_root, strategy, args.out, tickers=args.tickers,
+                           dates=args.dates, max_workers=args.workers,
+                           quote_size=args.quote_size, record_quotes=not args.no_quotes,
+                           resume=not args.no_resume, cache_dir=args.cache_dir)
+    print(results.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+'''
+reconcile.py
+Checks that the order book reproduces the exchange's top of book, by
+replaying a LOBSTER message file and comparing the best ask/bid after
+every event against the matching orderbook file.
+
+LOBSTER orderbook files hold one row per message: ask price, ask size,
+bid price, bid size for each of the file's levels, prices in integer
+ticks, and an empty side is written as a dummy price of +-9999999999
+with size 0.
+
+A level N message file only holds the events that touch the first N
+levels. Orders resting deeper (or since before the open) are never
+added, so a free-running replay drifts away from the exchange within a
+few events. By default the replay is therefore resynchronised: after
+each event is recorded, the book is brought back to the reference top
+with "phantom" orders standing in for the liquidity the messages do not
+show, and later events on unknown orders are matched against them. Each
+recorded row then measures what the book did with one event.
+
+Mismatches where the reference level on that side was cleared and a
+worse price took its place are "revealed" depth the book could not have
+known about. The remaining, unexplained mismatches are what to watch
+when changing the book.
+
+To run: poetry run python -m lob_market_making_sim.evaluation.reconcile \
+    data/AMZN_2012-06-21_34200000_57600000_message_1.csv --max-unexplained 0.02
+'''
+
+import argparse
+import sys
+import time
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pyarrow.csv
+
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.io.loader import (EventColumns, arrow_to_columns, lobster_to_arrow,
+                                             _EVENT_TYPE_LUT, _DIRECTION_LUT)
+from lob_market_making_sim.io.schema import Direction, EventType
+
+# Columns of the top level in a LOBSTER orderbook file, in file order
+TOP_COLUMNS = ('ask_price', 'ask_size', 'bid_price', 'bid_size')
+ASK_PRICE, ASK_SIZE, BID_PRICE, BID_SIZE = range(len(TOP_COLUMNS))
+
+# Dummy prices LOBSTER writes for an empty side
+EMPTY_ASK_PRICE = 9999999999
+EMPTY_BID_PRICE = -9999999999
+
+# Order ids of phantom orders, far above any LOBSTER order id
+PHANTOM_OID_BASE = 1 << 62
+
+def orderbook_path_for(message_path: str | Path) -> Path:
+    '''
+    Returns the orderbook file recorded alongside a message file.
+    Parameters
+    message_path (str or pathlib.Path): *_message_N.csv file
+    Returns
+    pathlib.Path: the *_orderbook_N.csv file next to it
+    '''
+    message_path = Path(message_path)
+    return message_path.with_name(message_path.name.replace('_message_', '_orderbook_'))
+
+def load_orderbook_top(path: str | Path) -> np.ndarray:
+    '''
+    Reads the top level of a LOBSTER orderbook file of any depth.
+    Parameters
+    path (str or pathlib.Path): *_orderbook_N.csv file
+    Returns
+    np.ndarray: int64 array of shape (rows, 4) in TOP_COLUMNS order
+    '''
+    read_options = pyarrow.csv.ReadOptions(autogenerate_column_names=True)
+    convert_options = pyarrow.csv.ConvertOptions(include_columns=[f'f{i}' for i in range(4)])
+    table = pyarrow.csv.read_csv(path, read_options=read_options, convert_options=convert_options)
+    top = np.empty((table.num_rows, 4), dtype=np.int64)
+    for i in range(4):
+        top[:, i] = table.column(i).to_numpy()
+    return top
+
+class _TopSync:
+    '''
+    Brings a replayed book back to the reference top of book after each
+    event, with at most one phantom order per price level standing in for
+    liquidity that the message file does not show.
+    '''
+
+    def __init__(self, ob: OrderBookL1):
+        self.ob = ob
+        self._phantom = {} # (direction, price) -> oid
+        self._next_oid = PHANTOM_OID_BASE
+
+    def claim(self, etype: EventType, oid: int, size: int, price: int,
+              direction: Direction):
+        '''
+        Before an event on an order the book has never seen, moves up to
+        size shares from the phantom order at its price into a real order
+        with that oid, so the event finds it.
+        '''
+        if oid in self.ob._orders or etype not in (EventType.CANCEL, EventType.DELETE,
+                                                   EventType.EXECUTE_VISIBLE):
+            return
+        if (direction, price) in self._phantom:
+            taken = self._remove_phantom(direction, price, size)
+            self.ob.apply_values(EventType.ADD, oid, taken, price, direction)
+
+    def repair(self, direction: Direction, price: int, size: int):
+        '''
+        Makes one side of the book show price and size at the top.
+        Parameters
+        direction (Direction): side of the book
+        price (int): reference best price, in ticks
+        size (int): reference size at that price, 0 if the side is empty
+        '''
+        top = self.ob.best_bid if direction is Direction.BUY else self.ob.best_ask
+        sign = 1 if direction is Direction.BUY else -1
+
+        # Levels better than the reference have gone at the exchange
+        while top.quantity > 0 and (size == 0 or sign * top.price > sign * price):
+            level = (top.price, top.quantity)
+            self._remove_level(direction, top.price, top.quantity)
+            if (top.price, top.quantity) == level: # the book did not let go of it
+                return
+        if size == 0:
+            return
+
+        delta = size - (top.quantity if top.price == price else 0)
+        if delta > 0:
+            oid = self._phantom.get((direction, price))
+            if oid is None:
+                oid = self._phantom[(direction, price)] = self._next_oid
+                self._next_oid += 1
+            self.ob.apply_values(EventType.ADD, oid, delta, price, direction)
+        elif delta < 0:
+            self._remove_level(direction, price, -delta)
+
+    def _remove_level(self, direction: Direction, price: int, quantity: int):
+        '''
+        Removes quantity shares from a level, phantom liquidity first, then
+        the real orders whose cancellation happened out of sight.
+        '''
+        if (direction, price) in self._phantom:
+            quantity -= self._remove_phantom(direction, price, quantity)
+        if quantity <= 0:
+            return
+        stale = [(oid, rec.quantity) for oid, rec in self.ob._orders.items()
+                 if rec.price == price and rec.direction is direction and oid >= 0]
+        for oid, resting in stale:
+            removed = min(resting, quantity)
+            etype = EventType.DELETE if removed == resting else EventType.CANCEL
+            self.ob.apply_values(etype, oid, removed, price, direction)
+            quantity -= removed
+            if quantity <= 0:
+                break
+
+    def _remove_phantom(self, direction: Direction, price: int, quantity: int) -> int:
+        '''
+        Takes up to quantity shares out of the phantom order at a level.
+        Returns
+        int: the number of shares taken
+        '''
+        oid = self._phantom[(direction, price)]
+        resting = self.ob._orders[oid].quantity
+        if quantity >= resting:
+            del self._phantom[(direction, price)]
+            self.ob.apply_values(EventType.DELETE, oid, resting, price, direction)
+            return resting
+        self.ob.apply_values(EventType.CANCEL, oid, quantity, price, direction)
+        return quantity
+
+def replay_top(events: EventColumns, reference: Optional[np.ndarray] = None,
+               book_cls: type = OrderBookL1, chunk_size: int = 65536) -> np.ndarray:
+    '''
+    Replays events in integer ticks and records the top of book after each.
+    Parameters
+    events (EventColumns): the day's events
+    reference (np.ndarray): top of book from load_orderbook_top to resync
+        the book to after each event, or None for a free-running replay
+    book_cls (type): OrderBookL1 or a subclass
+    chunk_size (int): number of rows decoded at once
+    Returns
+    np.ndarray: int64 array of shape (len(events), 4) in TOP_COLUMNS order,
+        empty sides written as LOBSTER writes them
+    '''
+    n = len(events)
+    if reference is not None and len(reference) != n:
+        raise ValueError(f'{n} events but {len(reference)} reference rows')
+    top = np.empty((n, 4), dtype=np.int64)
+    ob = book_cls()
+    sync = _TopSync(ob) if reference is not None else None
+    bid, ask = ob.best_bid, ob.best_ask
+    BUY, SELL = Direction.BUY, Direction.SELL
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore') # unknown oids in free-running replays
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            rows = zip(_EVENT_TYPE_LUT[events.etype[start:stop]].tolist(),
+                       events.oid[start:stop].tolist(),
+                       events.size[start:stop].tolist(),
+                       events.price[start:stop].tolist(),
+                       _DIRECTION_LUT[events.direction[start:stop] + 1].tolist())
+            if sync is None:
+                for i, (etype, oid, size, price, direction) in enumerate(rows, start):
+                    ob.apply_values(etype, oid, size, price, direction)
+                    top[i] = (ask.price, ask.quantity, bid.price, bid.quantity)
+            else:
+                ref = reference[start:stop].tolist()
+                for i, (etype, oid, size, price, direction) in enumerate(rows, start):
+                    sync.claim(etype, oid, size, price, direction)
+                    ob.apply_values(etype, oid, size, price, direction)
+                    top[i] = (ask.price, ask.quantity, bid.price, bid.quantity)
+                    ask_price, ask_size, bid_price, bid_size = ref[i - start]
+                    if ask.quantity != ask_size or (ask_size and ask.price != ask_price):
+                        sync.repair(SELL, ask_price, ask_size)
+                    if bid.quantity != bid_size or (bid_size and bid.price != bid_price):
+                        sync.repair(BUY, bid_price, bid_size)
+
+    top[top[:, ASK_SIZE] == 0, ASK_PRICE] = EMPTY_ASK_PRICE
+    top[top[:, BID_SIZE] == 0, BID_PRICE] = EMPTY_BID_PRICE
+    return top
+
+@dataclass
+class ReconcileReport:
+    '''
+    Outcome of comparing a replayed top of book with the exchange's.
+    '''
+    num_events: int
+    mismatches: dict # column name -> number of rows that differ
+    num_mismatched: int # rows where any column differs
+    num_unexplained: int # mismatched rows not explained by revealed depth
+    first_divergence: Optional[int] # index of the first mismatched row
+    first_unexplained: Optional[int] # index of the first unexplained row
+    seconds: float = 0.0
+
+    @property
+    def mismatch_rate(self) -> float:
+        return self.num_mismatched / self.num_events if self.num_events else 0.0
+
+    @property
+    def unexplained_rate(self) -> float:
+        return self.num_unexplained / self.num_events if self.num_events else 0.0
+
+    def summary(self) -> str:
+        '''
+        Returns a short human readable report.
+        '''
+        columns = ', '.join(f'{name} {count}' for name, count in self.mismatches.items())
+        return (f'{self.num_events} events in {self.seconds:.2f}s\n'
+                f'mismatched rows: {self.num_mismatched} ({self.mismatch_rate:.2%}), '
+                f'first at {self.first_divergence}\n'
+                f'unexplained rows: {self.num_unexplained} ({self.unexplained_rate:.2%}), '
+                f'first at {self.first_unexplained}\n'
+                f'by column: {columns}')
+
+def compare_tops(actual: np.ndarray, expected: np.ndarray) -> ReconcileReport:
+    '''
+    Compares two top of book arrays column-wise.
+    Parameters
+    actual (np.ndarray): replayed top, from replay_top
+    expected (np.ndarray): reference top, from load_orderbook_top
+    Returns
+    ReconcileReport
+    '''
+    if actual.shape != expected.shape:
+        raise ValueError(f'Shapes differ: {actual.shape} and {expected.shape}')
+    differs = actual != expected
+    ask_differs = differs[:, ASK_PRICE] | differs[:, ASK_SIZE]
+    bid_differs = differs[:, BID_PRICE] | differs[:, BID_SIZE]
+
+    # Depth is revealed when the reference best price moves to a worse one
+    # (or on the first row, when the book before the open is unknown)
+    revealed_ask = np.ones(len(expected), dtype=bool)
+    revealed_bid = np.ones(len(expected), dtype=bool)
+    revealed_ask[1:] = expected[1:, ASK_PRICE] > expected[:-1, ASK_PRICE]
+    revealed_bid[1:] = expected[1:, BID_PRICE] < expected[:-1, BID_PRICE]
+
+    mismatched = ask_differs | bid_differs
+    unexplained = (ask_differs & ~revealed_ask) | (bid_differs & ~revealed_bid)
+
+    def first(mask):
+        return int(np.argmax(mask)) if mask.any() else None
+
+    return ReconcileReport(num_events=len(expected),
+                           mismatches=dict(zip(TOP_COLUMNS, differs.sum(axis=0).tolist())),
+                           num_mismatched=int(mismatched.sum()),
+                           num_unexplained=int(unexplained.sum()),
+                           first_divergence=first(mismatched),
+                           first_unexplained=first(unexplained))
+
+def reconcile(message_path: str | Path, orderbook_path: str | Path | None = None, *,
+              resync: bool = True, book_cls: type = OrderBookL1) -> ReconcileReport:
+    '''
+    Replays a message file and compares the book with its orderbook file.
+    Parameters
+    message_path (str or pathlib.Path): LOBSTER message file
+    orderbook_path (str or pathlib.Path): matching orderbook file, or None
+        for the one next to message_path
+    resync (bool): resync the book to the reference after each event
+    book_cls (type): OrderBookL1 or a subclass
+    Returns
+    ReconcileReport
+    '''
+    if orderbook_path is None:
+        orderbook_path = orderbook_path_for(message_path)
+    start = time.perf_counter()
+    events = arrow_to_columns(lobster_to_arrow(message_path))
+    expected = load_orderbook_top(orderbook_path)
+    actual = replay_top(events, expected if resync else None, book_cls)
+    report = compare_tops(actual, expected)
+    report.seconds = time.perf_counter() - start
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile the replayed top of book with LOBSTER orderbook files")
+    parser.add_argument("paths", nargs="+", help="LOBSTER message files")
+    parser.add_argument("--no-resync", action="store_true",
+                        help="free-running replay, never corrected by the orderbook file")
+    parser.add_argument("--l3", action="store_true", help="replay with OrderBookL3")
+    parser.add_argument("--max-unexplained", type=float, default=None,
+                        help="exit with status 1 if a day's unexplained rate is above this")
+    args = parser.parse_args()
+
+    book_cls = OrderBookL1
+    if args.l3:
+        from lob_market_making_sim.core.order_book_l3 import OrderBookL3
+        book_cls = OrderBookL3
+
+    failed = False
+    for path in args.paths:
+        report = reconcile(path, resync=not args.no_resync, book_cls=book_cls)
+        print(f'{Path(path).name}\n{report.summary()}\n')
+        if args.max_unexplained is not None and report.unexplained_rate > args.max_unexplained:
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+'''
+sweep.py
+Runs Avellaneda-Stoikov backtests over a grid of ASParams and a list of
+LOBSTER days in parallel.
+
+Each day is converted once to a memory-mapped binary event file (see
+io/binary.py). Worker processes map that file instead of re-parsing the
+CSV, so every configuration of a day replays the same shared pages.
+By default each worker advances its share of the grid in lockstep over
+one book (LockstepReplayEngine) rather than replaying once per config.
+
+To run: poetry run python -m lob_market_making_sim.evaluation.sweep \
+    data/AMZN_2012-06-21_34200000_57600000_message_1.csv \
+    --gamma 0.01 0.1 --kappa 1.5 --sigma 0.002 --qmax 100 --out sweep.csv
+'''
+
+import argparse
+import itertools
+import os
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Sequence
+
+import pandas as pd
+
+from lob_market_making_sim.core.engine import ReplayEngine, LockstepReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.io.binary import EventDataset, load_event_file
+from lob_market_making_sim.io.loader import parse_lobster_name
+from lob_market_making_sim.models.avellaneda import ASParams, AvellanedaStoikov
+
+def param_grid(*, gamma: Iterable[float], kappa: Iterable[float],
+               sigma: Iterable[float], qmax: Iterable[int]) -> list[ASParams]:
+    '''
+    Returns every combination of the given parameter values.
+    Parameters
+    gamma, kappa, sigma, qmax (Iterable): values to try for each parameter
+    Returns
+    list[ASParams]
+    '''
+    return [ASParams(gamma=g, kappa=k, sigma=s, qmax=q)
+            for g, k, s, q in itertools.product(gamma, kappa, sigma, qmax)]
+
+def summarize(engine: ReplayEngine) -> dict:
+    '''
+    Final state of a finished replay.
+    Parameters
+    engine (ReplayEngine): engine after run
+    Returns
+    dict: cash, inventory, fills, final midprice and marked-to-market P&L,
+        in dollars also for an engine replaying in ticks
+    '''
+    mid = engine.ob.mid_external()
+    if mid is None: # fall back to the visible book
+        mid = engine.ob.midprice()
+    return dict(cash=engine.dollars(engine.cash),
+                inventory=engine.inv,
+                filled_buy=engine.filled_buy,
+                filled_sell=engine.filled_sell,
+                final_mid=engine.dollars(mid),
+                pnl=engine.dollars(engine.cash + engine.inv * mid))
+
+def _run_config(event_file: str, params: ASParams, quote_size: int) -> dict:
+    '''
+    Worker: replays one day with one parameter set.
+    '''
+    events = load_event_file(event_file) # memory-mapped, shared between workers
+    engine = ReplayEngine(OrderBookL1(), AvellanedaStoikov(params))
+    engine.QUOTE_SIZE = quote_size
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # unknown oids from pre-open orders
+        engine.run(events)
+    return dict(events=len(events), **summarize(engine))
+
+def _run_lockstep(event_file: str, params: Sequence[ASParams], quote_size: int) -> list[dict]:
+    '''
+    Worker: replays one day once for several parameter sets in lockstep.
+    '''
+    events = load_event_file(event_file)
+    engine = LockstepReplayEngine(OrderBookL1(), params, quote_size=quote_size)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        engine.run(events)
+    return [dict(events=len(events), **result) for result in engine.results()]
+
+def run_sweep(paths: Sequence[str | Path], grid: Sequence[ASParams], *,
+              max_workers: int | None = None,
+              event_dir: str | Path | None = None,
+              quote_size: int = 10,
+              lockstep: bool = True) -> pd.DataFrame:
+    '''
+    Backtests every parameter set on every day, using a process pool.
+    Parameters
+    paths (Sequence): LOBSTER message files, one per ticker and day
+    grid (Sequence[ASParams]): parameter sets, e.g. from param_grid
+    max_workers (int): number of processes, or None for one per core
+    event_dir (str or pathlib.Path): where to keep the binary event files,
+        or None for a temporary folder removed after the sweep
+    quote_size (int): shares per agent quote
+    lockstep (bool): split the grid into one chunk per worker and replay
+        each chunk in lockstep, instead of one replay per parameter set
+    Returns
+    pd.DataFrame: one row per (ticker, date, parameter set)
+    '''
+    grid = list(grid)
+    workers = max_workers or os.cpu_count() or 1
+    if lockstep:
+        size = -(-len(grid) // workers) # ceiling division
+        chunks = [grid[i:i + size] for i in range(0, len(grid), size)]
+    else:
+        chunks = [[params] for params in grid]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = EventDataset(event_dir if event_dir is not None else tmp)
+        days = [(*parse_lobster_name(p), str(dataset.add_lobster(p))) for p in paths]
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            jobs = []
+            for ticker, date, event_file in days:
+                for chunk in chunks:
+                    if lockstep:
+                        future = pool.submit(_run_lockstep, event_file, chunk, quote_size)
+                    else:
+                        future = pool.submit(_run_config, event_file, chunk[0], quote_size)
+                    jobs.append((ticker, date, chunk, future))
+
+            rows = []
+            for ticker, date, chunk, future in jobs:
+                results = future.result()
+                for params, result in zip(chunk, results if lockstep else [results]):
+                    rows.append(dict(ticker=ticker, date=date,
+                                     gamma=params.gamma, kappa=params.kappa,
+                                     sigma=params.sigma, qmax=params.qmax,
+                                     **result))
+
+    return pd.DataFrame(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="Avellaneda-Stoikov parameter sweep")
+    parser.add_argument("paths", nargs="+", help="LOBSTER message files")
+    parser.add_argument("--gamma", type=float, nargs="+", required=True)
+    parser.add_argument("--kappa", type=float, nargs="+", required=True)
+    parser.add_argument("--sigma", type=float, nargs="+", required=True)
+    parser.add_argument("--qmax", type=int, nargs="+", required=True)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--quote-size", type=int, default=10)
+    parser.add_argument("--event-dir", default=None,
+                        help="keep binary event files here for later sweeps")
+    parser.add_argument("--out", default=None, help=".csv or .parquet results file")
+    parser.add_argument("--separate", action="store_true",
+                        help="one replay per parameter set instead of lockstep replays")
+    args = parser.parse_args()
+
+    grid = param_grid(gamma=args.gamma, kappa=args.kappa, sigma=args.sigma, qmax=args.qmax)
+    results = run_sweep(args.paths, grid, max_workers=args.workers,
+                        event_dir=args.event_dir, quote_size=args.quote_size,
+                        lockstep=not args.separate)
+
+    if args.out is None:
+        print(results.to_string(index=False))
+    elif str(args.out).endswith(".parquet"):
+        results.to_parquet(args.out, index=False)
+    else:
+        results.to_csv(args.out, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,78 @@ Weights fall exponentially as data points get lower.
 '''
 
 from typing import Sequence
+import math
 import numpy as np
 
+# The recursion is evaluated in closed form over blocks of returns, which
+# scales terms by alpha**-j. Blocks are kept short enough that this factor
+# stays below e**_MAX_LOG_GROWTH, far from float64 overflow.
+_MAX_LOG_GROWTH = 300.0
+
+def _ewma_recursion(x: np.ndarray, alpha: float) -> np.ndarray:
+    '''
+    Evaluates y_t = alpha * y_{t-1} + (1-alpha) * x_t with y_0 = 0 along
+    the last axis, without a Python loop over observations.
+    Within a block of length m starting after y_c:
+        y_j = alpha**j * (y_c + (1-alpha) * sum_{i<=j} alpha**-i * x_i)
+    Parameters
+    x (np.ndarray): observations, 1-D or 2-D (one series per row)
+    alpha (float): decay factor
+    Returns
+        np.ndarray: y, same shape as x
+    '''
+    n = x.shape[-1]
+    if alpha == 0:
+        return x.copy()
+    block = n if alpha >= 1 else max(1, int(_MAX_LOG_GROWTH / -math.log(alpha)))
+
+    out = np.empty_like(x)
+    carry = np.zeros(x.shape[:-1])
+    for start in range(0, n, block):
+        seg = x[..., start:start + block]
+        j = np.arange(1, seg.shape[-1] + 1)
+        weighted = np.cumsum(seg * alpha ** -j, axis=-1)
+        out[..., start:start + seg.shape[-1]] = alpha ** j * (carry[..., None] + (1 - alpha) * weighted)
+        carry = out[..., start + seg.shape[-1] - 1]
+    return out
+
+def ewma_variance_path(prices: Sequence[float] | np.ndarray,
+                       *,
+                       alpha: float = .94) -> np.ndarray:
+    '''
+    Return the EWMA variance of log returns after every observation.
+    Parameters
+    prices (array-like): midprices in dollars at uniform intervals, 1-D, or
+        2-D with one price series per row
+    alpha (float): decay factor
+    Returns
+        np.ndarray: variance path, one entry per log return (last axis n-1);
+            the final value is path[..., -1]
+    Raises
+        ValueError: if not enough price points
+    '''
+    prices = np.asarray(prices, dtype=float) # Convert given prices to float
+    if prices.shape[-1] < 2:
+        raise ValueError("Need at least two price points")
+
+    log_returns = np.diff(np.log(prices), axis=-1)
+    return _ewma_recursion(log_returns ** 2, alpha)
+
+def ewma_sigma_path(prices: Sequence[float] | np.ndarray,
+                    *,
+                    alpha: float = .94,
+                    seconds_per_year: float = 252*6.5*60*60) -> np.ndarray:
+    '''
+    Return the annualized EWMA volatility after every observation.
+    Parameters
+    prices (array-like): midprices in dollars at uniform intervals (1-D or 2-D)
+    alpha (float): decay factor
+    seconds_per_year (float): used to annualize
+    Returns
+        np.ndarray: annualized volatility path (last axis n-1)
+    '''
+    return np.sqrt(ewma_variance_path(prices, alpha=alpha) * seconds_per_year)
+
 def ewma_sigma(prices: Sequence[float], 
                *, 
                alpha: float=.94, 
@@ -30,13 +100,110 @@ def ewma_sigma(prices: Sequence[float],
     Raises
         ValueError: if not enough price points
     '''
+    prices = np.asarray(prices, dtype=float)
+    if prices.ndim != 1:
+        raise ValueError("ewma_sigma takes one price series; use ewma_sigma_batch")
+    return ewma_sigma_path(prices, alpha=alpha, seconds_per_year=seconds_per_year)[-1]
 
-    prices = np.asarray(prices, dtype=float) # Convert given prices to float
-    if prices.size < 2:
-        raise ValueError("Need at least two price points")
-    
-    log_returns = np.diff(np.log(prices))
-    var = 0.0
-    for ret in log_returns:
-        var = alpha *var + (1-alpha)* (ret**2)
-    return np.sqrt(var*seconds_per_year) # Annualize
\ No newline at end of file
+def ewma_sigma_batch(prices: np.ndarray,
+                     *,
+                     alpha: float = .94,
+                     seconds_per_year: float = 252*6.5*60*60) -> np.ndarray:
+    '''
+    Return the annualized EWMA volatility of many price series at once,
+    e.g. rolling windows or tickers sampled on the same grid.
+    Parameters
+    prices (np.ndarray): 2-D array with one price series per row
+    alpha (float): decay factor
+    seconds_per_year (float): used to annualize
+    Returns
+        np.ndarray: one annualized volatility per row
+    Raises
+        ValueError: if prices is not 2-D or has fewer than two columns
+    '''
+    prices = np.asarray(prices, dtype=float)
+    if prices.ndim != 2:
+        raise ValueError("ewma_sigma_batch expects a 2-D array of price series")
+    return ewma_sigma_path(prices, alpha=alpha, seconds_per_year=seconds_per_year)[:, -1]
+
+class EWMAVolEstimator:
+    '''
+    Streaming version of ewma_sigma for use inside the replay loop.
+    Each update costs O(1) and no price history is kept, so the current
+    volatility can be read at every event. After updating with
+    p_0, ..., p_n, sigma equals ewma_sigma([p_0, ..., p_n]).
+
+    Usage
+    est = EWMAVolEstimator(alpha=.94)
+    for mid in mids:
+        est.update(mid)
+    est.sigma
+    '''
+    def __init__(self, *, alpha: float = .94,
+                 seconds_per_year: float = 252*6.5*60*60,
+                 min_returns: int = 1):
+        '''
+        Parameters
+        alpha (float): decay factor
+        seconds_per_year (float): used to annualize, as in ewma_sigma
+        min_returns (int): returns needed before the estimate is ready
+        '''
+        self.alpha = alpha
+        self.seconds_per_year = seconds_per_year
+        self.min_returns = min_returns
+        self.reset()
+
+    def reset(self) -> None:
+        '''
+        Forgets all observed prices.
+        '''
+        self.variance = 0.0 # EWMA of squared log returns
+        self.num_returns = 0
+        self._last_log_price = None
+
+    def update(self, price: float) -> float:
+        '''
+        Adds the next price observation.
+        Parameters
+        price (float): midprice in dollars
+        Returns
+            float: the updated annualized volatility
+        '''
+        log_price = math.log(price)
+        if self._last_log_price is not None:
+            ret = log_price - self._last_log_price
+            self.variance = self.alpha * self.variance + (1 - self.alpha) * ret * ret
+            self.num_returns += 1
+        self._last_log_price = log_price
+        return self.sigma
+
+    def get_state(self) -> dict:
+        '''
+        Returns the running estimate, to be restored with set_state.
+        '''
+        last = self._last_log_price
+        return dict(variance=self.variance, num_returns=self.num_returns,
+                    last_log_price=math.nan if last is None else last)
+
+    def set_state(self, state: dict) -> None:
+        '''
+        Restores a running estimate returned by get_state.
+        '''
+        self.variance = float(state['variance'])
+        self.num_returns = int(state['num_returns'])
+        last = float(state['last_log_price'])
+        self._last_log_price = None if math.isnan(last) else last
+
+    @property
+    def sigma(self) -> float:
+        '''
+        Current annualized volatility.
+        '''
+        return math.sqrt(self.variance * self.seconds_per_year)
+
+    @property
+    def ready(self) -> bool:
+        '''
+        Whether enough returns have been seen to trust sigma.
+        '''
+        return self.num_returns >= self.min_returns
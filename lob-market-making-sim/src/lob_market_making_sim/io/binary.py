@@ -0,0 +1,166 @@
+'''
+binary.py
+Fixed-width binary event files: one NumPy structured array per trading
+day, stored as .npy and opened with np.memmap.
+
+Every process that opens the same file maps the same pages of the OS
+page cache, so many replay or training workers can share one copy of a
+day's events instead of each building its own list of OrderEvents.
+
+File layout (one record per message, 34 bytes, no padding)
+time (f8), event_type (i1), direction (i1), order_id (i8), size (i8), price (i8 ticks)
+
+Usage
+write_event_file(lobster_to_arrow(csv_path), 'data/events/AMZN_2012-06-21.events.npy')
+cols = load_event_file('data/events/AMZN_2012-06-21.events.npy')
+engine.run(cols)
+'''
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+import lob_market_making_sim.io.schema as schema
+from lob_market_making_sim.io.cache import normalize_events_table, source_key
+from lob_market_making_sim.io.loader import EventColumns, lobster_to_arrow, parse_lobster_name
+
+EVENT_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('event_type', 'i1'),
+    ('direction', 'i1'),
+    ('order_id', '<i8'),
+    ('size', '<i8'),
+    ('price', '<i8'),
+])
+
+EVENT_FILE_SUFFIX = '.events.npy'
+
+# Sidecar next to each event file of an EventDataset, holding the
+# cache.source_key of the message file it was converted from
+SOURCE_KEY_SUFFIX = '.source'
+
+def table_to_records(table) -> np.ndarray:
+    '''
+    Packs a message table into a structured array of EVENT_DTYPE.
+    Parameters
+    table (pa.Table): events following schema.COL_SCHEMA or schema.CACHE_SCHEMA
+    Returns
+    np.ndarray: one record per event
+    '''
+    if not table.schema.equals(schema.CACHE_SCHEMA):
+        table = normalize_events_table(table)
+    records = np.empty(table.num_rows, dtype=EVENT_DTYPE)
+    for name in EVENT_DTYPE.names:
+        records[name] = table.column(name).to_numpy()
+    return records
+
+def write_event_file(table, out_path: str | Path) -> Path:
+    '''
+    Writes a day of events as a binary event file.
+    Parameters
+    table (pa.Table): events following schema.COL_SCHEMA or schema.CACHE_SCHEMA
+    out_path (str or pathlib.Path): destination .npy file
+    Returns
+    pathlib.Path: the file written
+    '''
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # np.save appends .npy to names that lack it, so keep the suffix on the temp file
+    tmp_path = out_path.with_name(f'{out_path.name}.{os.getpid()}.tmp.npy')
+    np.save(tmp_path, table_to_records(table))
+    os.replace(tmp_path, out_path) # readers never see a partial file
+    return out_path
+
+def load_event_records(path: str | Path) -> np.ndarray:
+    '''
+    Memory-maps a binary event file read-only.
+    Parameters
+    path (str or pathlib.Path): file written by write_event_file
+    Returns
+    np.memmap: structured array of EVENT_DTYPE
+    Raises
+    ValueError
+        If the file does not hold EVENT_DTYPE records
+    '''
+    records = np.load(path, mmap_mode='r')
+    if records.dtype != EVENT_DTYPE:
+        raise ValueError(f'{path} does not contain binary event records.')
+    return records
+
+def load_event_file(path: str | Path) -> EventColumns:
+    '''
+    Memory-maps a binary event file as EventColumns. The columns are
+    strided views into the mapped file, so nothing is copied.
+    Parameters
+    path (str or pathlib.Path): file written by write_event_file
+    Returns
+    EventColumns
+    '''
+    records = load_event_records(path)
+    return EventColumns(ts=records['time'],
+                        etype=records['event_type'],
+                        oid=records['order_id'],
+                        size=records['size'],
+                        price=records['price'],
+                        direction=records['direction'])
+
+class EventDataset:
+    '''
+    A folder of binary event files, one per (ticker, date), named
+    {TICKER}_{DATE}.events.npy.
+
+    Usage
+    dataset = EventDataset('data/events')
+    dataset.add_lobster('data/AMZN_2012-06-21_34200000_57600000_message_1.csv')
+    cols = dataset.load('AMZN', '2012-06-21')
+    '''
+    def __init__(self, root: str | Path):
+        '''
+        Parameters
+        root (str or pathlib.Path): folder holding the event files
+        '''
+        self.root = Path(root)
+
+    def path_for(self, ticker: str, date: str) -> Path:
+        '''
+        Returns the event file of one ticker and day.
+        '''
+        return self.root / f'{ticker}_{date}{EVENT_FILE_SUFFIX}'
+
+    def keys(self) -> list[tuple[str, str]]:
+        '''
+        Returns the sorted (ticker, date) pairs available in the dataset.
+        '''
+        keys = []
+        for path in self.root.glob(f'*{EVENT_FILE_SUFFIX}'):
+            ticker, date = path.name[:-len(EVENT_FILE_SUFFIX)].rsplit('_', 1)
+            keys.append((ticker, date))
+        return sorted(keys)
+
+    def add_lobster(self, raw_msg_path: str | Path, *, overwrite: bool = False) -> Path:
+        '''
+        Converts a LOBSTER message file into the dataset, unless its event
+        file was converted from the same version of the same file (same
+        freshness key as EventCache).
+        Parameters
+        raw_msg_path (str or pathlib.Path): LOBSTER message file
+        overwrite (bool): rebuild the event file even if it is up to date
+        Returns
+        pathlib.Path: the event file
+        '''
+        out_path = self.path_for(*parse_lobster_name(raw_msg_path))
+        key_path = out_path.with_name(out_path.name + SOURCE_KEY_SUFFIX)
+        key = source_key(raw_msg_path)
+        if overwrite or not out_path.exists() or not key_path.exists() \
+                or key_path.read_text() != key:
+            write_event_file(lobster_to_arrow(raw_msg_path), out_path)
+            key_path.write_text(key)
+        return out_path
+
+    def load(self, ticker: str, date: str) -> EventColumns:
+        '''
+        Memory-maps the events of one ticker and day.
+        '''
+        return load_event_file(self.path_for(ticker, date))
@@ -0,0 +1,260 @@
+'''
+cache.py
+Caches parsed LOBSTER message files as Parquet, so repeated training and
+evaluation runs read a memory-mapped columnar file instead of re-parsing
+the CSV every time.
+
+Cache files are named after the source file, a hash of its absolute
+path and a key built from its modification time and size, so editing or
+replacing the CSV automatically invalidates the old entry, while files
+with the same name in different folders keep separate entries in a
+shared cache folder.
+
+.lob_cache/AMZN_..._message_1-<path hash>-<version hash>.parquet
+
+Usage
+cache = EventCache()
+table = cache.load('data/AMZN_2012-06-21_34200000_57600000_message_1.csv')
+events = arrow_to_events(table)
+'''
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import lob_market_making_sim.io.schema as schema
+from lob_market_making_sim.io.loader import iter_lobster_batches, parse_lobster_name
+from lob_market_making_sim.io.store import ArrowStore, PART_NAME
+
+# Name of the cache folder created next to each source file by default
+DEFAULT_CACHE_DIRNAME = ".lob_cache"
+
+# Columns with few distinct values, worth dictionary-encoding. Order ids
+# and timestamps are nearly unique, and encoding them makes zstd files
+# about a third larger.
+DICTIONARY_COLUMNS = ['event_type', 'direction', 'size', 'price']
+
+# Rows per row group of event files. Events are sorted by time, so each
+# group covers a short stretch of the day and a time-window scan (see
+# query.py) skips the others; at this size the files are no larger.
+EVENTS_ROW_GROUP_SIZE = 16_384
+
+def validate_events_table(table):
+    '''
+    Checks that a parsed message table follows schema.COL_SCHEMA and only
+    contains known event type and direction codes.
+    Parameters
+    table (pa.Table): table returned by lobster_to_arrow
+    Raises
+    ValueError
+        If the schema or any code is not as expected
+    '''
+    if not pa.schema(table.schema).equals(schema.COL_SCHEMA):
+        raise ValueError('Message table does not match schema.COL_SCHEMA.')
+
+    known = [('event_type', [e.value for e in schema.EventType]),
+             ('direction', [d.value for d in schema.Direction])]
+    for name, codes in known:
+        col = table.column(name)
+        valid = pc.is_in(col, value_set=pa.array(codes, type=col.type))
+        if not pc.all(valid).as_py():
+            raise ValueError(f'Unknown {name} code in message table.')
+
+def normalize_events_table(table):
+    '''
+    Validates a parsed message table and casts it to schema.CACHE_SCHEMA.
+    Parameters
+    table (pa.Table): table returned by lobster_to_arrow
+    Returns
+    pa.Table: table following schema.CACHE_SCHEMA
+    '''
+    validate_events_table(table)
+    return table.cast(schema.CACHE_SCHEMA)
+
+def source_key(raw_msg_path: str | Path) -> str:
+    '''
+    Returns the freshness key of a source file: its absolute path,
+    modification time and size. Derived files are rebuilt when it changes.
+    Parameters
+    raw_msg_path (str or pathlib.Path): LOBSTER message file
+    Returns
+    str
+    '''
+    raw_msg_path = Path(raw_msg_path).resolve()
+    stat = raw_msg_path.stat()
+    return f'{raw_msg_path}|{stat.st_mtime_ns}|{stat.st_size}'
+
+class EventCache:
+    '''
+    Parquet cache of parsed message files.
+    '''
+    def __init__(self, cache_dir: str | Path | None = None,
+                 compression: str = "zstd"):
+        '''
+        Parameters
+        cache_dir (str or pathlib.Path): folder for the Parquet files, or None
+            to use a .lob_cache folder next to each source file
+        compression ('snappy', 'zstd', None): Parquet compression codec
+        '''
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.compression = compression
+
+    def path_for(self, raw_msg_path: str | Path) -> Path:
+        '''
+        Returns the cache file for the current version of a source file.
+        Parameters
+        raw_msg_path (str or pathlib.Path): LOBSTER message file
+        Returns
+        pathlib.Path: location of the Parquet file (which may not exist yet)
+        '''
+        raw_msg_path = Path(raw_msg_path).resolve()
+        version = hashlib.sha1(source_key(raw_msg_path).encode()).hexdigest()[:16]
+        prefix = self._prefix(raw_msg_path)
+        return prefix.with_name(f'{prefix.name}-{version}.parquet')
+
+    def _prefix(self, raw_msg_path: Path) -> Path:
+        '''
+        Returns the cache location shared by every version of a resolved
+        source file, without the version key and suffix.
+        '''
+        source = hashlib.sha1(str(raw_msg_path).encode()).hexdigest()[:8]
+        cache_dir = self.cache_dir or raw_msg_path.parent / DEFAULT_CACHE_DIRNAME
+        return cache_dir / f'{raw_msg_path.stem}-{source}'
+
+    def load(self, raw_msg_path: str | Path, *, refresh: bool = False):
+        '''
+        Returns the events of a message file, converting it on first use
+        and memory-mapping the cached Parquet file afterwards.
+        Parameters
+        raw_msg_path (str or pathlib.Path): LOBSTER message file
+        refresh (bool): rebuild the cache entry even if it exists
+        Returns
+        pa.Table: events following schema.CACHE_SCHEMA
+        '''
+        cache_path = self.path_for(raw_msg_path)
+        self.ensure(raw_msg_path, refresh=refresh)
+        return pq.read_table(cache_path, memory_map=True)
+
+    def ensure(self, raw_msg_path: str | Path, *, refresh: bool = False) -> bool:
+        '''
+        Converts a message file unless its cache entry is up to date,
+        without reading the entry back.
+        Parameters
+        raw_msg_path (str or pathlib.Path): LOBSTER message file
+        refresh (bool): rebuild the cache entry even if it exists
+        Returns
+        bool: whether the file was converted
+        '''
+        cache_path = self.path_for(raw_msg_path)
+        if refresh or not cache_path.exists():
+            self._write(raw_msg_path, cache_path)
+            return True
+        return False
+
+    def _write(self, raw_msg_path, cache_path: Path):
+        '''
+        Parses the source file and writes its cache entry, removing
+        entries left over from older versions of the same file.
+        '''
+        # Write to a temporary name first so that an interrupted run never
+        # leaves a truncated file that looks like a valid cache entry. The
+        # CSV is parsed and written block by block, so memory does not grow
+        # with the file.
+        tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            with ArrowStore(schema.CACHE_SCHEMA, tmp_path, compression=self.compression,
+                            row_group_size=EVENTS_ROW_GROUP_SIZE,
+                            use_dictionary=DICTIONARY_COLUMNS) as store:
+                for batch in iter_lobster_batches(raw_msg_path):
+                    store.add_batch(normalize_events_table(pa.Table.from_batches([batch])))
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_path, cache_path)
+
+        # Only older versions of this source file, not entries of files
+        # with the same name in other folders
+        prefix = self._prefix(Path(raw_msg_path).resolve()).name
+        for old in cache_path.parent.glob(f'{prefix}-*.parquet'):
+            if old != cache_path and old.name.rsplit('-', 1)[0] == prefix:
+                old.unlink(missing_ok=True)
+
+def cached_lobster_to_arrow(raw_msg_path, cache_dir: str | Path | None = None):
+    '''
+    Drop-in replacement for loader.lobster_to_arrow that goes through
+    an EventCache.
+    Parameters
+    raw_msg_path (str or pathlib.Path): LOBSTER message file
+    cache_dir (str or pathlib.Path): folder for the cache, or None for the default
+    Returns
+    pa.Table: events following schema.CACHE_SCHEMA
+    '''
+    return EventCache(cache_dir).load(raw_msg_path)
+
+def partition_path(root_dir: str | Path, ticker: str, date: str) -> Path:
+    '''
+    Returns the file of one day in a dataset written by write_events_dataset.
+    '''
+    return Path(root_dir) / f'ticker={ticker}' / f'date={date}' / PART_NAME
+
+def write_events_partition(msg_path, root_dir: str | Path, *,
+                           row_group_size: int = EVENTS_ROW_GROUP_SIZE,
+                           compression: str | None = "zstd",
+                           compression_level: int | None = None) -> Path:
+    '''
+    Converts one LOBSTER message file into its partition of an event
+    dataset (see write_events_dataset), streaming it block by block.
+    Parameters
+    msg_path (str or pathlib.Path): LOBSTER message file
+    root_dir (str or pathlib.Path): dataset folder
+    row_group_size, compression, compression_level: see write_events_dataset
+    Returns
+    pathlib.Path: the file written, following schema.CACHE_SCHEMA
+    '''
+    out_path = partition_path(root_dir, *parse_lobster_name(msg_path))
+    # The ticker and date are in the folder names, so the file holds the
+    # cache columns only. It is written under a temporary name (ignored by
+    # dataset readers) and renamed once complete.
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(f'.{out_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with ArrowStore(schema.CACHE_SCHEMA, tmp_path, row_group_size=row_group_size,
+                        compression=compression, compression_level=compression_level,
+                        use_dictionary=DICTIONARY_COLUMNS) as store:
+            for batch in iter_lobster_batches(msg_path):
+                store.add_batch(normalize_events_table(pa.Table.from_batches([batch])))
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def write_events_dataset(msg_paths, root_dir: str | Path, *,
+                         row_group_size: int = EVENTS_ROW_GROUP_SIZE,
+                         compression: str | None = "zstd",
+                         compression_level: int | None = None) -> Path:
+    '''
+    Converts LOBSTER message files into one Parquet dataset, partitioned
+    hive-style by ticker and date (root_dir/ticker=AMZN/date=2012-06-21/),
+    so readers can select days by predicate instead of opening every file.
+    Each file is streamed block by block, so memory stays bounded however
+    many days are converted.
+    Parameters
+    msg_paths (Iterable): LOBSTER message files
+    root_dir (str or pathlib.Path): dataset folder
+    row_group_size (int): maximum rows per Parquet row group
+    compression ('snappy', 'zstd', None): Parquet compression codec
+    compression_level (int): codec level, or None for the codec default
+    Returns
+    pathlib.Path: the dataset folder, whose files follow schema.CACHE_SCHEMA
+        (ticker and date are in the folder names, see partition_path)
+    '''
+    for msg_path in msg_paths:
+        write_events_partition(msg_path, root_dir, row_group_size=row_group_size,
+                               compression=compression, compression_level=compression_level)
+    return Path(root_dir)
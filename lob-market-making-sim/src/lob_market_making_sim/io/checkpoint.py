@@ -0,0 +1,149 @@
+'''
+checkpoint.py
+Binary checkpoints of replay state, so that a replay can resume at an
+arbitrary event of the day instead of warming the book up from the open.
+
+A checkpoint is one .npz file holding the arrays of OrderBookL1.get_state
+(or ReplayEngine.get_state, LockstepReplayEngine.get_state) and the number
+of events replayed before it was taken. The checkpoints of a day live in
+one folder named after the day's event file, next to it (e.g. next to
+the Parquet event cache or a binary event file):
+
+.lob_cache/AMZN_..._message_1-<path hash>-<version hash>.checkpoints/0000100000.npz
+
+Usage
+checkpoint_dir = checkpoint_dir_for(EventCache().path_for(csv_path))
+write_book_checkpoints(events, checkpoint_dir, every=100_000)
+env.reset(options={'start_index': 250_000})
+'''
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.io.loader import EventColumns
+
+CHECKPOINT_DIR_SUFFIX = '.checkpoints'
+
+def checkpoint_dir_for(events_path: str | Path) -> Path:
+    '''
+    Returns the checkpoint folder of a day's event file.
+    Parameters
+    events_path (str or pathlib.Path): Parquet cache or binary event file
+    Returns
+    pathlib.Path: sibling folder named after the file without its suffixes
+    '''
+    events_path = Path(events_path)
+    name = events_path.name.split('.', 1)[0]
+    return events_path.with_name(name + CHECKPOINT_DIR_SUFFIX)
+
+def checkpoint_path(checkpoint_dir: str | Path, event_index: int) -> Path:
+    '''
+    Returns the file of the checkpoint taken after event_index events.
+    '''
+    return Path(checkpoint_dir) / f'{event_index:010d}.npz'
+
+def save_checkpoint(path: str | Path, state: dict, event_index: int) -> Path:
+    '''
+    Writes a state dict of arrays as an uncompressed .npz file.
+    Parameters
+    path (str or pathlib.Path): destination file
+    state (dict[str, np.ndarray]): e.g. from OrderBookL1.get_state
+    event_index (int): number of events replayed before the state
+    Returns
+    pathlib.Path: the file written
+    '''
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npz')
+    np.savez(tmp_path, event_index=np.array(event_index, dtype=np.int64), **state)
+    os.replace(tmp_path, path) # readers never see a partial file
+    return path
+
+def load_checkpoint(path: str | Path) -> tuple[int, dict]:
+    '''
+    Reads a checkpoint written by save_checkpoint.
+    Returns
+    (int, dict[str, np.ndarray]): the event index and the state
+    '''
+    with np.load(path) as data:
+        state = {name: data[name] for name in data.files}
+    return int(state.pop('event_index')), state
+
+def checkpoint_indices(checkpoint_dir: str | Path) -> list[int]:
+    '''
+    Returns the sorted event indices that have a checkpoint.
+    '''
+    checkpoint_dir = Path(checkpoint_dir)
+    if not checkpoint_dir.is_dir():
+        return []
+    return sorted(int(p.stem) for p in checkpoint_dir.glob('*.npz') if p.stem.isdigit())
+
+def latest_checkpoint(checkpoint_dir: str | Path, event_index: int) -> Path | None:
+    '''
+    Returns the last checkpoint taken at or before event_index, or None.
+    '''
+    indices = [i for i in checkpoint_indices(checkpoint_dir) if i <= event_index]
+    return checkpoint_path(checkpoint_dir, indices[-1]) if indices else None
+
+def apply_to_book(ob: OrderBookL1, events) -> None:
+    '''
+    Replays events into a book without an agent.
+    Parameters
+    ob (OrderBookL1): the book
+    events (EventColumns or Sequence[OrderEvent]): events to apply
+    '''
+    if isinstance(events, EventColumns):
+        for chunk in events.iter_chunks(ticks=ob.ticks):
+            for _, etype, oid, size, price, direction in zip(*chunk):
+                ob.apply_values(etype, oid, size, price, direction)
+    else:
+        for event in events:
+            ob.apply(event)
+
+def write_book_checkpoints(events, checkpoint_dir: str | Path, every: int,
+                           book_cls: type = OrderBookL1) -> list[Path]:
+    '''
+    Replays a day without an agent and checkpoints the book every
+    `every` events.
+    Parameters
+    events (EventColumns or Sequence[OrderEvent]): the day's events
+    checkpoint_dir (str or pathlib.Path): destination folder
+    every (int): number of events between checkpoints
+    book_cls (type): OrderBookL1 or a subclass
+    Returns
+    list[pathlib.Path]: the files written
+    '''
+    ob = book_cls()
+    paths = []
+    for start in range(0, len(events) - every + 1, every):
+        apply_to_book(ob, events[start:start + every])
+        paths.append(save_checkpoint(checkpoint_path(checkpoint_dir, start + every),
+                                     ob.get_state(), start + every))
+    return paths
+
+def restore_book(ob: OrderBookL1, events, event_index: int,
+                 checkpoint_dir: str | Path | None = None) -> int:
+    '''
+    Brings an agent-free book to its state after event_index events,
+    starting from the latest checkpoint before it (or from an empty
+    book) and replaying the remaining events.
+    Parameters
+    ob (OrderBookL1): the book, overwritten
+    events (EventColumns or Sequence[OrderEvent]): the day's events
+    event_index (int): number of events to have replayed
+    checkpoint_dir (str or pathlib.Path): checkpoints of the day, if any
+    Returns
+    int: the number of events that had to be replayed
+    '''
+    path = latest_checkpoint(checkpoint_dir, event_index) if checkpoint_dir else None
+    if path is None:
+        start = 0
+        ob.reset()
+    else:
+        start, state = load_checkpoint(path)
+        ob.set_state(state)
+    apply_to_book(ob, events[start:event_index])
+    return event_index - start
@@ -0,0 +1,172 @@
+'''
+ingest.py
+Converts a folder of LOBSTER message files into the cached Parquet
+format in parallel, and reports the throughput (MB/s of CSV read and
+rows/s written) to size the conversion of a full archive.
+
+Files are converted by a pool of threads. PyArrow releases the GIL while
+it parses CSV blocks, validates and casts them and writes Parquet, so
+several files are converted at once within one process, without copying
+tables between processes. Each file is streamed block by block, so
+memory grows with the number of threads, not with the size of the files.
+
+Files already converted (an up to date EventCache entry, or an existing
+dataset partition) are skipped unless refresh is set.
+
+To run: poetry run python -m lob_market_making_sim.io.ingest data --workers 8
+        poetry run python -m lob_market_making_sim.io.ingest data --dataset data/events
+'''
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import pyarrow.parquet as pq
+
+from lob_market_making_sim.io.cache import EventCache, partition_path, write_events_partition
+from lob_market_making_sim.io.loader import discover_days, parse_lobster_name
+
+@dataclass
+class IngestResult:
+    '''
+    Conversion of one message file.
+    '''
+    path: Path # message file
+    out_path: Path # cache entry or dataset partition
+    rows: int
+    bytes: int # size of the CSV
+    seconds: float # time spent converting, 0 if skipped
+    skipped: bool # already converted
+
+@dataclass
+class IngestReport:
+    '''
+    Conversion of many files, with the wall time of the whole run.
+    '''
+    files: List[IngestResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def converted(self) -> List[IngestResult]:
+        return [f for f in self.files if not f.skipped]
+
+    @property
+    def rows(self) -> int:
+        '''
+        Rows written by this run.
+        '''
+        return sum(f.rows for f in self.converted)
+
+    @property
+    def bytes(self) -> int:
+        '''
+        CSV bytes read by this run.
+        '''
+        return sum(f.bytes for f in self.converted)
+
+    @property
+    def mb_per_sec(self) -> float:
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        '''
+        One line with the totals and throughput of the run.
+        '''
+        converted = self.converted
+        return (f'{len(converted)} files converted, {len(self.files) - len(converted)} skipped: '
+                f'{self.rows:,} rows, {self.bytes / 1e6:.1f} MB in {self.seconds:.2f} s '
+                f'({self.mb_per_sec:.1f} MB/s, {self.rows_per_sec:,.0f} rows/s)')
+
+def ingest_file(msg_path: str | Path, *, cache_dir: str | Path | None = None,
+                dataset_dir: str | Path | None = None,
+                refresh: bool = False) -> IngestResult:
+    '''
+    Converts one message file (see ingest).
+    '''
+    msg_path = Path(msg_path)
+    start = time.perf_counter()
+    if dataset_dir is not None:
+        out_path = partition_path(dataset_dir, *parse_lobster_name(msg_path))
+        skipped = out_path.exists() and not refresh
+        if not skipped:
+            write_events_partition(msg_path, dataset_dir)
+    else:
+        cache = EventCache(cache_dir)
+        skipped = not cache.ensure(msg_path, refresh=refresh)
+        out_path = cache.path_for(msg_path)
+    seconds = 0.0 if skipped else time.perf_counter() - start
+    return IngestResult(path=msg_path, out_path=out_path,
+                        rows=pq.read_metadata(out_path).num_rows,
+                        bytes=msg_path.stat().st_size, seconds=seconds, skipped=skipped)
+
+def ingest(paths: Iterable[str | Path], *, cache_dir: str | Path | None = None,
+           dataset_dir: str | Path | None = None, max_workers: Optional[int] = None,
+           refresh: bool = False, progress=None) -> IngestReport:
+    '''
+    Converts message files concurrently, validating each block against
+    schema.COL_SCHEMA and casting it to schema.CACHE_SCHEMA (prices stay
+    in integer ticks).
+    Parameters
+    paths (Iterable): LOBSTER message files
+    cache_dir (str or pathlib.Path): write EventCache entries in this
+        folder, or None for the .lob_cache folder next to each file
+    dataset_dir (str or pathlib.Path): write one partitioned dataset here
+        instead (see cache.write_events_dataset)
+    max_workers (int): number of threads, or None for one per core
+    refresh (bool): convert files even if they were converted before
+    progress (Callable[[IngestResult], None]): called as each file finishes
+    Returns
+    IngestReport
+    Raises
+    ValueError
+        If a file does not follow schema.COL_SCHEMA or has unknown codes
+    '''
+    paths = list(paths)
+    start = time.perf_counter()
+    report = IngestReport()
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as pool:
+        futures = [pool.submit(ingest_file, path, cache_dir=cache_dir,
+                               dataset_dir=dataset_dir, refresh=refresh)
+                   for path in paths]
+        for future in futures:
+            result = future.result()
+            report.files.append(result)
+            if progress is not None:
+                progress(result)
+    report.seconds = time.perf_counter() - start
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk conversion of LOBSTER message files")
+    parser.add_argument("data_root", help="folder searched for LOBSTER message files")
+    parser.add_argument("--tickers", nargs="+", default=None)
+    parser.add_argument("--dates", nargs="+", default=None)
+    parser.add_argument("--workers", type=int, default=None, help="threads, one per core by default")
+    parser.add_argument("--cache-dir", default=None, help="EventCache folder")
+    parser.add_argument("--dataset", default=None,
+                        help="write one dataset partitioned by ticker and date instead")
+    parser.add_argument("--refresh", action="store_true", help="convert files converted before")
+    args = parser.parse_args()
+
+    def show(result):
+        if result.skipped:
+            print(f'{result.path.name}: up to date')
+        else:
+            print(f'{result.path.name}: {result.rows:,} rows, {result.bytes / 1e6:.1f} MB '
+                  f'in {result.seconds:.2f} s')
+
+    paths = [path for _, _, path in discover_days(args.data_root, args.tickers, args.dates)]
+    report = ingest(paths, cache_dir=args.cache_dir, dataset_dir=args.dataset,
+                    max_workers=args.workers, refresh=args.refresh, progress=show)
+    print(report.summary())
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,81 @@ Functionality for parsing a .csv file of event orders into
 an iterable, using the types defined in schema.py
 '''
 
+import re
+import numpy as np
 import pyarrow as pa
 import pyarrow.csv
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Optional
 import lob_market_making_sim.io.schema as schema
 from lob_market_making_sim.io.schema import TICK_SIZE
 
+# Default number of bytes parsed per block when streaming a message file
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+# LOBSTER file names: TICKER_Year-Month-Day_StartTime_EndTime_message_LEVEL.csv
+LOBSTER_NAME = re.compile(r'^(?P<ticker>[^_]+)_(?P<date>\d{4}-\d{2}-\d{2})_\d+_\d+_(?P<kind>message|orderbook)_(?P<level>\d+)\.csv$')
+
+def parse_lobster_name(path):
+    '''
+    Reads the ticker and trading day from a LOBSTER file name.
+    Parameters:
+    path (str or pathlib.Path): message or orderbook file
+    Returns:
+    (str, str): ticker and date ('YYYY-MM-DD')
+    Raises:
+    ValueError
+        If the name does not follow the LOBSTER convention
+    '''
+    match = LOBSTER_NAME.match(Path(path).name)
+    if match is None:
+        raise ValueError(f'Not a LOBSTER file name: {Path(path).name}')
+    return match['ticker'], match['date']
+
+def discover_days(data_root: str | Path, tickers: Optional[Iterable[str]] = None,
+                  dates: Optional[Iterable[str]] = None) -> list[tuple[str, str, Path]]:
+    '''
+    Finds the LOBSTER message files under a folder and its subfolders.
+    Parameters:
+    data_root (str or pathlib.Path): folder to search
+    tickers (Iterable[str]): only keep these tickers, or None for all
+    dates (Iterable[str]): only keep these days ('YYYY-MM-DD'), or None for all
+    Returns:
+    list[(str, str, pathlib.Path)]: (ticker, date, path), sorted by ticker and date
+    Raises:
+    ValueError
+        If two message files have the same ticker and day
+    '''
+    tickers = set(tickers) if tickers is not None else None
+    dates = set(dates) if dates is not None else None
+    days = {}
+    for path in sorted(Path(data_root).rglob('*_message_*.csv')):
+        match = LOBSTER_NAME.match(path.name)
+        if match is None or match['kind'] != 'message':
+            continue
+        ticker, date = match['ticker'], match['date']
+        if (tickers is not None and ticker not in tickers) or (dates is not None and date not in dates):
+            continue
+        if (ticker, date) in days:
+            raise ValueError(f'Two message files for {ticker} {date}: {days[ticker, date]} and {path}')
+        days[ticker, date] = path
+    return [(ticker, date, path) for (ticker, date), path in sorted(days.items())]
+
+def _csv_options(block_size=None):
+    '''
+    Options shared by the whole-file and streaming CSV readers.
+    Parameters:
+    block_size (int): bytes parsed per block, or None for the PyArrow default
+    Returns:
+    (pa.csv.ReadOptions, pa.csv.ConvertOptions)
+    '''
+    read_options = pa.csv.ReadOptions(column_names=list(schema.COLS)) # Set appropriate column names
+    if block_size is not None:
+        read_options.block_size = block_size
+    convert_options = pa.csv.ConvertOptions(column_types=schema.COL_SCHEMA) # Enforce types
+    return read_options, convert_options
+
 def lobster_to_arrow(raw_msg_path):
     '''
     Converts the data contained in a LOBSTER dataset to a pandas Table.
@@ -19,24 +89,71 @@ def lobster_to_arrow(raw_msg_path):
     Raises:
     '''
 
-    convert_options = pa.csv.ConvertOptions(column_types=schema.COL_SCHEMA) # Enforce types
-    read_options = pa.csv.ReadOptions(column_names=list(schema.COLS)) # Set appropriate column names
+    read_options, convert_options = _csv_options()
     return pa.csv.read_csv(raw_msg_path,
                            read_options=read_options,
                            convert_options=convert_options)
 
-def arrow_to_events(table):
+def iter_lobster_batches(raw_msg_path, block_size: int = DEFAULT_BLOCK_SIZE):
+    '''
+    Streams a LOBSTER message file as record batches, parsing one block
+    at a time so memory does not grow with the length of the file.
+    Parameters:
+    raw_msg_path (string): location of the .csv file to be read
+    block_size (int): approximate number of bytes parsed per batch
+    Returns:
+    Iterator[pa.RecordBatch]: batches following schema.COL_SCHEMA
+    '''
+    read_options, convert_options = _csv_options(block_size)
+    reader = pa.csv.open_csv(raw_msg_path,
+                             read_options=read_options,
+                             convert_options=convert_options)
+    for batch in reader:
+        yield batch
+
+def iter_lobster_events(raw_msg_path, block_size: int = DEFAULT_BLOCK_SIZE):
+    '''
+    Lazily yields the OrderEvents of a LOBSTER message file, so that
+    ReplayEngine.run can start before the file has been fully parsed.
+    Parameters:
+    raw_msg_path (string): location of the .csv file to be read
+    block_size (int): approximate number of bytes parsed per batch
+    Returns:
+    Iterator[OrderEvent]
+    '''
+    for batch in iter_lobster_batches(raw_msg_path, block_size):
+        yield from arrow_to_events(batch)
+
+def iter_lobster_columns(raw_msg_path, block_size: int = DEFAULT_BLOCK_SIZE):
+    '''
+    Lazily yields a LOBSTER message file as one EventColumns per batch.
+    ReplayEngine keeps its state between calls to run, so each chunk
+    can be replayed as soon as it is parsed:
+        for cols in iter_lobster_columns(path):
+            engine.run(cols)
+    Parameters:
+    raw_msg_path (string): location of the .csv file to be read
+    block_size (int): approximate number of bytes parsed per batch
+    Returns:
+    Iterator[EventColumns]
+    '''
+    for batch in iter_lobster_batches(raw_msg_path, block_size):
+        yield arrow_to_columns(batch)
+
+def arrow_to_events(table, ticks: bool = False):
     '''
     Converts information in a Pyarrow data loaded from LOBSTER order events
     to an iterable of OrderEvents.
     Parameters:
-    table (pa.Table): table with relevent order event information
+    table (pa.Table or pa.RecordBatch): table with relevent order event information
+    ticks (bool): keep prices in integer ticks instead of dollars
     Returns:
     Iterable[OrderEvent]
     '''
     events = []
     for row in table.to_pylist():
-        row['price'] = row['price'] * TICK_SIZE # Convert prices to dolalrs
+        if not ticks:
+            row['price'] = row['price'] * TICK_SIZE # Convert prices to dolalrs
         # Create an OrderEvent for each row
         events.append(schema.OrderEvent(ts=row['time'],
                           etype=schema.EventType(row['event_type'],), # Use the enum EventType
@@ -45,4 +162,125 @@ def arrow_to_events(table):
                           price=row['price'],
                           direction=schema.Direction(row['direction'])))
     return events
-        
\ No newline at end of file
+
+# Object arrays mapping integer codes to enums, indexed by the event type
+# code and by direction + 1 (Direction codes are -1 and 1)
+_EVENT_TYPE_LUT = np.array([schema.EVENT_TYPE_BY_CODE.get(code) for code in range(8)], dtype=object)
+_DIRECTION_LUT = np.array([schema.Direction.SELL, None, schema.Direction.BUY], dtype=object)
+
+@dataclass(slots=True)
+class EventColumns:
+    '''
+    A day of order events stored column-wise as typed NumPy arrays
+    (one entry per message), rather than as a list of OrderEvents.
+    Rows are decoded only as they are replayed, so no per-event
+    objects are kept alive for the whole day. That decoding is paid
+    during the replay: loading is much faster and lighter than building
+    OrderEvents, but replaying is slightly slower than replaying a
+    prebuilt list of them (see benchmarks/bench_columns.py).
+    '''
+    ts: np.ndarray # seconds after midnight
+    etype: np.ndarray # EventType codes
+    oid: np.ndarray # order ids
+    size: np.ndarray # shares
+    price: np.ndarray # price in integer ticks
+    direction: np.ndarray # Direction codes
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, i):
+        '''
+        Indexing with an int builds a single OrderEvent (for code that
+        expects one), while slicing returns a view of the columns.
+        '''
+        if isinstance(i, slice):
+            return EventColumns(self.ts[i], self.etype[i], self.oid[i],
+                                self.size[i], self.price[i], self.direction[i])
+        return schema.OrderEvent(*self.row(i))
+
+    def time_window(self, start: float | None = None, end: float | None = None) -> 'EventColumns':
+        '''
+        Returns the events in [start, end) as a view of the columns, found
+        by binary search on the (sorted) timestamps, so a window of a
+        memory-mapped day only touches the pages it covers.
+        Parameters
+        start (float): first time kept (seconds after midnight), or None
+        end (float): time after the last event kept, or None
+        Returns
+        EventColumns
+        '''
+        lo = 0 if start is None else int(np.searchsorted(self.ts, start, side='left'))
+        hi = len(self) if end is None else int(np.searchsorted(self.ts, end, side='left'))
+        return self[lo:max(lo, hi)]
+
+    def row(self, i: int) -> tuple:
+        '''
+        Decodes one row into the values the book and engine expect.
+        Parameters
+        i (int): index of the row
+        Returns
+        tuple: (ts, EventType, oid, size, price in dollars, Direction)
+        '''
+        return (self.ts[i].item(),
+                schema.EVENT_TYPE_BY_CODE[self.etype[i].item()],
+                self.oid[i].item(),
+                self.size[i].item(),
+                self.price[i].item() * TICK_SIZE,
+                schema.DIRECTION_BY_CODE[self.direction[i].item()])
+
+    def iter_chunks(self, chunk_size: int = 65536, ticks: bool = False):
+        '''
+        Decodes the columns one chunk at a time, so memory stays bounded.
+        Enum lookups and the tick -> dollar conversion are done with NumPy
+        for the whole chunk instead of once per row.
+        Parameters
+        chunk_size (int): number of rows decoded at once
+        ticks (bool): give prices as integer ticks instead of dollars
+        Yields
+        tuple of lists: ts, EventType, oid, size, price, Direction
+        '''
+        for start in range(0, len(self), chunk_size):
+            stop = start + chunk_size
+            price = self.price[start:stop]
+            yield (self.ts[start:stop].tolist(),
+                   _EVENT_TYPE_LUT[self.etype[start:stop]].tolist(),
+                   self.oid[start:stop].tolist(),
+                   self.size[start:stop].tolist(),
+                   price.tolist() if ticks else (price * TICK_SIZE).tolist(),
+                   _DIRECTION_LUT[self.direction[start:stop] + 1].tolist())
+
+    def iter_rows(self, chunk_size: int = 65536, ticks: bool = False):
+        '''
+        Yields decoded rows in order.
+        Parameters
+        chunk_size (int): number of rows decoded at once
+        ticks (bool): give prices as integer ticks instead of dollars
+        Yields
+        tuple: (ts, EventType, oid, size, price, Direction)
+        '''
+        for chunk in self.iter_chunks(chunk_size, ticks):
+            yield from zip(*chunk)
+
+def arrow_to_columns(table):
+    '''
+    Converts a Pyarrow table loaded from LOBSTER order events to
+    EventColumns, without building an OrderEvent per row.
+    Parameters:
+    table (pa.Table or pa.RecordBatch): table with relevent order event information
+    Returns:
+    EventColumns
+    '''
+    def _col(name):
+        col = table.column(name)
+        if isinstance(col, pa.ChunkedArray): # Tables may hold several chunks
+            col = col.combine_chunks()
+        # A single array converts to NumPy without copying
+        return col.to_numpy()
+
+    return EventColumns(ts=_col('time'),
+                        etype=_col('event_type'),
+                        oid=_col('order_id'),
+                        size=_col('size'),
+                        price=_col('price'),
+                        direction=_col('direction'))
@@ -0,0 +1,122 @@
+'''
+query.py
+Loads only part of a day (a time window, some event types, some tickers
+or dates) from Parquet event files, pushing the selection down to the
+scan. Message files are sorted by time, so each row group of a cached
+day covers a narrow time range, and row groups whose min/max statistics
+fall outside the window are never read or decompressed. In a dataset
+written by cache.write_events_dataset, tickers and dates outside the
+selection are skipped by folder name.
+
+Usage
+table = load_events('data/AMZN_2012-06-21_34200000_57600000_message_1.csv',
+                    start=34200, end=37800, event_types=BOOK_EVENT_TYPES)
+engine.run(arrow_to_columns(table))
+'''
+
+from pathlib import Path
+from typing import Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from lob_market_making_sim.io.cache import EventCache
+from lob_market_making_sim.io.schema import EventType
+
+# Event types that change the book or can fill the agent. OrderBookL1
+# ignores hidden executions and halts, so dropping them leaves the book
+# unchanged (the engine then just requotes and records midprices on
+# fewer events).
+BOOK_EVENT_TYPES = (EventType.ADD, EventType.CANCEL, EventType.DELETE,
+                    EventType.EXECUTE_VISIBLE, EventType.CROSS)
+
+def events_filter(start: Optional[float] = None, end: Optional[float] = None,
+                  event_types: Optional[Iterable[EventType | int]] = None,
+                  tickers: Optional[Iterable[str]] = None,
+                  dates: Optional[Iterable[str]] = None) -> Optional[ds.Expression]:
+    '''
+    Builds the scan filter of a selection of events.
+    Parameters
+    start (float): keep events at or after this time (seconds after midnight)
+    end (float): keep events before this time
+    event_types (Iterable[EventType or int]): keep only these types
+    tickers, dates (Iterable[str]): keep only these partitions of a dataset
+    Returns
+    ds.Expression: the filter, or None to keep every event
+    '''
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field('time') >= start)
+    if end is not None:
+        conditions.append(ds.field('time') < end)
+    if event_types is not None:
+        codes = [e.value if isinstance(e, EventType) else int(e) for e in event_types]
+        conditions.append(ds.field('event_type').isin(pa.array(codes, pa.int8())))
+    if tickers is not None:
+        conditions.append(ds.field('ticker').isin(list(tickers)))
+    if dates is not None:
+        conditions.append(ds.field('date').isin(list(dates)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def events_dataset(source: str | Path, cache_dir: str | Path | None = None) -> ds.Dataset:
+    '''
+    Opens a source of events as a pyarrow dataset.
+    Parameters
+    source (str or pathlib.Path): LOBSTER message file (read through an
+        EventCache), Parquet event file, or folder written by
+        cache.write_events_dataset
+    cache_dir (str or pathlib.Path): EventCache folder for message files,
+        or None for the default
+    Returns
+    ds.Dataset
+    '''
+    source = Path(source)
+    if source.suffix == '.csv':
+        cache = EventCache(cache_dir)
+        cache.ensure(source) # converts the file on first use, without reading it
+        source = cache.path_for(source)
+    if source.is_dir():
+        return ds.dataset(source, format='parquet', partitioning='hive')
+    return ds.dataset(source, format='parquet')
+
+def load_events(source: str | Path, *, start: Optional[float] = None,
+                end: Optional[float] = None,
+                event_types: Optional[Iterable[EventType | int]] = None,
+                tickers: Optional[Iterable[str]] = None,
+                dates: Optional[Iterable[str]] = None,
+                cache_dir: str | Path | None = None) -> pa.Table:
+    '''
+    Reads the selected events of a source, in file order.
+    Parameters
+    source (str or pathlib.Path): see events_dataset
+    start, end, event_types, tickers, dates: see events_filter
+    cache_dir (str or pathlib.Path): see events_dataset
+    Returns
+    pa.Table: events following schema.CACHE_SCHEMA (plus ticker and date
+        for a partitioned dataset), ready for loader.arrow_to_columns
+    '''
+    dataset = events_dataset(source, cache_dir)
+    return dataset.to_table(filter=events_filter(start, end, event_types, tickers, dates))
+
+def row_groups_scanned(source: str | Path, **selection) -> tuple[int, int]:
+    '''
+    Counts the row groups a selection has to read, out of all of them.
+    Parameters
+    source (str or pathlib.Path): see events_dataset
+    selection: start, end, event_types, tickers, dates or cache_dir
+    Returns
+    (int, int): row groups read and row groups in the source
+    '''
+    cache_dir = selection.pop('cache_dir', None)
+    dataset = events_dataset(source, cache_dir)
+    expression = events_filter(**selection)
+    scanned = total = 0
+    for fragment in dataset.get_fragments():
+        total += fragment.num_row_groups
+    for fragment in dataset.get_fragments(filter=expression):
+        scanned += len(fragment.split_by_row_group(expression, schema=dataset.schema))
+    return scanned, total
@@ -15,6 +15,10 @@ import pyarrow as pa
 
 TICK_SIZE = 1e-4
 
+# Price units (ticks of TICK_SIZE dollars) in one cent. Replays in integer
+# ticks place the agent's quotes on this grid.
+TICKS_PER_CENT = 100
+
 COLS = ['time', 'event_type', 'order_id', 'size', 'price', 'direction']
 COL_SCHEMA = events_schema = pa.schema([
         pa.field('time', pa.float64()),
@@ -25,6 +29,17 @@ COL_SCHEMA = events_schema = pa.schema([
         pa.field('direction', pa.int64())
     ])
 
+# Pre-normalized layout of cached message files: prices stay in integer
+# ticks (exact) and the enum codes are stored as small ints
+CACHE_SCHEMA = pa.schema([
+        pa.field('time', pa.float64()),
+        pa.field('event_type', pa.int8()),
+        pa.field('order_id', pa.int64()),
+        pa.field('size', pa.int64()),
+        pa.field('price', pa.int64()),
+        pa.field('direction', pa.int8())
+    ])
+
 class Direction(Enum): 
     '''
     Direction of trade as indicated in the message file.
@@ -43,13 +58,18 @@ class EventType(Enum):
     EXECUTE_HIDDEN = 5      # Execution of a hidden limit order
     CROSS = 6               # Inditates a cross/auction trade
     HALT = 7                # Trade halt indicator
-    
+
+# Lookups from the integer codes in the message file to the enums,
+# cheaper than calling the Enum constructor once per row
+EVENT_TYPE_BY_CODE = {e.value: e for e in EventType}
+DIRECTION_BY_CODE = {d.value: d for d in Direction}
+
 @dataclass(slots=True)
 class OrderEvent:
     '''
     One event, as formatted in the message file.
     '''
-    ts: int # nanoseconds since midnight
+    ts: float # seconds after midnight
     etype: EventType
     oid: int # unique order id
     size: int # shares after event
@@ -3,70 +3,265 @@ store.py
 '''
 
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Sequence
+
+# Rows per Parquet row group. Readers skip whole row groups using their
+# min/max statistics, so smaller groups prune finer but cost more metadata
+DEFAULT_ROW_GROUP_SIZE = 128 * 1024
+
+# File written in each partition folder
+PART_NAME = 'part-0.parquet'
+
+# Tells flush to use the compression given to the constructor
+_STORE_COMPRESSION = object()
 
 class ArrowStore:
     '''
     Helper that batches consecutive pyarrow.Tables in memory
-    and flushes them as one Parquet file.
+    and writes them as Parquet.
+
+    By default everything is kept until flush, which writes one file.
+    Given an out_path, the store writes as it goes instead: batches are
+    buffered only until a row group is full (or max_buffer_rows rows are
+    waiting) and then appended to the file through a ParquetWriter, so
+    memory stays bounded however much data goes through.
+
+    With partition_cols, out_path is a folder and rows are split into a
+    hive-style layout (one folder per value, e.g. ticker=AMZN/date=2012-06-21),
+    so readers can skip whole files by predicate. The partition columns are
+    stored in the folder names, not in the files.
 
     Usage
     store = ArrowStore(schema=my_schema)
     for table in table_generator():
         store.add_batch(table)
     store.flush('data/parquet/AMZN_2025-06-12.parquet')
+
+    with ArrowStore(my_schema, 'data/parquet', partition_cols=['ticker', 'date'],
+                    compression='zstd') as store:
+        for table in table_generator():
+            store.add_batch(table)
     '''
-    def __init__(self, schema):
+    def __init__(self, schema, out_path: str | Path | None = None, *,
+                 row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+                 max_buffer_rows: Optional[int] = None,
+                 compression: Optional[str] = "snappy",
+                 compression_level: Optional[int] = None,
+                 use_dictionary: bool | Sequence[str] = True,
+                 partition_cols: Optional[Sequence[str]] = None):
         '''
         Parameters
         schema (pyarrow.Schema): the format that batches must conform to
+        out_path (str or pathlib.Path): write incrementally to this file (or
+            folder, with partition_cols), or None to buffer until flush
+        row_group_size (int): maximum rows per Parquet row group
+        max_buffer_rows (int): rows buffered over all partitions before they
+            are written even if their row groups are not full, by default
+            four row groups
+        compression ('snappy', 'zstd', None): Parquet column-level compression codec
+        compression_level (int): codec level (e.g. 1-22 for zstd), or None
+            for the codec default
+        use_dictionary (bool or list[str]): dictionary-encode every column,
+            none, or only the listed ones
+        partition_cols (list[str]): columns to partition the output by
+        Raises
+        ValueError
+            If a partition column is not in the schema
         '''
         self._schema = schema
         self._batches: List[pa.RecordBatch] = []
-    
+        self.row_group_size = row_group_size
+        self.max_buffer_rows = max_buffer_rows or 4 * row_group_size
+        self.compression = compression
+        self.compression_level = compression_level
+        self.use_dictionary = use_dictionary
+        self.partition_cols = list(partition_cols or [])
+        for name in self.partition_cols:
+            if schema.get_field_index(name) < 0:
+                raise ValueError(f'Partition column {name} is not in the schema.')
+        # Files hold every column except the partition columns
+        self._file_schema = pa.schema([f for f in schema if f.name not in self.partition_cols])
+
+        self._out_path = None if out_path is None else Path(out_path)
+        self._pending: Dict[tuple, List[pa.Table]] = {} # partition key -> tables waiting
+        self._pending_rows: Dict[tuple, int] = {}
+        self._buffered = 0 # rows waiting over all partitions
+        self._writers: Dict[tuple, pq.ParquetWriter] = {} # open files, by partition key
+
     def add_batch(self, tbl):
         '''
-        Appends a pyarrowTable to the in-memory buffer.
+        Appends a pyarrowTable to the in-memory buffer. When writing
+        incrementally, full row groups are written out right away.
         Parameters
-        tbl (pyarrow.Table): the next chunk of data to be parsed (but conform to schema)
+        tbl (pyarrow.Table or pyarrow.RecordBatch): the next chunk of data
+            to be parsed (but conform to schema)
         Raises
         ValueError
             If incoming schema differs from stored one
         '''
         if pa.schema(tbl.schema) != self._schema:
             raise ValueError('Incoming table schema does not match stored schema.')
-        # tbl.to_batches() converts pyarrow table to list of pyarrow RecordBatches
-        self._batches.extend(tbl.to_batches()) # use .extend since there may be multiple batches
-    
-    def flush(self, out_path: str | Path, 
+        if self._out_path is None and not self.partition_cols:
+            # tbl.to_batches() converts pyarrow table to list of pyarrow RecordBatches
+            batches = tbl.to_batches() if isinstance(tbl, pa.Table) else [tbl]
+            self._batches.extend(batches) # use .extend since there may be multiple batches
+            return
+
+        if isinstance(tbl, pa.RecordBatch):
+            tbl = pa.Table.from_batches([tbl])
+        for key, part in self._split(tbl):
+            self._buffer(key, part)
+            if self._out_path is not None and self._pending_rows[key] >= self.row_group_size:
+                self._write_pending(key, self._out_path, full_groups_only=True)
+        if self._out_path is not None and self._buffered >= self.max_buffer_rows:
+            for key in list(self._pending):
+                self._write_pending(key, self._out_path)
+
+    def flush(self, out_path: str | Path | None = None,
               *, # means that everything after must be specified as keyword parameter
-              compression: str = "snappy") -> Path:
+              compression: Optional[str] = _STORE_COMPRESSION) -> Path:
         '''
-        Write all buffered batches to a single Partqut file
-        and clear the buffer.
+        Writes all buffered batches and clears the buffer. Without an
+        out_path given to the constructor, this writes (and closes) a
+        single Parquet file, or a partitioned folder. When writing
+        incrementally, the buffered rows are appended and the files stay
+        open until close.
         Parameters
-        out_path (str or pathlib.Path): destination file
-        compression ('snappy', 'zstd', None): Parquet column-level compresison code
+        out_path (str or pathlib.Path): destination file (or folder, with
+            partition_cols); only when no out_path was given to the constructor
+        compression ('snappy', 'zstd', None): Parquet column-level compresison
+            code, by default the one given to the constructor
         Returns
-        pathlib.Path: fully qualified path of Parquet file written
+        pathlib.Path: fully qualified path of Parquet file (or folder) written
         Raises
         RuntimeError
             If no data to flush
+        ValueError
+            If out_path is missing, or differs from the incremental destination
         '''
-        out_path = Path(out_path)
-        # Creates the parent folder if it does not already exist
-        # without raising errors if it is already present
-        out_path.parent.mkdir(parents=True, exist_ok=True)
+        if compression is not _STORE_COMPRESSION:
+            self.compression = compression
+
+        if self._out_path is not None:
+            if out_path is not None and Path(out_path) != self._out_path:
+                raise ValueError(f'Store writes incrementally to {self._out_path}, not {out_path}.')
+            for key in list(self._pending):
+                self._write_pending(key, self._out_path)
+            return self._out_path
 
-        if not self._batches:
+        if out_path is None:
+            raise ValueError('flush needs an out_path when none was given to the constructor.')
+        out_path = Path(out_path)
+        if not self._batches and not self._pending:
             raise RuntimeError('No data buffered - nothing to flush')
-        
-        # Convert to a pandas table from the already parsed batches
-        table = pa.Table.from_batches(self._batches, schema=self._schema)
-        # Write the table to a Parquet file at the given path with particular compression
-        pq.write_table(table, out_path, compression = compression)
-    
-        self._batches.clear() # Reset internal buffer
-        return out_path
\ No newline at end of file
+
+        if self._batches:
+            # Batches were appended as they came; the whole file is written at once
+            self._buffer((), pa.Table.from_batches(self._batches, schema=self._schema))
+            self._batches.clear() # Reset internal buffer
+        for key in list(self._pending):
+            self._write_pending(key, out_path)
+        self._close_writers()
+        return out_path
+
+    def close(self) -> Optional[Path]:
+        '''
+        Writes what is still buffered and closes the files of an
+        incremental store. An unpartitioned store that received no rows
+        still writes a file holding only the schema.
+        Returns
+        pathlib.Path: the file or folder written, or None if the store
+            was not writing incrementally
+        '''
+        if self._out_path is None:
+            return None
+        self.flush()
+        if not self.partition_cols and () not in self._writers:
+            self._writer_for((), self._out_path)
+        self._close_writers()
+        return self._out_path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _split(self, tbl: pa.Table):
+        '''
+        Splits a table by the values of the partition columns.
+        Returns
+        Iterator[(tuple, pa.Table)]: partition key and rows, without the
+            partition columns
+        '''
+        if not self.partition_cols:
+            yield (), tbl
+            return
+        keys = tbl.select(self.partition_cols).group_by(self.partition_cols).aggregate([])
+        rows = keys.to_pylist()
+        if len(rows) == 1: # common case, e.g. one day of one ticker per batch
+            yield tuple(rows[0][c] for c in self.partition_cols), tbl.drop_columns(self.partition_cols)
+            return
+        for row in rows:
+            mask = None
+            for name in self.partition_cols:
+                match = pc.equal(tbl[name], pa.scalar(row[name], tbl.schema.field(name).type))
+                mask = match if mask is None else pc.and_(mask, match)
+            yield (tuple(row[c] for c in self.partition_cols),
+                   tbl.filter(mask).drop_columns(self.partition_cols))
+
+    def _buffer(self, key: tuple, tbl: pa.Table):
+        '''
+        Adds rows to the buffer of one partition.
+        '''
+        self._pending.setdefault(key, []).append(tbl)
+        self._pending_rows[key] = self._pending_rows.get(key, 0) + tbl.num_rows
+        self._buffered += tbl.num_rows
+
+    def _write_pending(self, key: tuple, out_path: Path, full_groups_only: bool = False):
+        '''
+        Appends the rows buffered for one partition to its file. With
+        full_groups_only, a remainder smaller than a row group is kept
+        buffered so that row groups stay at row_group_size.
+        '''
+        table = pa.concat_tables(self._pending.pop(key))
+        self._buffered -= self._pending_rows.pop(key)
+        if full_groups_only:
+            n = table.num_rows - table.num_rows % self.row_group_size
+            if n < table.num_rows:
+                self._buffer(key, table.slice(n))
+            table = table.slice(0, n)
+        if table.num_rows:
+            self._writer_for(key, out_path).write_table(table, row_group_size=self.row_group_size)
+
+    def _writer_for(self, key: tuple, out_path: Path) -> pq.ParquetWriter:
+        '''
+        Returns the open writer of a partition, creating its file (and
+        folders) on first use.
+        '''
+        writer = self._writers.get(key)
+        if writer is None:
+            path = out_path
+            if self.partition_cols:
+                path = out_path.joinpath(*(f'{name}={value}' for name, value
+                                           in zip(self.partition_cols, key)), PART_NAME)
+            # Creates the parent folder if it does not already exist
+            # without raising errors if it is already present
+            path.parent.mkdir(parents=True, exist_ok=True)
+            writer = pq.ParquetWriter(path, self._file_schema,
+                                      compression=self.compression,
+                                      compression_level=self.compression_level,
+                                      use_dictionary=self.use_dictionary)
+            self._writers[key] = writer
+        return writer
+
+    def _close_writers(self):
+        '''
+        Closes every open file, which writes its footer.
+        '''
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
@@ -11,9 +11,12 @@ If you estimated volatility in ticks per √second and then converted prices
 to dollars, multiply by TICK_SIZE once when you create the ASParams.
 '''
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from typing import Sequence
 from lob_market_making_sim.models.base import MarketMaker
+from lob_market_making_sim.evaluation.vol import EWMAVolEstimator
 import math
+import numpy as np
 
 @dataclass(frozen=True)
 class ASParams:
@@ -40,6 +43,82 @@ def reservation_price(mid: float, q: int, params: ASParams, tau : float) -> floa
     '''
     return mid - (q * params.gamma * (params.sigma **2 )* tau)
 
+@dataclass(frozen=True)
+class ASParamsArray:
+    '''
+    Many ASParams stored as arrays, for quoting every configuration
+    in one NumPy call. The time-invariant parts of the formulas are
+    computed once per configuration with the same scalar math as
+    optimal_spread / reservation_price, so batch quotes match the
+    scalar ones exactly (operations are applied in the same order).
+    '''
+    gamma: np.ndarray
+    kappa: np.ndarray
+    sigma: np.ndarray
+    qmax: np.ndarray
+    spread_const: np.ndarray # (2 / gamma) * log(1 + gamma / kappa)
+    sigma_sq: np.ndarray # sigma ** 2
+
+    @classmethod
+    def from_params(cls, params: Sequence[ASParams]) -> "ASParamsArray":
+        '''
+        Parameters
+        params (Sequence[ASParams]): one entry per configuration
+        '''
+        return cls(gamma=np.array([p.gamma for p in params], dtype=float),
+                   kappa=np.array([p.kappa for p in params], dtype=float),
+                   sigma=np.array([p.sigma for p in params], dtype=float),
+                   qmax=np.array([p.qmax for p in params], dtype=np.int64),
+                   spread_const=np.array([(2 / p.gamma) * math.log(1 + p.gamma / p.kappa)
+                                          for p in params], dtype=float),
+                   sigma_sq=np.array([p.sigma ** 2 for p in params], dtype=float))
+
+    def __len__(self):
+        return len(self.gamma)
+
+def optimal_spread_batch(q: np.ndarray, params: ASParamsArray, tau: float) -> np.ndarray:
+    '''
+    Vectorized optimal_spread, one value per configuration.
+    '''
+    return params.spread_const + (params.gamma * params.sigma_sq * tau)
+
+def reservation_price_batch(mid: float, q: np.ndarray, params: ASParamsArray,
+                            tau: float) -> np.ndarray:
+    '''
+    Vectorized reservation_price, one value per configuration.
+    Parameters
+    mid (float): current midprice
+    q (np.ndarray): inventory of each configuration
+    params (ASParamsArray): simulation parameters
+    '''
+    return mid - (q * params.gamma * params.sigma_sq * tau)
+
+def quote_batch(mid: float, inv: np.ndarray, t: float, params: ASParamsArray,
+                horizon_sec: int = 6*60*60) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Vectorized AvellanedaStoikov.quote for many configurations at once.
+    Parameters
+    mid (float): current midprice, in dollars
+    inv (np.ndarray): number of shares held by each configuration
+    t (float): current time
+    params (ASParamsArray): simulation parameters
+    horizon_sec (int): trading horizon shared by all configurations
+    Returns
+    tuple[np.ndarray, np.ndarray]: bids and asks in dollars, NaN where the
+        inventory guard stops quoting that side
+    '''
+    tau = max(horizon_sec - t, 0)
+    delta = optimal_spread_batch(inv, params, tau)
+    r = reservation_price_batch(mid, inv, params, tau)
+
+    bid_px = r - delta/2
+    ask_px = r + delta/2
+
+    # inventory hard guard
+    bid_px[inv >= params.qmax] = np.nan
+    ask_px[inv <= -params.qmax] = np.nan
+    return bid_px, ask_px
+
 class AvellanedaStoikov(MarketMaker):
     '''
     Stateless implementation of the Avellaneda & Stoikov (2008)
@@ -60,20 +139,59 @@ class AvellanedaStoikov(MarketMaker):
         Returns
         tuple[float, float]: final bid, final ask in dollars
         '''
+        return self._quote(mid, inv, t, self.params)
+
+    def _quote(self, mid : float, inv : int, t: float, params: ASParams) -> tuple[float, float]:
+        '''
+        Quote formulas for a given set of parameters.
+        '''
         tau = max(self._T - t, 0)
-        delta = optimal_spread(inv, self.params, tau)
-        r = reservation_price(mid, inv, self.params, tau)
+        delta = optimal_spread(inv, params, tau)
+        r = reservation_price(mid, inv, params, tau)
 
         bid_px = r - delta/2
         ask_px = r + delta/2
 
         # inventory hard guard
-        if inv >= self.params.qmax:        # LONG -> stop bidding
+        if inv >= params.qmax:        # LONG -> stop bidding
             bid_px = None
-        if inv <= -self.params.qmax:        # SHORT -> stop offering
+        if inv <= -params.qmax:        # SHORT -> stop offering
             ask_px = None
         return bid_px, ask_px
 
-    def reset():
+    def reset(self):
         pass
 
+class AdaptiveAvellanedaStoikov(AvellanedaStoikov):
+    '''
+    Avellaneda & Stoikov quoting with sigma read from an online
+    volatility estimator instead of the fixed ASParams.sigma.
+
+    The estimator is fed by the engine (pass the same object as
+    ReplayEngine's vol_estimator), so the strategy itself only reads it.
+    Until the estimator is ready, params.sigma is used.
+    '''
+
+    def __init__(self, params: ASParams, estimator: EWMAVolEstimator,
+                 horizon_sec: int = 6*60*60, sigma_scale: float = 1.0):
+        '''
+        Parameters
+        params (ASParams): simulation parameters (sigma is the fallback)
+        estimator (EWMAVolEstimator): source of the current volatility
+        horizon_sec (int): trading horizon in seconds
+        sigma_scale (float): converts estimator.sigma to the units of
+            ASParams.sigma (e.g. from annualized log returns to $/sqrt(sec))
+        '''
+        super().__init__(params, horizon_sec)
+        self.estimator = estimator
+        self.sigma_scale = sigma_scale
+
+    def quote(self, mid : float, inv : int, t: float) -> tuple[float, float]:
+        '''
+        Same as AvellanedaStoikov.quote, using the estimated sigma.
+        '''
+        if not self.estimator.ready:
+            return self._quote(mid, inv, t, self.params)
+        params = replace(self.params, sigma=self.estimator.sigma * self.sigma_scale)
+        return self._quote(mid, inv, t, params)
+
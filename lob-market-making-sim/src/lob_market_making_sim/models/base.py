@@ -4,6 +4,7 @@ A single parent class to swap A-S with RL later.
 '''
 
 from abc import ABC, abstractmethod # To create abstract base classes
+from lob_market_making_sim.io.schema import TICK_SIZE, TICKS_PER_CENT
 
 class MarketMaker(ABC):
     @abstractmethod
@@ -21,4 +22,21 @@ class MarketMaker(ABC):
         '''
         Clear internal state before a new replay run.
         '''
-        pass
\ No newline at end of file
+        pass
+
+    def quote_ticks(self, mid: float, inv: int, t: float) -> tuple[int, int]:
+        '''
+        Same as quote, with prices in integer ticks, for engines replaying
+        in ticks. Strategies that quote in dollars are converted here, and
+        their quotes are rounded to the nearest cent, the same rounding
+        the engine applies to dollar quotes when checking fills.
+        Parameters
+        mid (float): current midprice, in ticks
+        inv (int): number of shares
+        t (float): current time
+        Returns
+        tuple[int, int]: bid and ask in ticks, None for a side not quoted
+        '''
+        bid, ask = self.quote(mid * TICK_SIZE, inv, t)
+        return (None if bid is None else round(bid * 100) * TICKS_PER_CENT,
+                None if ask is None else round(ask * 100) * TICKS_PER_CENT)
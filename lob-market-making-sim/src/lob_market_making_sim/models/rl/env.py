@@ -16,8 +16,12 @@ import numpy as np
 from typing import Iterable
 from lob_market_making_sim.core.engine import ReplayEngine
 from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.profiler import Profiler
 from lob_market_making_sim.io.schema import OrderEvent
 from lob_market_making_sim.io.schema import EventType, Direction
+from lob_market_making_sim.io.loader import EventColumns
+from lob_market_making_sim.io.checkpoint import restore_book
+from lob_market_making_sim.models.rl.features import BEST_BID, BEST_ASK, EXT_BID, EXT_ASK, CLEAN_MID, TIME
 
 NORMALIZED = True
 
@@ -25,9 +29,44 @@ class LOBMarketMakerEnv(gym.Env):
     '''
     Market-Making environment for a day of trading.
     '''
-    def __init__(self, event_sequence: Iterable[OrderEvent],
+    def __init__(self, event_sequence: Iterable[OrderEvent] | EventColumns,
                  inventory_limit: int = 1000,
-                 lambda_ = 1e-3, alpha_ = 1e-4):
+                 lambda_ = 1e-3, alpha_ = 1e-4,
+                 market_features: np.ndarray = None, copy_obs: bool = True,
+                 decision_every: int = None, decision_interval: float = None,
+                 decide_on_top_change: bool = False, checkpoint_dir=None,
+                 profiler: Profiler = None):
+        '''
+        Parameters
+        event_sequence: the day of events to replay
+        inventory_limit (int): no quotes are posted that would grow the
+            inventory past this many shares
+        lambda_, alpha_: linear and quadratic inventory penalties
+        market_features (np.ndarray): optional output of
+            features.compute_market_features for event_sequence. The
+            market side of the book is then read from it instead of being
+            replayed, and order_book holds only the agent's quotes
+        copy_obs (bool): return a copy of the observation buffer; with
+            False every step returns (and overwrites) the same array
+        decision_every (int): act at most every this many events
+        decision_interval (float): act once this much exchange time (in
+            the units of the event timestamps) has passed since the last action
+        decide_on_top_change (bool): act when the best external bid or ask
+            has changed since the last action
+
+        checkpoint_dir (str or pathlib.Path): book checkpoints of the day
+            (io/checkpoint.py), used by reset to start mid-day
+        profiler (Profiler): optional instrumentation (core/profiler.py)
+            of the stages of each step, and of the time the agent takes
+            between two steps (reported as policy)
+
+        Without any of decision_every, decision_interval and
+        decide_on_top_change every event is a decision point.
+        Otherwise an action is taken when any of them is met, and the
+        events in between are replayed with the quotes left resting;
+        step() then returns the sum of their per-event rewards and
+        info["num_events"] says how many events it consumed.
+        '''
 
         super().__init__()
 
@@ -35,7 +74,17 @@ class LOBMarketMakerEnv(gym.Env):
         self.alpha_ = alpha_
 
         self.event_sequence = event_sequence
+        self.market_features = market_features
         self.inventory_limit = inventory_limit
+        self.copy_obs = copy_obs
+        self.checkpoint_dir = checkpoint_dir
+
+        # Decision schedule
+        self.decision_every = decision_every
+        self.decision_interval = decision_interval
+        self.decide_on_top_change = decide_on_top_change
+        self._scheduled = (decision_every is not None or decision_interval is not None
+                           or decide_on_top_change)
 
         self.t = 0
         self.order_book = OrderBookL1()
@@ -57,9 +106,33 @@ class LOBMarketMakerEnv(gym.Env):
             high = np.array([1e6, 1e6, 1e6, 1e6, inventory_limit, 1.0]),
             dtype = np.float32
         )
+        self._obs = np.zeros(6, dtype=np.float32) # written in place by _get_obs
+
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.instrument(self, 'step', 'env.step', between='policy')
+            profiler.instrument(self, '_apply_current_event', 'env.apply', per_event=True)
+            profiler.instrument(self.order_book, 'apply_values', 'book.apply')
+            profiler.instrument(self.engine, 'match_values', 'engine.match')
+            profiler.instrument(self.order_book, 'mid_external', 'book.mid_external')
+            profiler.instrument(self.engine, '_update_quotes', 'engine.update_quotes')
+            profiler.instrument(self, '_event_reward', 'env.reward')
+            profiler.instrument(self, '_get_obs', 'env.observe')
 
     def reset(self, seed=None, options=None):
+        '''
+        Starts a new episode, by default at the first event of the day.
+        Parameters
+        options (dict): {'start_index': k} starts the episode after the
+            first k events, with the agent flat. The book is restored from
+            the latest checkpoint at or before k in checkpoint_dir (see
+            io/checkpoint.py) and only the events since are replayed; with
+            market_features nothing needs to be replayed.
+        '''
         super().reset(seed=seed)
+        if self.profiler is not None: # events the last episode's book skipped
+            for name, n in self.order_book.warning_counts().items():
+                self.profiler.count(f'book.{name}', n)
 
         # Reset internal markers
         self.t = 0 # Index for each event
@@ -67,8 +140,18 @@ class LOBMarketMakerEnv(gym.Env):
         self.order_book.reset()
         self.engine.reset(self.order_book)
 
+        start_index = (options or {}).get("start_index", 0)
+        if start_index:
+            if not 0 <= start_index < len(self.event_sequence):
+                raise ValueError(f"start_index {start_index} is outside the day's "
+                                 f"{len(self.event_sequence)} events")
+            if self.market_features is None: # the book holds the market, warm it up
+                restore_book(self.order_book, self.event_sequence, start_index,
+                             self.checkpoint_dir)
+            self.t = start_index
+
         # May not need to preload the first event
-        self.current_event = self.event_sequence[0]
+        self.current_event = self.event_sequence[self.t]
 
         # return obs
         return self._get_obs(), {}
@@ -78,67 +161,167 @@ class LOBMarketMakerEnv(gym.Env):
         bid_tick, ask_tick = self._decode_action(action) # returns integer *ticks*
 
         # 1: process current market event
-        event = self.event_sequence[self.t]
-        self.engine.apply_event(event)
+        decision_t = self.t
+        ts = self._apply_current_event()
+        self.t += 1
 
         # 2. compute clean mid AFTER tape event
-        clean_mid = self.order_book.mid_external()
-        if clean_mid is None:
-            # skip quoting this step
-            self.t += 1
-            return self._get_obs(), 0.0, self.t >= len(self.event_sequence), False, {}
-        bid_px = clean_mid + bid_tick * 0.01                # convert ticks → $
-        ask_px = clean_mid + ask_tick * 0.01
-        if self.engine.inv >= self.inventory_limit:
-            bid_px = None
-        if self.engine.inv <= -self.inventory_limit:
-            ask_px = None
-        
-        # 3. post / cancel our quotes
-        self.engine._update_quotes(bid_px, ask_px, event.ts)
+        clean_mid = self._clean_mid()
+        if clean_mid is not None: # otherwise skip quoting this step
+            bid_px = clean_mid + bid_tick * 0.01                # convert ticks → $
+            ask_px = clean_mid + ask_tick * 0.01
+            if self.engine.inv >= self.inventory_limit:
+                bid_px = None
+            if self.engine.inv <= -self.inventory_limit:
+                ask_px = None
+
+            # 3. post / cancel our quotes
+            self.engine._update_quotes(bid_px, ask_px, ts)
 
         # 4. reward (use engine states)
-        pnl = self.engine.cash + self.engine.inv * clean_mid
-        reward = pnl - self.lambda_ * abs(self.engine.inv) - self.alpha_ * self.engine.inv**2
+        reward = self._event_reward(clean_mid)
 
-        # 5: Step forward in time
-        self.t += 1
+        # 5: Step forward in time, to the next decision point
+        if self._scheduled:
+            reward += self._fast_forward(decision_t, ts)
         done = self.t >= len(self.event_sequence)
+        return self._get_obs(), reward, done, False, {"num_events": self.t - decision_t}
+
+    def _event_reward(self, clean_mid):
+        '''
+        Reward for the event just processed: marked-to-market P&L less
+        the inventory penalties, and the cost to unwind on the last event.
+        '''
+        if clean_mid is None:
+            return 0.0
+        pnl = self.engine.cash + self.engine.inv * clean_mid
+        reward = pnl - self.lambda_ * abs(self.engine.inv) - self.alpha_ * self.engine.inv**2
 
         # inventory liquidation - so agent learns to finish flat
-        if done:
+        if self.t >= len(self.event_sequence):
             reward -= abs(self.engine.inv) * 0.02     # cost to unwind
-        return self._get_obs(), reward, done, False, {}
+        return reward
+
+    def _fast_forward(self, decision_t, decision_ts):
+        '''
+        Replays events with the agent's quotes left resting until the next
+        decision point of the schedule or the end of the day.
+        Parameters
+        decision_t (int): index of the event the last action was taken on
+        decision_ts: timestamp of that event
+        Returns
+        float: the sum of the per-event rewards of the replayed events
+        '''
+        n = len(self.event_sequence)
+        top = self._external_top() if self.decide_on_top_change else None
+        reward = 0.0
+        while self.t < n:
+            # is the next event a decision point?
+            if self.decision_every is not None and self.t - decision_t >= self.decision_every:
+                break
+            if (self.decision_interval is not None
+                    and self._event_ts(self.t) - decision_ts >= self.decision_interval):
+                break
+            if top is not None and self._external_top() != top:
+                break
+            self._apply_current_event()
+            self.t += 1
+            reward += self._event_reward(self._clean_mid())
+        return reward
+
+    def _clean_mid(self):
+        '''
+        Returns the external midprice after the first t events, or None.
+        '''
+        if self.market_features is not None:
+            clean_mid = self.market_features[self.t, CLEAN_MID]
+            return None if clean_mid != clean_mid else float(clean_mid) # NaN if none
+        return self.order_book.mid_external()
+
+    def _external_top(self):
+        '''
+        Returns the best external bid and ask after the first t events.
+        '''
+        if self.market_features is not None:
+            bid = self.market_features[self.t, EXT_BID]
+            ask = self.market_features[self.t, EXT_ASK]
+            return (None if bid != bid else float(bid), None if ask != ask else float(ask))
+        return self.order_book.external_top()
+
+    def _event_ts(self, t):
+        if isinstance(self.event_sequence, EventColumns):
+            return float(self.event_sequence.ts[t])
+        return self.event_sequence[t].ts
+
+    def _apply_current_event(self):
+        '''
+        Applies the event at index t to the engine. Columnar event data
+        is read row by row without building an OrderEvent. With market
+        features the book holds only the agent's quotes, so the event is
+        only matched against them.
+        Returns
+        the timestamp of the event
+        '''
+        if isinstance(self.event_sequence, EventColumns):
+            ts, etype, oid, size, price, direction = self.event_sequence.row(self.t)
+        else:
+            event = self.event_sequence[self.t]
+            ts, etype, oid, size, price, direction = (event.ts, event.etype, event.oid,
+                                                      event.size, event.price, event.direction)
+        if self.market_features is not None:
+            self.engine.match_values(etype, size, price, direction)
+        else:
+            self.engine.apply_values(ts, etype, oid, size, price, direction)
+        return ts
 
     def _get_obs(self):
-        best_bid = self.order_book.best_bid.price
-        best_ask = self.order_book.best_ask.price
-        mid = self.order_book.midprice()
+        if self.market_features is not None:
+            best_bid, best_ask = self._live_top()
+            time_frac = self.market_features[self.t, TIME]
+        else:
+            best_bid = self.order_book.best_bid.price
+            best_ask = self.order_book.best_ask.price
+            time_frac = self.t / len(self.event_sequence)
+        mid = (best_bid + best_ask) / 2 # same as order_book.midprice()
 
         # Compute agent's current quotes (use last action or store them as attributes)
         agent_bid = getattr(self, "last_bid_price", best_bid)
         agent_ask = getattr(self, "last_ask_price", best_ask)
 
+        obs = self._obs
         if not NORMALIZED:
-            return np.array([
-                best_bid,
-                best_ask,
-                agent_bid,
-                agent_ask,
-                self.engine.inv / self.inventory_limit, # normalized inventory limit
-                self.t / len(self.event_sequence) # normalized time
-            ], dtype=np.float32)
+            obs[0] = best_bid
+            obs[1] = best_ask
+            obs[2] = agent_bid
+            obs[3] = agent_ask
         
         # Since we are trading across multiple tickers, it makes sense to normalize.
         else:
-            return np.array([
-                0 if mid == 0 else (best_bid - mid) / mid,
-                0 if mid == 0 else (best_ask - mid) / mid,
-                0 if mid == 0 else (agent_bid - mid) / mid,
-                0 if mid == 0 else (agent_ask - mid) / mid,
-                self.engine.inv / self.inventory_limit,
-                self.t / len(self.event_sequence)
-            ], dtype=np.float32)
+            obs[0] = 0 if mid == 0 else (best_bid - mid) / mid
+            obs[1] = 0 if mid == 0 else (best_ask - mid) / mid
+            obs[2] = 0 if mid == 0 else (agent_bid - mid) / mid
+            obs[3] = 0 if mid == 0 else (agent_ask - mid) / mid
+        obs[4] = self.engine.inv / self.inventory_limit # normalized inventory limit
+        obs[5] = time_frac # normalized time
+        return obs.copy() if self.copy_obs else obs
+
+    def _live_top(self):
+        '''
+        Best bid and ask of the book from the precomputed external top
+        and the agent's resting quotes, which are the only orders the
+        precomputation does not know about.
+        Returns
+        (float, float): best bid and best ask, 0 on an empty side
+        '''
+        features, t = self.market_features, self.t
+        best_bid, best_ask = float(features[t, BEST_BID]), float(features[t, BEST_ASK])
+        orders = self.order_book._orders
+        if self.engine.bid_oid is not None:
+            best_bid = max(best_bid, orders[self.engine.bid_oid].price)
+        if self.engine.ask_oid is not None:
+            agent_ask = orders[self.engine.ask_oid].price
+            best_ask = agent_ask if best_ask == 0 else min(best_ask, agent_ask)
+        return best_bid, best_ask
 
     def _decode_action(self, action):
         bid_offset = action // 7 - 3
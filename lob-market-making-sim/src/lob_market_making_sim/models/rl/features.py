@@ -0,0 +1,108 @@
+'''
+features.py
+Precomputed market features for LOBMarketMakerEnv.
+
+The agent's quotes never change the external (historical) orders in the
+book, so the best bid and ask, the best external bid and ask, the
+external midprice and the time fraction after each event are the same in every episode on a day.
+They are computed once by replaying the day without an agent, and the
+environment only computes the agent-dependent parts of its observation
+live.
+
+Row k of the feature array describes the book after the first k events,
+so a day of n events has n + 1 rows (row 0 is the empty book).
+
+Features of a binary event file (io/binary.py) are cached next to it as
+{TICKER}_{DATE}.features.npy and memory-mapped on later loads.
+'''
+
+import os
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.io.binary import EVENT_FILE_SUFFIX, load_event_file
+from lob_market_making_sim.io.loader import EventColumns
+
+FEATURE_COLUMNS = ('best_bid', 'best_ask', 'ext_bid', 'ext_ask', 'clean_mid', 'time')
+BEST_BID, BEST_ASK, EXT_BID, EXT_ASK, CLEAN_MID, TIME = range(len(FEATURE_COLUMNS))
+
+FEATURE_FILE_SUFFIX = '.features.npy'
+
+def compute_market_features(events) -> np.ndarray:
+    '''
+    Replays a day of events through an empty book with no agent.
+    Parameters
+    events (EventColumns or Sequence[OrderEvent]): the day's events
+    Returns
+    np.ndarray: float64 array of shape (len(events) + 1, len(FEATURE_COLUMNS));
+        best bid and ask are 0 on an empty side (as in OrderBookL1) and
+        clean_mid is NaN where OrderBookL1.mid_external returns None
+    '''
+    n = len(events)
+    features = np.empty((n + 1, len(FEATURE_COLUMNS)), dtype=np.float64)
+    features[:, TIME] = np.arange(n + 1) / max(n, 1)
+
+    ob = OrderBookL1()
+    features[0, BEST_BID:EXT_BID] = 0
+    features[0, EXT_BID:TIME] = np.nan
+
+    def record(k):
+        ext_bid, ext_ask = ob.external_top()
+        clean_mid = ob.mid_external()
+        features[k, BEST_BID] = ob.best_bid.price
+        features[k, BEST_ASK] = ob.best_ask.price
+        features[k, EXT_BID] = np.nan if ext_bid is None else ext_bid
+        features[k, EXT_ASK] = np.nan if ext_ask is None else ext_ask
+        features[k, CLEAN_MID] = np.nan if clean_mid is None else clean_mid
+
+    k = 1
+    if isinstance(events, EventColumns):
+        for chunk in events.iter_chunks():
+            for _, etype, oid, size, price, direction in zip(*chunk):
+                ob.apply_values(etype, oid, size, price, direction)
+                record(k)
+                k += 1
+    else:
+        for event in events:
+            ob.apply(event)
+            record(k)
+            k += 1
+    return features
+
+def features_path_for(event_path: str | Path) -> Path:
+    '''
+    Returns where the features of a binary event file are cached.
+    '''
+    event_path = Path(event_path)
+    name = event_path.name
+    stem = name[:-len(EVENT_FILE_SUFFIX)] if name.endswith(EVENT_FILE_SUFFIX) else event_path.stem
+    return event_path.with_name(stem + FEATURE_FILE_SUFFIX)
+
+def load_market_features(event_path: str | Path, refresh: bool = False) -> np.ndarray:
+    '''
+    Memory-maps the cached features of a binary event file, computing
+    and writing them first if they are missing, older than the events or
+    written with other columns.
+    Parameters
+    event_path (str or pathlib.Path): file written by io.binary.write_event_file
+    refresh (bool): recompute even if a cached file exists
+    Returns
+    np.memmap: the array returned by compute_market_features
+    '''
+    event_path = Path(event_path)
+    out_path = features_path_for(event_path)
+    stale = (refresh or not out_path.exists()
+             or out_path.stat().st_mtime_ns < event_path.stat().st_mtime_ns)
+    if not stale: # also rebuild files written with a different set of columns
+        stale = np.load(out_path, mmap_mode='r').shape[1:] != (len(FEATURE_COLUMNS),)
+    if stale:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore') # unknown order IDs are reported by the replay itself
+            features = compute_market_features(load_event_file(event_path))
+        tmp_path = out_path.with_name(f'{out_path.name}.{os.getpid()}.tmp.npy')
+        np.save(tmp_path, features)
+        os.replace(tmp_path, out_path)
+    return np.load(out_path, mmap_mode='r')
@@ -3,20 +3,28 @@ train_rl.py
 Trains the agent.
 
 tensorboard --logdir=./logs
-To run: poetry run python src/lob_market_making_sim/models/rl/train_rl.py
+To run: poetry run python src/lob_market_making_sim/models/rl/train_rl.py [--n-envs N] [--subproc] [--profile]
+
+With --subproc every environment runs in its own process. The days are
+converted once to binary event files (io/binary.py) which each worker
+memory-maps, so the events are not copied into every process.
 '''
 
+import argparse
 import numpy as np
 from pathlib import Path
 import random
 
 from stable_baselines3 import DQN
 from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.callbacks import EvalCallback
-from stable_baselines3.common.vec_env import DummyVecEnv
+from stable_baselines3.common.callbacks import BaseCallback, EvalCallback
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
 
+from lob_market_making_sim.core.profiler import Profiler
 from lob_market_making_sim.models.rl.env import LOBMarketMakerEnv
-from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_events
+from lob_market_making_sim.io.loader import arrow_to_events
+from lob_market_making_sim.io.cache import cached_lobster_to_arrow
+from lob_market_making_sim.io.binary import load_event_file, EventDataset
 
 BASE_DIR = Path(__file__).parent.parent.parent.parent.parent
 DATA_DIR = BASE_DIR / "data"
@@ -37,11 +45,13 @@ def load_all_tickers_for_date(data_dir, date_str="2012-06-21"):
     print(f"Found {len(paths)} tickers for {date_str}")
     return paths
 
-def make_env(path):
+def make_env(path, profile=False, **env_kwargs):
     '''
     Create a new environment per episode.
     Parameters:
     path: the datafile we would like to load into the environment
+    profile (bool): give the environment its own Profiler
+    env_kwargs: passed on to LOBMarketMakerEnv
     Returns:
     _init (function) to create a new Gymnasium environment
     '''
@@ -51,27 +61,90 @@ def make_env(path):
     # can create objects or environments with specific parameters)
     def _init():
         # Load events for one trading day
-        events_arrow = lobster_to_arrow(path)
+        events_arrow = cached_lobster_to_arrow(path)
         events = arrow_to_events(events_arrow)
-        env = LOBMarketMakerEnv(event_sequence=events)
+        profiler = Profiler() if profile else None
+        env = LOBMarketMakerEnv(event_sequence=events, profiler=profiler, **env_kwargs)
         return Monitor(env) # for TensorBoard logging
     return _init
 
+def make_memmap_env(event_path, profile=False, **env_kwargs):
+    '''
+    Like make_env, but for a binary event file, which is memory-mapped
+    rather than loaded, so the factory is cheap to send to a subprocess.
+    Parameters:
+    event_path: path to a .events.npy file
+    profile (bool): give the environment its own Profiler
+    env_kwargs: passed on to LOBMarketMakerEnv
+    Returns:
+    _init (function) to create a new Gymnasium environment
+    '''
+    def _init():
+        profiler = Profiler() if profile else None
+        env = LOBMarketMakerEnv(event_sequence=load_event_file(event_path), profiler=profiler,
+                                **env_kwargs)
+        return Monitor(env)
+    return _init
+
+class ProfilerCallback(BaseCallback):
+    '''
+    Logs the profilers of the training environments (summed) with the
+    DQN's own scalars, so they show up in the same TensorBoard run.
+    '''
+    def __init__(self, log_every: int = 1000):
+        super().__init__()
+        self.log_every = log_every
+
+    def _on_step(self) -> bool:
+        if self.n_calls % self.log_every == 0:
+            total = Profiler()
+            for profiler in self.training_env.get_attr("profiler"):
+                if profiler is not None:
+                    total.merge(profiler)
+            for name, value in total.scalars().items():
+                self.logger.record(name, value)
+            # DQN only writes its logs at the end of episodes, which last a day
+            self.logger.dump(self.num_timesteps)
+        return True
+
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-envs", type=int, default=1, help="number of parallel environments")
+    parser.add_argument("--subproc", action="store_true",
+                        help="run each environment in its own process")
+    parser.add_argument("--event-dir", type=Path, default=DATA_DIR / "events",
+                        help="where binary event files are kept for --subproc")
+    parser.add_argument("--decision-every", type=int, default=None,
+                        help="act every N events instead of on every event")
+    parser.add_argument("--decision-interval", type=float, default=None,
+                        help="act once this much exchange time (event timestamp units) has passed")
+    parser.add_argument("--decide-on-top-change", action="store_true",
+                        help="act only when the external best bid or ask changes")
+    parser.add_argument("--profile", action="store_true",
+                        help="log time per environment stage and per policy call to TensorBoard")
+    args = parser.parse_args()
+    env_kwargs = dict(decision_every=args.decision_every,
+                      decision_interval=args.decision_interval,
+                      decide_on_top_change=args.decide_on_top_change)
 
     # Will fetch all of the training data in the directory
     all_days = load_all_tickers_for_date(DATA_DIR)
 
-    # Sample a random day per episode
-    def random_env_fn():
-        path = random.choice(all_days)
-        return make_env(path)()
-    
     # https://stable-baselines.readthedocs.io/en/master/guide/vec_envs.html
     # Method for stacking multiple independent environemnts into a single environment
     # Trains on n environments per step
     # Now, actions that are passed are of dimension n
-    env = DummyVecEnv([random_env_fn])
+    if args.subproc:
+        dataset = EventDataset(args.event_dir)
+        event_paths = [dataset.add_lobster(p) for p in all_days]
+        env = SubprocVecEnv([make_memmap_env(random.choice(event_paths), args.profile, **env_kwargs)
+                             for _ in range(args.n_envs)])
+    else:
+        # Sample a random day per environment
+        def random_env_fn():
+            path = random.choice(all_days)
+            return make_env(path, args.profile, **env_kwargs)()
+        env = DummyVecEnv([random_env_fn] * args.n_envs)
 
     # Create the agent
     model = DQN(
@@ -91,7 +164,7 @@ def main():
     )
 
     # Evaluation callback
-    eval_env = make_env(all_days[0])() # Use one fixed day for evaluation
+    eval_env = make_env(all_days[0], **env_kwargs)() # Use one fixed day for evaluation
     eval_callback = EvalCallback(
         env,
         best_model_save_path="./models/",
@@ -102,7 +175,8 @@ def main():
     )
 
     # Train the model
-    model.learn(total_timesteps=200_000, callback=eval_callback)
+    callbacks = [eval_callback, ProfilerCallback()] if args.profile else eval_callback
+    model.learn(total_timesteps=200_000, callback=callbacks)
 
     # Save the model
     model.save(MODEL_DEST)
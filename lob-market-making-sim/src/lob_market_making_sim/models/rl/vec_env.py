@@ -0,0 +1,137 @@
+'''
+vec_env.py
+A batched gymnasium VectorEnv running K market-making environments, each
+with its own book and agent, possibly on different trading days.
+
+Observations, rewards and done flags are written into preallocated
+arrays of shape (K, ...), and finished sub-environments are reset in the
+same step (gymnasium's SAME_STEP autoreset), with the last observation
+of the episode returned in infos["final_obs"].
+
+Days can be given as binary event files (io/binary.py). They are
+memory-mapped, so every process that trains on the same files shares
+one copy of the events. With precompute_features the market features of
+each day (features.py) are built once, cached next to event files, and
+shared by all sub-environments.
+
+https://gymnasium.farama.org/api/vector/
+'''
+
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+from gymnasium.vector import VectorEnv
+from gymnasium.vector.utils import batch_space
+from gymnasium.vector.vector_env import AutoresetMode
+
+from lob_market_making_sim.io.binary import load_event_file
+from lob_market_making_sim.io.checkpoint import checkpoint_dir_for
+from lob_market_making_sim.io.loader import EventColumns
+from lob_market_making_sim.models.rl.env import LOBMarketMakerEnv
+from lob_market_making_sim.models.rl.features import compute_market_features, load_market_features
+
+class LOBMarketMakerVecEnv(VectorEnv):
+    '''
+    K independent LOBMarketMakerEnvs stepped with one call.
+    '''
+    metadata = {"autoreset_mode": AutoresetMode.SAME_STEP}
+
+    def __init__(self, days: Sequence, num_envs: int, precompute_features: bool = False,
+                 random_start: bool = False, **env_kwargs):
+        '''
+        Parameters
+        days (Sequence): trading days to sample from on every reset, each a
+            binary event file path, EventColumns or list of OrderEvents
+        num_envs (int): number of sub-environments K
+        precompute_features (bool): replay each day once up front so that
+            the sub-environments only compute agent-dependent features
+        random_start (bool): start every episode at a uniformly drawn event
+            of its day; books of days given as event files are warmed up
+            from their checkpoints (io/checkpoint.py), if any
+        env_kwargs: passed on to every LOBMarketMakerEnv
+        '''
+        if not days:
+            raise ValueError("LOBMarketMakerVecEnv needs at least one day of events")
+        self._days = [load_event_file(d) if isinstance(d, (str, Path)) else d for d in days]
+        self._checkpoint_dirs = [checkpoint_dir_for(d) if isinstance(d, (str, Path)) else None
+                                 for d in days]
+        self._features = [None] * len(days)
+        if precompute_features:
+            self._features = [load_market_features(d) if isinstance(d, (str, Path))
+                              else compute_market_features(d) for d in days]
+        self.num_envs = num_envs
+        self.random_start = random_start
+        # Observations are copied into self._obs, so the envs can reuse their buffers
+        self.envs = [LOBMarketMakerEnv(self._days[i % len(days)],
+                                       market_features=self._features[i % len(days)],
+                                       copy_obs=False, **env_kwargs)
+                     for i in range(num_envs)]
+
+        self.single_observation_space = self.envs[0].observation_space
+        self.single_action_space = self.envs[0].action_space
+        self.observation_space = batch_space(self.single_observation_space, num_envs)
+        self.action_space = batch_space(self.single_action_space, num_envs)
+
+        # Preallocated outputs, overwritten on every step
+        self._obs = np.zeros(self.observation_space.shape, dtype=self.observation_space.dtype)
+        self._rewards = np.zeros(num_envs, dtype=np.float64)
+        self._terminations = np.zeros(num_envs, dtype=bool)
+        self._truncations = np.zeros(num_envs, dtype=bool)
+
+    def _reset_env(self, i: int) -> None:
+        '''
+        Starts a new episode in sub-environment i on a randomly drawn day.
+        '''
+        env = self.envs[i]
+        day = self.np_random.integers(len(self._days))
+        env.event_sequence, env.market_features = self._days[day], self._features[day]
+        env.checkpoint_dir = self._checkpoint_dirs[day]
+        options = None
+        if self.random_start:
+            options = {"start_index": int(self.np_random.integers(len(env.event_sequence)))}
+        self._obs[i], _ = env.reset(options=options)
+
+    def reset(self, *, seed=None, options=None):
+        '''
+        Resets every sub-environment.
+        Returns
+        (np.ndarray, dict): observations of shape (K, 6) and empty infos
+        '''
+        super().reset(seed=seed)
+        for i in range(self.num_envs):
+            self._reset_env(i)
+        return self._obs.copy(), {}
+
+    def step(self, actions):
+        '''
+        Steps every sub-environment with its action.
+        Parameters
+        actions (np.ndarray): one discrete action per sub-environment
+        Returns
+        observations, rewards, terminations, truncations, infos
+        '''
+        final_obs, done = None, np.zeros(self.num_envs, dtype=bool)
+        for i, (env, action) in enumerate(zip(self.envs, actions)):
+            obs, reward, terminated, truncated, _ = env.step(int(action))
+            self._rewards[i] = reward
+            self._terminations[i] = terminated
+            self._truncations[i] = truncated
+            if terminated or truncated:
+                if final_obs is None:
+                    final_obs = np.full(self.num_envs, None, dtype=object)
+                final_obs[i] = obs.copy() # the env's buffer is overwritten by reset
+                done[i] = True
+                self._reset_env(i)
+            else:
+                self._obs[i] = obs
+
+        infos = {}
+        if final_obs is not None:
+            infos["final_obs"] = final_obs
+            infos["_final_obs"] = done
+        return (self._obs.copy(), self._rewards.copy(), self._terminations.copy(),
+                self._truncations.copy(), infos)
+
+    def close_extras(self, **kwargs):
+        self.envs = []
@@ -0,0 +1,33 @@
+'''
+test_binary.py
+Round trip of the memory-mapped binary event format.
+
+To run: poetry run pytest tests/test_binary.py
+'''
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from lob_market_making_sim.io.binary import EventDataset, load_event_file, write_event_file
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_columns
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+def test_event_file_round_trip(tmp_path):
+    table = lobster_to_arrow(FIXTURE)
+    path = write_event_file(table, tmp_path / "AMZN_2012-06-21.events.npy")
+
+    cols = load_event_file(path)
+    assert isinstance(cols.oid, np.memmap) # mapped, not read into memory
+    assert list(cols.iter_rows()) == list(arrow_to_columns(table).iter_rows())
+
+def test_dataset_add_and_load(tmp_path):
+    src = tmp_path / "AMZN_2012-06-21_34200000_57600000_message_1.csv"
+    shutil.copy(FIXTURE, src)
+
+    dataset = EventDataset(tmp_path / "events")
+    dataset.add_lobster(src)
+    assert dataset.keys() == [("AMZN", "2012-06-21")]
+    assert len(dataset.load("AMZN", "2012-06-21")) == 8
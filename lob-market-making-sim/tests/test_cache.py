@@ -0,0 +1,64 @@
+'''
+test_cache.py
+Checks that the Parquet event cache is reused, and rebuilt when the
+source file changes.
+
+To run: poetry run pytest tests/test_cache.py
+'''
+
+import os
+import shutil
+from pathlib import Path
+
+import pyarrow as pa
+import pytest
+
+from lob_market_making_sim.io.cache import EventCache, validate_events_table
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_events
+from lob_market_making_sim.io.schema import CACHE_SCHEMA
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+def test_cache_reused_and_invalidated(tmp_path):
+    src = tmp_path / FIXTURE.name
+    shutil.copy(FIXTURE, src)
+    cache = EventCache(tmp_path / "cache")
+
+    # First load converts the CSV, with the same events as parsing it directly
+    table = cache.load(src)
+    assert table.schema.equals(CACHE_SCHEMA)
+    assert arrow_to_events(table) == arrow_to_events(lobster_to_arrow(src))
+    first = cache.path_for(src)
+    written_at = first.stat().st_mtime_ns
+
+    # Second load reads the existing entry
+    cache.load(src)
+    assert first.stat().st_mtime_ns == written_at
+
+    # Changing the source gives a new key and replaces the old entry
+    with open(src, "a") as f:
+        f.write("0.009000,1,104,10,1832000,1\n")
+    os.utime(src, ns=(written_at + 10**9, written_at + 10**9))
+    table = cache.load(src)
+    assert cache.path_for(src) != first
+    assert not first.exists()
+    assert table.num_rows == 9
+
+def test_unknown_codes_rejected():
+    table = lobster_to_arrow(FIXTURE)
+    bad = table.set_column(1, "event_type", pa.array([9] * table.num_rows, pa.int32()))
+    with pytest.raises(ValueError):
+        validate_events_table(bad)
+
+def test_same_name_in_other_folder_keeps_its_entry(tmp_path):
+    sources = []
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        sources.append(tmp_path / folder / FIXTURE.name)
+        shutil.copy(FIXTURE, sources[-1])
+    cache = EventCache(tmp_path / "cache")
+
+    assert cache.ensure(sources[0]) and cache.ensure(sources[1])
+    assert cache.path_for(sources[0]) != cache.path_for(sources[1])
+    assert cache.path_for(sources[0]).exists()
+    assert not cache.ensure(sources[0]) # not evicted by the other file
@@ -0,0 +1,115 @@
+'''
+test_checkpoint.py
+Checkpoints restore books, engines and environments to exactly where
+an uninterrupted replay would be.
+
+To run: poetry run pytest tests/test_checkpoint.py
+'''
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from lob_market_making_sim.core.engine import LockstepReplayEngine, ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.order_book_l3 import OrderBookL3
+from lob_market_making_sim.io.checkpoint import (checkpoint_indices, checkpoint_path,
+                                                 write_book_checkpoints)
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_columns, arrow_to_events
+from lob_market_making_sim.io.schema import Direction
+from lob_market_making_sim.models.avellaneda import ASParams, AvellanedaStoikov
+from lob_market_making_sim.models.rl.env import LOBMarketMakerEnv
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+PARAMS = ASParams(gamma=0.1, kappa=1.5, sigma=0.002, qmax=100)
+
+@pytest.mark.parametrize("book_cls", [OrderBookL1, OrderBookL3])
+def test_book_state_round_trip(book_cls):
+    events = arrow_to_events(lobster_to_arrow(FIXTURE))
+    book = book_cls()
+    for ev in events[:3]:
+        book.apply(ev)
+    book.place_agent_quote(Direction.BUY, 183.24, 10)
+
+    restored = book_cls()
+    restored.set_state(book.get_state())
+    assert restored.snapshot() == book.snapshot()
+    assert restored.mid_external() == book.mid_external()
+    if book_cls is OrderBookL3:
+        assert restored.queue(Direction.BUY, 183.24) == book.queue(Direction.BUY, 183.24)
+
+    for ev in events[3:]:
+        book.apply(ev)
+        restored.apply(ev)
+        assert restored.snapshot() == book.snapshot()
+
+def test_engine_resumes_from_checkpoint(tmp_path):
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    full = ReplayEngine(OrderBookL1(), AvellanedaStoikov(PARAMS))
+    full.run(cols, checkpoint_every=3, checkpoint_dir=tmp_path)
+    assert checkpoint_indices(tmp_path) == [3, 6]
+
+    resumed = ReplayEngine(OrderBookL1(), AvellanedaStoikov(PARAMS))
+    start = resumed.restore(checkpoint_path(tmp_path, 3))
+    resumed.run(cols[start:])
+    assert (resumed.cash, resumed.inv, resumed.bid_oid, resumed.ask_oid) == \
+        (full.cash, full.inv, full.bid_oid, full.ask_oid)
+    assert resumed.quote_log == full.quote_log[-len(resumed.quote_log):]
+    assert resumed.ob.snapshot() == full.ob.snapshot()
+
+def test_env_starts_mid_day_from_checkpoint(tmp_path):
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    write_book_checkpoints(cols, tmp_path, every=2)
+
+    warm = LOBMarketMakerEnv(cols) # replays the first events
+    cold = LOBMarketMakerEnv(cols, checkpoint_dir=tmp_path)
+    for env in (warm, cold):
+        obs, _ = env.reset(options={"start_index": 5})
+        assert env.t == 5
+    assert np.array_equal(warm.reset(options={"start_index": 5})[0], obs)
+    assert warm.order_book.snapshot() == cold.order_book.snapshot()
+    for action in (24, 10, 40):
+        assert np.array_equal(warm.step(action)[0], cold.step(action)[0])
+
+def test_tick_engine_resumes_from_checkpoint(tmp_path):
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    full = ReplayEngine(OrderBookL1(ticks=True), AvellanedaStoikov(PARAMS))
+    full.run(cols, checkpoint_every=3, checkpoint_dir=tmp_path)
+    assert full.ob.get_state()['top'].dtype == np.int64 # prices stay exact ticks
+
+    resumed = ReplayEngine(OrderBookL1(ticks=True), AvellanedaStoikov(PARAMS))
+    start = resumed.restore(checkpoint_path(tmp_path, 3))
+    resumed.run(cols[start:])
+    assert (resumed.cash, resumed.inv) == (full.cash, full.inv)
+    assert isinstance(resumed.cash, int)
+    assert resumed.ob.snapshot() == full.ob.snapshot()
+
+def test_tick_engine_cash_round_trip(tmp_path):
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    engine = ReplayEngine(OrderBookL1(ticks=True), AvellanedaStoikov(PARAMS))
+    engine.run(cols[:4])
+    engine.cash = 2**53 + 1 # exact in ticks, not representable as float64
+    path = engine.checkpoint(tmp_path / "state.npz", 4)
+
+    restored = ReplayEngine(OrderBookL1(ticks=True), AvellanedaStoikov(PARAMS))
+    assert restored.restore(path) == 4
+    assert type(restored.cash) is int and restored.cash == 2**53 + 1
+    assert (restored.inv, restored.num_events_executed) == (engine.inv, engine.num_events_executed)
+
+def test_lockstep_engine_resumes_from_checkpoint(tmp_path):
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    grid = [PARAMS, ASParams(gamma=0.01, kappa=0.5, sigma=0.002, qmax=5)]
+    full = LockstepReplayEngine(OrderBookL1(), grid)
+    full.run(cols, checkpoint_every=3, checkpoint_dir=tmp_path)
+    assert checkpoint_indices(tmp_path) == [3, 6]
+
+    resumed = LockstepReplayEngine(OrderBookL1(), grid)
+    start = resumed.restore(checkpoint_path(tmp_path, 3))
+    resumed.run(cols[start:])
+    assert resumed.results() == full.results()
+    assert np.array_equal(resumed.bid_px, full.bid_px, equal_nan=True)
+    assert resumed.ob.snapshot() == full.ob.snapshot()
+
+    with pytest.raises(ValueError):
+        LockstepReplayEngine(OrderBookL1(), grid[:1]).restore(checkpoint_path(tmp_path, 3))
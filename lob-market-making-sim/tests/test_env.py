@@ -0,0 +1,40 @@
+'''
+test_env.py
+Decision schedules of LOBMarketMakerEnv.
+
+To run: poetry run pytest tests/test_env.py
+'''
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_columns
+from lob_market_making_sim.models.rl.env import LOBMarketMakerEnv
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+def _run_episode(env, action=24):
+    env.reset()
+    steps, events, done = 0, 0, False
+    while not done:
+        _, _, done, _, info = env.step(action)
+        steps += 1
+        events += info["num_events"]
+    return steps, events
+
+def test_every_event_is_a_decision_by_default():
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    assert _run_episode(LOBMarketMakerEnv(cols)) == (len(cols), len(cols))
+
+@pytest.mark.parametrize("every", [1, 3, 100])
+def test_decision_every_n_events(every):
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    env = LOBMarketMakerEnv(cols, decision_every=every)
+    assert _run_episode(env) == (-(-len(cols) // every), len(cols))
+
+def test_decision_interval_uses_event_time():
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    env = LOBMarketMakerEnv(cols, decision_interval=np.inf)
+    assert _run_episode(env) == (1, len(cols)) # one action for the whole day
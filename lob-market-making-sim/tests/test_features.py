@@ -0,0 +1,42 @@
+'''
+test_features.py
+Precomputed market features give the environment the same trajectory as
+reading the live book.
+
+To run: poetry run pytest tests/test_features.py
+'''
+
+from pathlib import Path
+
+import numpy as np
+
+from lob_market_making_sim.io.binary import write_event_file
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_columns
+from lob_market_making_sim.models.rl.env import LOBMarketMakerEnv
+from lob_market_making_sim.models.rl.features import (FEATURE_COLUMNS, compute_market_features,
+                                                      features_path_for, load_market_features)
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+def test_env_with_features_matches_live_book():
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    features = compute_market_features(cols)
+    assert features.shape == (len(cols) + 1, len(FEATURE_COLUMNS))
+
+    live = LOBMarketMakerEnv(cols)
+    pre = LOBMarketMakerEnv(cols, market_features=features, copy_obs=False)
+    assert np.array_equal(live.reset()[0], pre.reset()[0])
+    for action in np.random.default_rng(0).integers(0, 49, size=len(cols)):
+        live_obs, live_reward, live_done, _, _ = live.step(action)
+        pre_obs, pre_reward, pre_done, _, _ = pre.step(action)
+        assert np.array_equal(live_obs, pre_obs)
+        assert (live_reward, live_done) == (pre_reward, pre_done)
+
+def test_features_are_cached_next_to_event_file(tmp_path):
+    table = lobster_to_arrow(FIXTURE)
+    event_path = write_event_file(table, tmp_path / "AMZN_2012-06-21.events.npy")
+
+    features = load_market_features(event_path)
+    assert features_path_for(event_path) == tmp_path / "AMZN_2012-06-21.features.npy"
+    assert isinstance(features, np.memmap)
+    np.testing.assert_array_equal(features, compute_market_features(arrow_to_columns(table)))
@@ -0,0 +1,53 @@
+'''
+test_ingest.py
+Bulk ingestion writes the same cache entries and dataset partitions as
+converting each file on its own, skips files already converted and
+rejects files that do not follow the message schema.
+
+To run: poetry run pytest tests/test_ingest.py
+'''
+
+import shutil
+from pathlib import Path
+
+import pyarrow.parquet as pq
+import pytest
+
+from lob_market_making_sim.io.cache import EventCache, normalize_events_table, partition_path
+from lob_market_making_sim.io.ingest import ingest
+from lob_market_making_sim.io.loader import lobster_to_arrow
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+def _day(folder, ticker):
+    path = folder / f"{ticker}_2012-06-21_34200000_57600000_message_1.csv"
+    shutil.copy(FIXTURE, path)
+    return path
+
+def test_ingest_to_cache_and_dataset(tmp_path):
+    paths = [_day(tmp_path, ticker) for ticker in ("AMZN", "GOOG", "MSFT")]
+    expected = normalize_events_table(lobster_to_arrow(FIXTURE))
+
+    report = ingest(paths, cache_dir=tmp_path / "cache", max_workers=2)
+    assert [f.path for f in report.files] == paths
+    assert report.rows == 3 * expected.num_rows
+    assert report.bytes == 3 * FIXTURE.stat().st_size
+    assert report.rows_per_sec > 0
+    for path in paths:
+        assert EventCache(tmp_path / "cache").load(path).equals(expected)
+
+    again = ingest(paths, cache_dir=tmp_path / "cache", max_workers=2)
+    assert all(f.skipped for f in again.files) and again.rows == 0
+
+    ingest(paths, dataset_dir=tmp_path / "events", max_workers=2)
+    part = partition_path(tmp_path / "events", "GOOG", "2012-06-21")
+    assert pq.read_table(part).equals(expected)
+
+def test_ingest_rejects_bad_codes(tmp_path):
+    good = _day(tmp_path, "AMZN")
+    bad = tmp_path / "GOOG_2012-06-21_34200000_57600000_message_1.csv"
+    bad.write_text(FIXTURE.read_text().replace("0.008000,5,", "0.008000,9,"))
+    with pytest.raises(ValueError):
+        ingest([good, bad], cache_dir=tmp_path / "cache", max_workers=2)
+    # The good file is converted, and nothing is left behind for the bad one
+    assert list((tmp_path / "cache").iterdir()) == [EventCache(tmp_path / "cache").path_for(good)]
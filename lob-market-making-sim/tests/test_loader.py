@@ -0,0 +1,57 @@
+'''
+test_loader.py
+Checks that the different ways of loading LOBSTER messages agree.
+
+To run: poetry run pytest tests/test_loader.py
+'''
+
+from pathlib import Path
+import numpy as np
+
+from lob_market_making_sim.io.loader import (lobster_to_arrow, arrow_to_events,
+                                             arrow_to_columns, EventColumns,
+                                             iter_lobster_batches, iter_lobster_events,
+                                             iter_lobster_columns)
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+def test_columns_match_events():
+    '''
+    Decoding EventColumns row by row gives the same values as OrderEvents.
+    '''
+    tbl = lobster_to_arrow(FIXTURE)
+    events = arrow_to_events(tbl)
+    cols = arrow_to_columns(tbl)
+
+    assert len(cols) == len(events)
+    for ev, row in zip(events, cols.iter_rows(chunk_size=3)): # several chunks
+        assert (ev.ts, ev.etype, ev.oid, ev.size, ev.price, ev.direction) == row
+    assert cols[4] == events[4]
+
+def test_columns_slice_is_view():
+    '''
+    Slicing EventColumns returns columns that share memory with the original.
+    '''
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    head = cols[:3]
+    assert isinstance(head, EventColumns) and len(head) == 3
+    assert np.shares_memory(head.oid, cols.oid)
+    assert list(head.oid) == [100, 101, 102]
+
+def test_streaming_matches_full_read():
+    '''
+    Streaming the file in tiny blocks yields the same events, split
+    over several batches.
+    '''
+    events = arrow_to_events(lobster_to_arrow(FIXTURE))
+
+    batches = list(iter_lobster_batches(FIXTURE, block_size=64))
+    assert len(batches) > 1
+    assert sum(b.num_rows for b in batches) == len(events)
+
+    assert list(iter_lobster_events(FIXTURE, block_size=64)) == events
+
+    streamed = [row for cols in iter_lobster_columns(FIXTURE, block_size=64)
+                for row in cols.iter_rows()]
+    assert streamed == [(ev.ts, ev.etype, ev.oid, ev.size, ev.price, ev.direction)
+                        for ev in events]
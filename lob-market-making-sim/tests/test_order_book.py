@@ -23,6 +23,7 @@ The sequence checks:
 
 To run: poetry run pytest tests/test_order_book.py
 """
+from dataclasses import replace
 from pathlib import Path
 from lob_market_making_sim.io.schema import OrderEvent
 import pyarrow as pa
@@ -43,7 +44,8 @@ def _run_events(book, events):
     snapshots = []
     for ev in events:
         book.apply(ev)
-        snapshots.append((ev, book.best_bid, book.best_ask))
+        # the book updates its TopLevels in place, so keep copies
+        snapshots.append((ev, replace(book.best_bid), replace(book.best_ask)))
     return snapshots
 
 def test_top_of_book_transitions():
@@ -126,3 +128,67 @@ def test_execute_visible_trade_updates_top():
     assert ob.best_bid.price == 183.22
     assert ob.best_bid.quantity == 50
 
+
+def test_refresh_top_skips_emptied_levels():
+    '''
+    Levels that empty out below the top must not be promoted later,
+    even after being recreated and deleted again.
+    '''
+    ob = OrderBookL1()
+    for oid, price in [(1, 183.24), (2, 183.22), (3, 183.20)]:
+        ob.apply(OrderEvent(
+            ts=0, etype=EventType.ADD, oid=oid, size=10,
+            price=price, direction=Direction.BUY
+        ))
+
+    # Empty the middle level, recreate it, then empty it again
+    ob.apply(OrderEvent(ts=1, etype=EventType.DELETE, oid=2, size=10,
+                        price=183.22, direction=Direction.BUY))
+    ob.apply(OrderEvent(ts=2, etype=EventType.ADD, oid=4, size=5,
+                        price=183.22, direction=Direction.BUY))
+    ob.apply(OrderEvent(ts=3, etype=EventType.DELETE, oid=4, size=5,
+                        price=183.22, direction=Direction.BUY))
+
+    # Deleting the top now promotes the deepest remaining level
+    ob.apply(OrderEvent(ts=4, etype=EventType.DELETE, oid=1, size=10,
+                        price=183.24, direction=Direction.BUY))
+    assert (ob.best_bid.price, ob.best_bid.quantity) == (183.20, 10)
+
+    ob.apply(OrderEvent(ts=5, etype=EventType.DELETE, oid=3, size=10,
+                        price=183.20, direction=Direction.BUY))
+    assert ob.best_bid == TopLevel()
+
+def test_mid_external_ignores_agent_quotes():
+    '''
+    Agent quotes improve the visible top of book but must not move
+    the external midprice, whether they sit alone or share a level.
+    '''
+    ob = OrderBookL1()
+    ob.apply(OrderEvent(ts=0, etype=EventType.ADD, oid=1, size=100,
+                        price=99.0, direction=Direction.BUY))
+    ob.apply(OrderEvent(ts=0, etype=EventType.ADD, oid=2, size=100,
+                        price=101.0, direction=Direction.SELL))
+    assert ob.mid_external() == 100.0
+
+    # Agent improves both sides: visible mid moves, external mid does not
+    bid_oid = ob.place_agent_quote(Direction.BUY, 99.5, 10)
+    ask_oid = ob.place_agent_quote(Direction.SELL, 101.0, 10)
+    assert ob.best_bid.price == 99.5
+    assert ob.mid_external() == 100.0
+
+    # External order joins the agent's bid level, which is now external best
+    ob.apply(OrderEvent(ts=1, etype=EventType.ADD, oid=3, size=5,
+                        price=99.5, direction=Direction.BUY))
+    assert ob.mid_external() == 100.25
+
+    # External ask leaves, only the agent remains at 101 -> no external ask
+    ob.apply(OrderEvent(ts=2, etype=EventType.DELETE, oid=2, size=100,
+                        price=101.0, direction=Direction.SELL))
+    assert ob.best_ask.price == 101.0
+    assert ob.mid_external() is None
+
+    ob.cancel_agent_quote(ask_oid)
+    ob.apply(OrderEvent(ts=3, etype=EventType.ADD, oid=4, size=100,
+                        price=100.5, direction=Direction.SELL))
+    ob.cancel_agent_quote(bid_oid)
+    assert ob.mid_external() == 100.0
@@ -0,0 +1,114 @@
+"""
+test_order_book_l3.py
+Unit-tests for OrderBookL3: FIFO queues per level and price-time
+priority for the agent's quotes.
+
+To run: poetry run pytest tests/test_order_book_l3.py
+"""
+from pathlib import Path
+
+from lob_market_making_sim.core.engine import ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.order_book_l3 import OrderBookL3
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_events
+from lob_market_making_sim.io.schema import EventType, Direction, OrderEvent
+from lob_market_making_sim.models.base import MarketMaker
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+class StaticMM(MarketMaker):
+    def quote(self, mid: float, inv: int, t: float):
+        return 99, 101
+    def reset(self):
+        pass
+
+def _add(ts, oid, direction, price, size):
+    return OrderEvent(ts=ts, etype=EventType.ADD, oid=oid, direction=direction, price=price, size=size)
+
+def test_same_top_of_book_as_level_one():
+    events = arrow_to_events(lobster_to_arrow(FIXTURE))
+    l1, l3 = OrderBookL1(), OrderBookL3()
+    for ev in events:
+        l1.apply(ev)
+        l3.apply(ev)
+        assert l3.snapshot() == l1.snapshot()
+
+def test_queues_are_fifo():
+    ob = OrderBookL3()
+    for oid, size in [(1, 10), (2, 20), (3, 30)]:
+        ob.apply(_add(oid, oid, Direction.BUY, 99, size))
+    assert ob.queue(Direction.BUY, 99) == [(1, 10), (2, 20), (3, 30)]
+    assert ob.volume_ahead(3) == 30
+
+    # removing from the middle keeps the rest of the queue linked
+    ob.apply(OrderEvent(ts=4, etype=EventType.DELETE, oid=2, direction=Direction.BUY, price=99, size=20))
+    ob.apply(_add(5, 4, Direction.BUY, 99, 40))
+    assert ob.queue(Direction.BUY, 99) == [(1, 10), (3, 30), (4, 40)]
+    assert ob.volume_ahead(4) == 40
+
+    for oid in (1, 3, 4):
+        ob.apply(OrderEvent(ts=6, etype=EventType.DELETE, oid=oid, direction=Direction.BUY, price=99, size=0))
+    assert ob.queue(Direction.BUY, 99) == []
+
+def test_agent_is_filled_only_after_volume_ahead():
+    '''
+    The agent joins the 99 bid behind orders 1 and 3. Trades on those
+    move it up the queue; only the trade on order 4, which arrived after
+    the agent's bid, fills it.
+    '''
+    ob = OrderBookL3()
+    ob.apply(_add(1, 1, Direction.BUY, 99, 100))
+    ob.apply(_add(2, 2, Direction.SELL, 101, 100))
+    engine = ReplayEngine(ob, StaticMM())
+
+    tape = [
+        (_add(3, 3, Direction.BUY, 99, 50), 150),
+        (OrderEvent(ts=4, etype=EventType.EXECUTE_VISIBLE, oid=1, direction=Direction.BUY, price=99, size=60), 90),
+        (OrderEvent(ts=5, etype=EventType.DELETE, oid=1, direction=Direction.BUY, price=99, size=40), 50),
+        (OrderEvent(ts=6, etype=EventType.EXECUTE_VISIBLE, oid=3, direction=Direction.BUY, price=99, size=50), 0),
+        (_add(7, 4, Direction.BUY, 99, 20), 0),
+    ]
+    for ev, ahead in tape:
+        engine.run([ev])
+        assert ob.volume_ahead(engine.bid_oid) == ahead
+        assert engine.filled_buy == 0
+
+    engine.run([OrderEvent(ts=8, etype=EventType.EXECUTE_VISIBLE, oid=4, direction=Direction.BUY, price=99, size=5)])
+    assert engine.filled_buy == 5 and engine.inv == 5
+    assert ob.queue(Direction.BUY, 99) == [(engine.bid_oid, 5), (4, 15)]
+
+def test_trade_through_agent_price_fills():
+    ob = OrderBookL3()
+    ob.apply(_add(0, 5, Direction.BUY, 98, 100))
+    ob.apply(_add(1, 1, Direction.SELL, 101, 100))
+    ob.apply(_add(2, 2, Direction.SELL, 102, 100))
+    engine = ReplayEngine(ob, StaticMM())
+    engine.run([_add(3, 3, Direction.SELL, 101, 10)]) # agent ask joins behind 1 and 3
+
+    # order 2 at 102 can only trade once 101 is exhausted, agent included
+    engine.run([OrderEvent(ts=4, etype=EventType.EXECUTE_VISIBLE, oid=2, direction=Direction.SELL, price=102, size=30)])
+    assert engine.filled_sell == 10
+
+def test_off_grid_quote_queues_at_its_cent():
+    '''
+    A bid at 99.0037 is compared on the cent grid like the engine's fill
+    check: it queues behind the 100 shares at 99, and a trade at 99 on
+    an order that arrived after it fills it.
+    '''
+    class OffGridMM(StaticMM):
+        def quote(self, mid: float, inv: int, t: float):
+            return 99.0037, 101.0041
+
+    ob = OrderBookL3()
+    ob.apply(_add(1, 1, Direction.BUY, 99, 100))
+    ob.apply(_add(2, 2, Direction.SELL, 101, 100))
+    engine = ReplayEngine(ob, OffGridMM())
+    engine.run([_add(3, 3, Direction.BUY, 98, 10)])
+    assert ob.volume_ahead(engine.bid_oid) == 100
+
+    engine.run([OrderEvent(ts=4, etype=EventType.EXECUTE_VISIBLE, oid=1, direction=Direction.BUY, price=99, size=60)])
+    assert ob.volume_ahead(engine.bid_oid) == 40 and engine.filled_buy == 0
+
+    engine.run([_add(5, 4, Direction.BUY, 99, 20),
+                OrderEvent(ts=6, etype=EventType.EXECUTE_VISIBLE, oid=4, direction=Direction.BUY, price=99, size=5)])
+    assert engine.filled_buy == 5
@@ -0,0 +1,72 @@
+'''
+test_profiler.py
+Profiler counts every stage of a replay without changing its outcome,
+and leaves nothing behind when removed.
+
+To run: poetry run pytest tests/test_profiler.py
+'''
+
+import pickle
+import warnings
+from pathlib import Path
+
+from lob_market_making_sim.core.engine import ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.profiler import Profiler
+from lob_market_making_sim.io.loader import arrow_to_columns, lobster_to_arrow
+from lob_market_making_sim.models.avellaneda import ASParams, AvellanedaStoikov
+from lob_market_making_sim.models.rl.env import LOBMarketMakerEnv
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+PARAMS = ASParams(gamma=0.1, kappa=1.5, sigma=0.002, qmax=100)
+
+class Nested:
+    def outer(self):
+        return self.inner() + 1
+
+    def inner(self):
+        return 1
+
+def test_nested_stages_are_exclusive_and_removable():
+    profiler = Profiler()
+    obj = Nested()
+    profiler.instrument(obj, 'outer', 'outer', between='gap')
+    profiler.instrument(obj, 'inner', 'inner')
+    profiler.instrument(obj, 'inner', 'inner') # no second wrapper
+    assert obj.outer() == 2 and obj.outer() == 2
+    assert {name: calls for name, (_, calls) in profiler.stages.items()} == \
+        dict(outer=2, inner=2, gap=1)
+
+    copy = pickle.loads(pickle.dumps(profiler)) # drops the instrumented object
+    assert copy.stages == profiler.stages
+    profiler.remove()
+    assert 'outer' not in vars(obj) and 'inner' not in vars(obj)
+
+def test_profiled_engine_replays_the_same():
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    profiler = Profiler(sample_every=4)
+    profiled = ReplayEngine(OrderBookL1(), AvellanedaStoikov(PARAMS), profiler=profiler)
+    plain = ReplayEngine(OrderBookL1(), AvellanedaStoikov(PARAMS))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        profiled.run(cols)
+        plain.run(cols)
+
+    assert (profiled.cash, profiled.inv, profiled.quote_log) == (plain.cash, plain.inv, plain.quote_log)
+    summary = profiler.summary().set_index('stage')
+    assert summary.loc['engine.step', 'calls'] == len(cols) == profiler.events
+    assert summary.loc['strategy.quote', 'calls'] == len(plain.quote_log)
+    assert profiler.counters['book.unknown_oid'] == plain.ob.num_unknown_oid
+    assert [events for _, events, _ in profiler.throughput] == [4, 8]
+    assert 'profile/book.apply_mean_us' in profiler.scalars()
+
+def test_env_reports_time_between_steps_as_policy():
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    profiler = Profiler()
+    env = LOBMarketMakerEnv(cols, profiler=profiler)
+    env.reset()
+    for _ in range(3):
+        env.step(24)
+    assert profiler.stages['env.step'][1] == 3
+    assert profiler.stages['policy'][1] == 2
+    assert profiler.stages['env.apply'][1] == profiler.events == 3
@@ -0,0 +1,58 @@
+'''
+test_query.py
+Time-window and event-type selections return the same events as
+filtering the whole day, and only read the row groups they need.
+
+To run: poetry run pytest tests/test_query.py
+'''
+
+import shutil
+from dataclasses import astuple
+from pathlib import Path
+
+from lob_market_making_sim.io.cache import write_events_dataset
+from lob_market_making_sim.io.loader import arrow_to_columns, arrow_to_events, lobster_to_arrow
+from lob_market_making_sim.io.query import BOOK_EVENT_TYPES, load_events, row_groups_scanned
+from lob_market_making_sim.io.schema import EventType
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+def test_window_matches_full_day(tmp_path):
+    src = tmp_path / "AMZN_2012-06-21_34200000_57600000_message_1.csv"
+    shutil.copy(FIXTURE, src)
+    events = arrow_to_events(lobster_to_arrow(src))
+
+    window = load_events(src, start=0.002, end=0.006, cache_dir=tmp_path / "cache")
+    assert arrow_to_events(window) == [e for e in events if 0.002 <= e.ts < 0.006]
+
+    book_only = load_events(src, event_types=BOOK_EVENT_TYPES, cache_dir=tmp_path / "cache")
+    assert arrow_to_events(book_only) == [e for e in events if e.etype is not EventType.EXECUTE_HIDDEN]
+
+    # Same window on in-memory columns, by binary search on the timestamps
+    columns = arrow_to_columns(lobster_to_arrow(src)).time_window(0.002, 0.006)
+    assert list(columns.iter_rows()) == [astuple(e) for e in arrow_to_events(window)]
+
+def test_pushdown_skips_row_groups(tmp_path):
+    paths = []
+    for ticker in ("AMZN", "GOOG"):
+        paths.append(tmp_path / f"{ticker}_2012-06-21_34200000_57600000_message_1.csv")
+        shutil.copy(FIXTURE, paths[-1])
+    root = write_events_dataset(paths, tmp_path / "events", row_group_size=2)
+
+    assert row_groups_scanned(root) == (8, 8)
+    assert row_groups_scanned(root, tickers=["GOOG"]) == (4, 8)
+    assert row_groups_scanned(root, tickers=["GOOG"], start=0.0025, end=0.004) == (1, 8)
+
+    table = load_events(root, tickers=["GOOG"], start=0.0025, end=0.004)
+    assert table["order_id"].to_pylist() == [102]
+    assert table["ticker"].to_pylist() == ["GOOG"]
+
+def test_csv_source_is_not_read_whole(tmp_path, monkeypatch):
+    src = tmp_path / "AMZN_2012-06-21_34200000_57600000_message_1.csv"
+    shutil.copy(FIXTURE, src)
+    load_events(src, cache_dir=tmp_path / "cache") # converts the file
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cache entry read in full")
+    monkeypatch.setattr("pyarrow.parquet.read_table", fail)
+    assert load_events(src, start=0.002, end=0.004, cache_dir=tmp_path / "cache").num_rows == 2
@@ -0,0 +1,68 @@
+'''
+test_reconcile.py
+Replaying a message file reproduces the top of book in its orderbook
+file, and mismatches are located and classified.
+
+To run: poetry run pytest tests/test_reconcile.py
+'''
+
+import numpy as np
+
+from lob_market_making_sim.evaluation.reconcile import (EMPTY_ASK_PRICE, compare_tops,
+                                                        load_orderbook_top, orderbook_path_for,
+                                                        reconcile)
+
+# time, type, oid, size, price, direction
+MESSAGES = [
+    (1.0, 1, 1, 100, 1000, 1),   # bid 100 @ 1000
+    (2.0, 1, 2, 50, 1010, -1),   # ask 50 @ 1010
+    (3.0, 4, 2, 20, 1010, -1),   # 20 of the ask trade
+    (4.0, 3, 1, 100, 1000, 1),   # the bid is pulled, revealing 70 @ 990 never seen
+    (5.0, 4, 9, 30, 990, 1),     # 30 of an unseen order at 990 trade
+]
+# ask price, ask size, bid price, bid size
+ORDERBOOK = [
+    (EMPTY_ASK_PRICE, 0, 1000, 100),
+    (1010, 50, 1000, 100),
+    (1010, 30, 1000, 100),
+    (1010, 30, 990, 70),
+    (1010, 30, 990, 40),
+]
+
+def _write_day(tmp_path, orderbook=ORDERBOOK):
+    message_path = tmp_path / 'TEST_2012-06-21_34200000_57600000_message_1.csv'
+    message_path.write_text(''.join(','.join(map(str, row)) + '\n' for row in MESSAGES))
+    orderbook_path_for(message_path).write_text(
+        ''.join(','.join(map(str, row)) + '\n' for row in orderbook))
+    return message_path
+
+def test_resync_only_misses_revealed_depth(tmp_path):
+    report = reconcile(_write_day(tmp_path))
+    assert report.num_mismatched == 1 and report.first_divergence == 3
+    assert report.num_unexplained == 0 and report.first_unexplained is None
+
+def test_free_running_replay_diverges(tmp_path):
+    report = reconcile(_write_day(tmp_path), resync=False)
+    assert report.first_divergence == 3
+    assert report.first_unexplained == 4 # the book never learns about 990
+
+def test_wrong_row_is_unexplained(tmp_path):
+    orderbook = list(ORDERBOOK)
+    orderbook[2] = (1010, 31, 1000, 100)
+    report = reconcile(_write_day(tmp_path, orderbook))
+    assert report.first_unexplained == 2
+    # the phantom share added to match row 2 is one too many in row 3
+    assert report.mismatches == dict(ask_price=0, ask_size=2, bid_price=1, bid_size=1)
+
+def test_load_orderbook_top_of_deeper_file(tmp_path):
+    path = tmp_path / 'TEST_2012-06-21_34200000_57600000_orderbook_2.csv'
+    path.write_text('1010,30,1000,100,1020,5,990,70\n')
+    assert load_orderbook_top(path).tolist() == [[1010, 30, 1000, 100]]
+
+def test_compare_tops_counts_columns():
+    expected = np.array(ORDERBOOK, dtype=np.int64)
+    actual = expected.copy()
+    actual[4, 3] = 41
+    report = compare_tops(actual, expected)
+    assert report.num_mismatched == report.num_unexplained == 1
+    assert report.mismatch_rate == 0.2
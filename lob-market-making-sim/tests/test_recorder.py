@@ -0,0 +1,64 @@
+'''
+test_recorder.py
+Recorder keeps typed columns, decimates consistently across appends,
+bulk extends and flushes, and exports without copying.
+
+To run: poetry run pytest tests/test_recorder.py
+'''
+
+from pathlib import Path
+
+import numpy as np
+
+from lob_market_making_sim.core.engine import ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.core.recorder import Recorder
+from lob_market_making_sim.io.loader import arrow_to_columns, lobster_to_arrow
+from lob_market_making_sim.models.avellaneda import ASParams, AvellanedaStoikov
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+COLUMNS = dict(ts=np.float64, inventory=np.int64)
+
+def test_append_and_extend_keep_every_nth_row():
+    recorder = Recorder(COLUMNS, every=3, flush_size=4)
+    for i in range(10):
+        recorder.append(float(i), i)
+    recorder.extend(np.arange(10, 17, dtype=float), list(range(10, 17)))
+    recorder.append(17.0, 17)
+    recorder.append(18.0, 18)
+
+    assert recorder['inventory'].tolist() == list(range(0, 19, 3))
+    assert recorder['inventory'].dtype == np.int64
+    assert recorder.rows()[1] == (3.0, 3)
+
+def test_integer_columns_stay_exact():
+    big = 2**53 + 1 # not representable as float64
+    for every in (1, 2):
+        recorder = Recorder(COLUMNS, every=every, flush_size=3)
+        for i in range(6):
+            recorder.append(float(i), big + i)
+        assert recorder['inventory'].tolist() == [big + i for i in range(0, 6, every)]
+
+def test_exports_share_memory():
+    recorder = Recorder(COLUMNS, capacity=8)
+    recorder.extend([1.0, 2.0], [5, -5])
+    ts = recorder['ts']
+    table = recorder.to_arrow()
+    assert table.column('inventory').to_pylist() == [5, -5]
+    assert table.column('ts').chunk(0).buffers()[1].address == ts.ctypes.data
+    assert np.shares_memory(recorder.to_pandas()['ts'].to_numpy(), ts)
+
+def test_engine_records_quotes_and_decimated_mids():
+    cols = arrow_to_columns(lobster_to_arrow(FIXTURE))
+    params = ASParams(gamma=0.1, kappa=1.5, sigma=0.002, qmax=100)
+    full = ReplayEngine(OrderBookL1(), AvellanedaStoikov(params))
+    full.run(cols)
+    sampled = ReplayEngine(OrderBookL1(), AvellanedaStoikov(params), record_every=3)
+    sampled.run(cols)
+
+    assert full.mids['ts'].tolist() == cols.ts.tolist()
+    assert sampled.midprices == full.midprices[::3]
+    quotes = full.quotes.to_pandas()
+    assert list(quotes.columns[:5]) == ['ts', 'bid', 'ask', 'mid', 'inventory']
+    assert [tuple(row) for row in quotes.iloc[:, :5].itertuples(index=False)] == full.quote_log
+    assert quotes['cash'].iloc[-1] == full.cash
@@ -121,3 +121,119 @@ assert ask_rec.price == 101,       "ask price should be 101"
 print("\n✅  All assertions passed – engine & book behave as expected.")
 
 
+
+
+# ---------- lockstep engine -----------------------------------------
+from lob_market_making_sim.core.engine import LockstepReplayEngine
+from lob_market_making_sim.models.avellaneda import ASParams, AvellanedaStoikov
+from lob_market_making_sim.evaluation.sweep import param_grid, summarize
+
+def _seeded_book():
+    book = OrderBookL1()
+    for ev in seed:
+        book.apply(ev)
+    return book
+
+def test_lockstep_matches_replay_engine():
+    '''
+    Several A-S agents replayed in lockstep end in the same state as
+    separate ReplayEngine runs, including partial fills and the
+    inventory guard (qmax=5).
+    '''
+    grid = param_grid(gamma=[0.01, 0.5], kappa=[0.5, 2.0], sigma=[0.002], qmax=[5, 100])
+    tape = [
+        OrderEvent(ts=3, etype=EventType.ADD, oid=3, direction=Direction.BUY, price=99.5, size=50),
+        OrderEvent(ts=4, etype=EventType.EXECUTE_VISIBLE, oid=2, direction=Direction.SELL, price=101, size=7),
+        OrderEvent(ts=5, etype=EventType.EXECUTE_VISIBLE, oid=1, direction=Direction.BUY, price=99, size=4),
+        OrderEvent(ts=6, etype=EventType.EXECUTE_VISIBLE, oid=1, direction=Direction.BUY, price=99, size=20),
+        OrderEvent(ts=7, etype=EventType.DELETE, oid=3, direction=Direction.BUY, price=99.5, size=50),
+        OrderEvent(ts=8, etype=EventType.EXECUTE_VISIBLE, oid=2, direction=Direction.SELL, price=101, size=30),
+    ]
+
+    lockstep = LockstepReplayEngine(_seeded_book(), grid)
+    lockstep.run(tape)
+
+    expected = []
+    for params in grid:
+        single = ReplayEngine(_seeded_book(), AvellanedaStoikov(params))
+        single.run(tape)
+        expected.append(summarize(single))
+
+    assert lockstep.results() == expected
+    assert any(r["filled_buy"] and r["filled_sell"] for r in expected) # quotes were hit
+
+def test_skip_unchanged_only_requotes_on_changes():
+    '''
+    Deep-level events leave the external top and the agent untouched,
+    so the quote path is skipped for them; fills still re-quote. With a
+    time-independent strategy the outcome is the same as quoting always.
+    '''
+    tape = [
+        OrderEvent(ts=3, etype=EventType.ADD, oid=3, direction=Direction.BUY, price=95, size=10),
+        OrderEvent(ts=4, etype=EventType.ADD, oid=4, direction=Direction.SELL, price=105, size=10),
+        OrderEvent(ts=5, etype=EventType.EXECUTE_VISIBLE, oid=1, direction=Direction.BUY, price=99, size=4),
+        OrderEvent(ts=6, etype=EventType.DELETE, oid=3, direction=Direction.BUY, price=95, size=10),
+        OrderEvent(ts=7, etype=EventType.EXECUTE_VISIBLE, oid=2, direction=Direction.SELL, price=101, size=6),
+    ]
+    always = ReplayEngine(_seeded_book(), StaticMM())
+    always.run(tape)
+    skipping = ReplayEngine(_seeded_book(), StaticMM(), skip_unchanged=True)
+    skipping.run(tape)
+
+    assert (skipping.num_quotes_processed, skipping.num_quotes_skipped) == (3, 2)
+    assert (always.num_quotes_processed, always.num_quotes_skipped) == (5, 0)
+    assert summarize(skipping) == summarize(always)
+    assert skipping.midprices == always.midprices
+
+def test_tick_mode_matches_dollar_mode():
+    '''
+    Replaying in integer ticks gives the same fills, cash and recorded
+    quotes as replaying in dollars, for a strategy quoting on the cent
+    grid (quote_ticks rounds dollar quotes to cents).
+    '''
+    from dataclasses import replace
+    import numpy as np
+    import pytest
+    from pathlib import Path
+    from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_columns
+    from lob_market_making_sim.io.schema import TICK_SIZE
+
+    class CentAS(AvellanedaStoikov):
+        def quote(self, mid, inv, t):
+            return tuple(None if p is None else round(p * 100) / 100
+                         for p in super().quote(mid, inv, t))
+
+    def in_ticks(ev):
+        return replace(ev, price=round(ev.price / TICK_SIZE))
+
+    def seeded_tick_book():
+        book = OrderBookL1(ticks=True)
+        for ev in seed:
+            book.apply(in_ticks(ev))
+        return book
+
+    tape = [
+        OrderEvent(ts=3, etype=EventType.EXECUTE_VISIBLE, oid=1, direction=Direction.BUY, price=99, size=5),
+        OrderEvent(ts=4, etype=EventType.EXECUTE_VISIBLE, oid=1, direction=Direction.BUY, price=99, size=5),
+        OrderEvent(ts=5, etype=EventType.EXECUTE_VISIBLE, oid=2, direction=Direction.SELL, price=101, size=5),
+        OrderEvent(ts=6, etype=EventType.EXECUTE_VISIBLE, oid=2, direction=Direction.SELL, price=101, size=5),
+    ]
+    dollars = ReplayEngine(_seeded_book(), StaticMM())
+    dollars.QUOTE_SIZE = 10
+    dollars.run(tape)
+    ticks = ReplayEngine(seeded_tick_book(), StaticMM())
+    ticks.QUOTE_SIZE = 10
+    ticks.run([in_ticks(ev) for ev in tape])
+    assert isinstance(ticks.cash, int)
+    assert summarize(ticks) == pytest.approx(summarize(dollars))
+    assert np.allclose(ticks.quote_log, dollars.quote_log)
+
+    cols = arrow_to_columns(lobster_to_arrow(Path(__file__).parent / "data" / "sample_messages_AMZN.csv"))
+    params = ASParams(gamma=0.1, kappa=1.5, sigma=0.002, qmax=100)
+    dollars = ReplayEngine(OrderBookL1(), CentAS(params))
+    dollars.run(cols)
+    ticks = ReplayEngine(OrderBookL1(ticks=True), AvellanedaStoikov(params))
+    ticks.run(cols)
+    assert summarize(ticks) == pytest.approx(summarize(dollars))
+    assert np.allclose(ticks.quote_log, dollars.quote_log)
+    assert ticks.midprices == pytest.approx(dollars.midprices)
@@ -0,0 +1,72 @@
+'''
+test_store.py
+ArrowStore writes the same rows whether it buffers everything until
+flush or streams them, keeps its row groups and buffer bounded, and
+partitions the output hive-style.
+
+To run: poetry run pytest tests/test_store.py
+'''
+
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+
+from lob_market_making_sim.io.cache import write_events_dataset
+from lob_market_making_sim.io.loader import lobster_to_arrow
+from lob_market_making_sim.io.schema import CACHE_SCHEMA
+from lob_market_making_sim.io.store import ArrowStore
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+SCHEMA = pa.schema([("ticker", pa.string()), ("x", pa.int64())])
+
+def _batch(ticker, start, n):
+    return pa.table({"ticker": [ticker] * n, "x": list(range(start, start + n))}, schema=SCHEMA)
+
+def test_flush_writes_one_file(tmp_path):
+    store = ArrowStore(SCHEMA)
+    with pytest.raises(RuntimeError):
+        store.flush(tmp_path / "empty.parquet")
+    with pytest.raises(ValueError):
+        store.add_batch(pa.table({"x": [1]}))
+
+    store.add_batch(_batch("A", 0, 5))
+    store.add_batch(_batch("B", 5, 5))
+    out = store.flush(tmp_path / "sub" / "all.parquet", compression=None)
+    assert pq.read_table(out).equals(pa.concat_tables([_batch("A", 0, 5), _batch("B", 5, 5)]))
+
+def test_streaming_row_groups_and_bounded_buffer(tmp_path):
+    path = tmp_path / "stream.parquet"
+    with ArrowStore(SCHEMA, path, row_group_size=10, max_buffer_rows=25,
+                    compression="zstd", use_dictionary=["ticker"]) as store:
+        for i in range(7):
+            store.add_batch(_batch("A", 7 * i, 7))
+            assert store._buffered < 10 # full row groups are written right away
+    meta = pq.ParquetFile(path).metadata
+    assert [meta.row_group(i).num_rows for i in range(meta.num_row_groups)] == [10, 10, 10, 10, 9]
+    assert pq.read_table(path)["x"].to_pylist() == list(range(49))
+
+def test_partitioned_output(tmp_path):
+    with ArrowStore(SCHEMA, tmp_path / "parts", partition_cols=["ticker"],
+                    row_group_size=4) as store:
+        store.add_batch(pa.concat_tables([_batch("A", 0, 3), _batch("B", 3, 2)]))
+        store.add_batch(_batch("A", 5, 3))
+    assert (tmp_path / "parts" / "ticker=A" / "part-0.parquet").exists()
+    # The partition column lives in the folder name only
+    assert pq.read_schema(tmp_path / "parts" / "ticker=B" / "part-0.parquet").names == ["x"]
+
+    dataset = ds.dataset(tmp_path / "parts", partitioning="hive")
+    assert dataset.to_table(filter=ds.field("ticker") == "A")["x"].to_pylist() == [0, 1, 2, 5, 6, 7]
+
+def test_events_dataset(tmp_path):
+    src = tmp_path / "AMZN_2012-06-21_34200000_57600000_message_1.csv"
+    src.write_bytes(FIXTURE.read_bytes())
+    root = write_events_dataset([src], tmp_path / "events")
+
+    part = root / "ticker=AMZN" / "date=2012-06-21" / "part-0.parquet"
+    table = pq.read_table(part)
+    assert table.schema.remove_metadata().equals(CACHE_SCHEMA)
+    assert table.num_rows == lobster_to_arrow(src).num_rows
@@ -0,0 +1,55 @@
+'''
+test_sweep.py
+The parallel sweep gives the same results as replaying each
+configuration directly.
+
+To run: poetry run pytest tests/test_sweep.py
+'''
+
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from lob_market_making_sim.core.engine import ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.evaluation.sweep import param_grid, run_sweep, summarize
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_events
+from lob_market_making_sim.models.avellaneda import AvellanedaStoikov
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+@pytest.mark.parametrize("lockstep", [True, False])
+def test_sweep_matches_serial_runs(tmp_path, lockstep):
+    src = tmp_path / "AMZN_2012-06-21_34200000_57600000_message_1.csv"
+    shutil.copy(FIXTURE, src)
+    grid = param_grid(gamma=[0.01, 0.1], kappa=[1.5], sigma=[0.002], qmax=[5, 100])
+
+    results = run_sweep([src], grid, max_workers=2, event_dir=tmp_path / "events",
+                        lockstep=lockstep)
+    assert len(results) == len(grid)
+    assert set(results["ticker"]) == {"AMZN"}
+
+    events = arrow_to_events(lobster_to_arrow(src))
+    for params, (_, row) in zip(grid, results.iterrows()):
+        engine = ReplayEngine(OrderBookL1(), AvellanedaStoikov(params))
+        engine.run(events)
+        expected = summarize(engine)
+        assert (row["gamma"], row["qmax"]) == (params.gamma, params.qmax)
+        assert {k: row[k] for k in expected} == expected
+
+def test_sweep_rebuilds_stale_event_files(tmp_path):
+    src = tmp_path / "AMZN_2012-06-21_34200000_57600000_message_1.csv"
+    shutil.copy(FIXTURE, src)
+    grid = param_grid(gamma=[0.1], kappa=[1.5], sigma=[0.002], qmax=[100])
+    first = run_sweep([src], grid, max_workers=1, event_dir=tmp_path / "events")
+    assert first["events"].tolist() == [8]
+
+    # Editing the message file invalidates its event file
+    with open(src, "a") as f:
+        f.write("0.009000,1,104,10,1832000,1\n")
+    mtime = src.stat().st_mtime_ns + 10**9
+    os.utime(src, ns=(mtime, mtime))
+    again = run_sweep([src], grid, max_workers=1, event_dir=tmp_path / "events")
+    assert again["events"].tolist() == [9]
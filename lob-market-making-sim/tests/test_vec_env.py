@@ -0,0 +1,48 @@
+'''
+test_vec_env.py
+The batched environment steps each sub-environment exactly like a
+standalone LOBMarketMakerEnv and resets finished ones in the same step.
+
+To run: poetry run pytest tests/test_vec_env.py
+'''
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from lob_market_making_sim.io.binary import write_event_file
+from lob_market_making_sim.io.loader import lobster_to_arrow, arrow_to_columns
+from lob_market_making_sim.models.rl.env import LOBMarketMakerEnv
+from lob_market_making_sim.models.rl.vec_env import LOBMarketMakerVecEnv
+
+FIXTURE = Path(__file__).parent / "data" / "sample_messages_AMZN.csv"
+
+@pytest.mark.parametrize("precompute_features", [False, True])
+def test_vec_env_matches_single_env(tmp_path, precompute_features):
+    table = lobster_to_arrow(FIXTURE)
+    event_path = write_event_file(table, tmp_path / "AMZN_2012-06-21.events.npy")
+    vec = LOBMarketMakerVecEnv([event_path], num_envs=3, precompute_features=precompute_features)
+    single = [LOBMarketMakerEnv(arrow_to_columns(table)) for _ in range(3)]
+
+    obs, _ = vec.reset(seed=0)
+    assert obs.shape == (3, 6)
+    for i, env in enumerate(single):
+        assert np.array_equal(obs[i], env.reset()[0])
+
+    rng = np.random.default_rng(1)
+    saw_reset = False
+    for _ in range(len(table) + 2):
+        actions = rng.integers(0, 49, size=3)
+        obs, rewards, terminated, truncated, infos = vec.step(actions)
+        for i, env in enumerate(single):
+            s_obs, s_reward, s_term, s_trunc, _ = env.step(int(actions[i]))
+            assert rewards[i] == s_reward
+            assert terminated[i] == s_term
+            if s_term or s_trunc:
+                assert infos["_final_obs"][i]
+                assert np.array_equal(infos["final_obs"][i], s_obs)
+                s_obs, _ = env.reset()
+                saw_reset = True
+            assert np.array_equal(obs[i], s_obs)
+    assert saw_reset
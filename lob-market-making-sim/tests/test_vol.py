@@ -4,7 +4,14 @@ test_vol.py
 
 import numpy as np
 import pytest
-from lob_market_making_sim.evaluation.vol import ewma_sigma
+from lob_market_making_sim.evaluation.vol import (ewma_sigma, ewma_sigma_batch, ewma_variance_path,
+                                                  EWMAVolEstimator)
+from lob_market_making_sim.core.engine import ReplayEngine
+from lob_market_making_sim.core.order_book import OrderBookL1
+from lob_market_making_sim.io.schema import OrderEvent, EventType, Direction
+from lob_market_making_sim.models.avellaneda import (ASParams, AvellanedaStoikov,
+                                                     AdaptiveAvellanedaStoikov)
+
 
 def test_vol_constant_series():
     '''
@@ -13,6 +20,7 @@ def test_vol_constant_series():
     prices = np.full(100, 100.0) # list of 100 values, each of value 100.0
     assert ewma_sigma(prices) == pytest.approx(0.0, abs=1e-12) # asserts the values are equal, within a tolerance
 
+
 def test_vol_unknown_series():
     '''
     Ensures EWMA is the same as standard deviation when there is no decay.
@@ -20,4 +28,81 @@ def test_vol_unknown_series():
     prices = np.array([100.0, 101.0, 100]) # up one tick, down one tick
     sigma = ewma_sigma(prices, alpha=0, seconds_per_year = 1) # no annualization or decay
     expected = np.std(np.diff(np.log(prices)), ddof=0) # true standard deviation
-    assert sigma == pytest.approx(expected)
\ No newline at end of file
+    assert sigma == pytest.approx(expected)
+
+
+def _loop_variance(prices, alpha):
+    '''
+    Reference implementation: the plain EWMA recursion.
+    '''
+    var, path = 0.0, []
+    for ret in np.diff(np.log(prices)):
+        var = alpha * var + (1 - alpha) * ret**2
+        path.append(var)
+    return np.array(path)
+
+
+@pytest.mark.parametrize("alpha", [0.0, 0.5, 0.94, 0.999])
+def test_variance_path_matches_recursion(alpha):
+    '''
+    The vectorized path agrees with the loop, including across the
+    block boundaries used internally on long series.
+    '''
+    rng = np.random.default_rng(0)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, 20_000)))
+    path = ewma_variance_path(prices, alpha=alpha)
+    assert path == pytest.approx(_loop_variance(prices, alpha), rel=1e-9, abs=1e-18)
+    assert ewma_sigma(prices, alpha=alpha, seconds_per_year=1) == pytest.approx(np.sqrt(path[-1]))
+
+
+def test_batch_matches_single_series():
+    rng = np.random.default_rng(1)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, (5, 500)), axis=1))
+    sigmas = ewma_sigma_batch(prices)
+    assert sigmas.shape == (5,)
+    assert sigmas == pytest.approx([ewma_sigma(row) for row in prices])
+
+
+def test_online_estimator_matches_offline():
+    '''
+    Feeding prices one at a time gives the same sigma as ewma_sigma.
+    '''
+    rng = np.random.default_rng(2)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 1e-3, 1_000)))
+    est = EWMAVolEstimator(alpha=0.9)
+    assert not est.ready
+    for p in prices:
+        est.update(p)
+    assert est.ready and est.num_returns == len(prices) - 1
+    assert est.sigma == pytest.approx(ewma_sigma(prices, alpha=0.9))
+
+
+def test_engine_feeds_adaptive_strategy():
+    '''
+    ReplayEngine updates the estimator with every external midprice, and
+    the adaptive strategy widens its quotes once sigma is estimated.
+    '''
+    ob = OrderBookL1()
+    ob.apply(OrderEvent(ts=0, etype=EventType.ADD, oid=1, size=100,
+                        price=99.0, direction=Direction.BUY))
+    ob.apply(OrderEvent(ts=0, etype=EventType.ADD, oid=2, size=100,
+                        price=101.0, direction=Direction.SELL))
+
+    params = ASParams(gamma=0.1, kappa=1.5, sigma=0.0, qmax=100)
+    est = EWMAVolEstimator(alpha=0.5, seconds_per_year=1)
+    strat = AdaptiveAvellanedaStoikov(params, est)
+    engine = ReplayEngine(ob, strat, vol_estimator=est)
+
+    # No returns yet: falls back to params.sigma
+    assert strat.quote(100.0, 0, 0.0) == AvellanedaStoikov(params).quote(100.0, 0, 0.0)
+
+    # Move the external bid, which changes the external midprice
+    engine.run([OrderEvent(ts=1, etype=EventType.ADD, oid=3, size=100,
+                           price=99.5, direction=Direction.BUY),
+                OrderEvent(ts=2, etype=EventType.DELETE, oid=3, size=100,
+                           price=99.5, direction=Direction.BUY)])
+    assert est.num_returns == 1 and est.sigma > 0
+
+    bid, ask = strat.quote(100.0, 0, 0.0)
+    base_bid, base_ask = AvellanedaStoikov(params).quote(100.0, 0, 0.0)
+    assert ask - bid > base_ask - base_bid